@@ -1,20 +1,72 @@
+import argparse
 import uvicorn
 import logging
 
 # Import HOST and PORT from config (will be defined there)
-from .config import HOST, PORT
-
-# Temporary values until config is implemented
-# TEMP_HOST = "0.0.0.0"
-# TEMP_PORT = 8011  # Default port for Processor A
+from .config import (
+    HOST,
+    PORT,
+    CACHE_DIR,
+    INDEX_DIR,
+    INDEX_MESSAGE_PREVIEW_CHARS,
+    TOKENIZER_CONFIG,
+)
 
 logger = logging.getLogger(__name__)
 
-logger.info(f"Processor A node starting on {HOST}:{PORT}")
-uvicorn.run(
-    "processor_a_node.server:app",  # Adjust app path
-    host=HOST,
-    port=PORT,
-    log_config=None,
-    reload=False,  # Enable reload for development
-)
+
+def serve():
+    logger.info(f"Processor A node starting on {HOST}:{PORT}")
+    uvicorn.run(
+        "processor_a_node.server:app",  # Adjust app path
+        host=HOST,
+        port=PORT,
+        log_config=None,
+        reload=False,  # Enable reload for development
+    )
+
+
+def rebuild(workers: int | None, chunk_size: int):
+    # Offline rebuild: no KOI-net node is started, only the index and its store
+    from .rebuild import rebuild_from_cache
+    from .store import IndexStore
+    from .tokenizer import Tokenizer
+
+    store = IndexStore(
+        INDEX_DIR,
+        tokenizer=Tokenizer.from_config(TOKENIZER_CONFIG),
+        message_preview_chars=INDEX_MESSAGE_PREVIEW_CHARS,
+    )
+    index = store.load(CACHE_DIR)
+    progress = rebuild_from_cache(
+        index, store, CACHE_DIR, workers=workers, chunk_size=chunk_size
+    )
+    store.close(index)
+    if progress.state != "finished":
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="processor_a_node")
+    subcommands = parser.add_subparsers(dest="command")
+    subcommands.add_parser("serve", help="Run the Processor A node (default)")
+    rebuild_parser = subcommands.add_parser(
+        "rebuild",
+        help="Rebuild the search index from the local RID cache (stop the node first)",
+    )
+    rebuild_parser.add_argument(
+        "--workers", type=int, default=None, help="Worker processes (default: CPU count)"
+    )
+    rebuild_parser.add_argument(
+        "--chunk-size", type=int, default=1000, help="Cache files per worker task"
+    )
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rebuild(args.workers, args.chunk_size)
+    else:
+        serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -80,6 +80,32 @@ COORDINATOR_URL = EDGES_CONFIG.get("coordinator_url")  # Should be defined in ya
 # Optional specific sensor RID
 GITHUB_SENSOR_RID: str | None = PROCESSOR_A_CONFIG.get("github_sensor_rid")
 
+# Search result limits (default page size and hard upper bound for ?limit=)
+SEARCH_DEFAULT_LIMIT: int = PROCESSOR_A_CONFIG.get("search_default_limit", 20)
+SEARCH_MAX_LIMIT: int = PROCESSOR_A_CONFIG.get("search_max_limit", 500)
+# Characters of commit message returned as match_context per hit
+SEARCH_CONTEXT_CHARS: int = PROCESSOR_A_CONFIG.get("search_context_chars", 100)
+# Query results kept in the LRU result cache (0 disables caching)
+SEARCH_CACHE_SIZE: int = PROCESSOR_A_CONFIG.get("search_cache_size", 1024)
+# Most queries accepted by one POST /search/batch request
+SEARCH_BATCH_MAX_QUERIES: int = PROCESSOR_A_CONFIG.get("search_batch_max_queries", 1000)
+# Values returned per author/committer facet of a search response
+SEARCH_FACET_LIMIT: int = PROCESSOR_A_CONFIG.get("search_facet_limit", 10)
+
+# Commit bundles are fetched in batches: a batch is sent this many seconds after
+# its first RID was queued, or as soon as it holds bundle_fetch_batch_size RIDs
+BUNDLE_FETCH_WINDOW_SECONDS: float = PROCESSOR_A_CONFIG.get("bundle_fetch_window_seconds", 0.05)
+BUNDLE_FETCH_BATCH_SIZE: int = PROCESSOR_A_CONFIG.get("bundle_fetch_batch_size", 100)
+# Batches fetched concurrently (over one pooled connection set per peer), and
+# fetched bundles buffered for the indexer before fetching pauses (as many
+# announced RIDs may be pending before the manifest handler blocks)
+BUNDLE_FETCH_CONCURRENCY: int = PROCESSOR_A_CONFIG.get("bundle_fetch_concurrency", 4)
+BUNDLE_QUEUE_SIZE: int = PROCESSOR_A_CONFIG.get("bundle_queue_size", 1000)
+
+# Tokenizer pipeline stages (see tokenizer.Tokenizer); changing them re-indexes
+# the commit log on the next start
+TOKENIZER_CONFIG: Dict[str, Any] = PROCESSOR_A_CONFIG.get("tokenizer", {})
+
 # Determine Cache Dir
 # Prioritize environment variable, then YAML, then fallback
 env_cache_dir = os.getenv("RID_CACHE_DIR")
@@ -103,6 +129,21 @@ else:
 # Ensure the resolved CACHE_DIR exists
 Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
 
+# Persistent search index (commit log + checkpoints); lives on the state volume in Docker
+INDEX_DIR: str = PROCESSOR_A_CONFIG.get("index_dir", str(LOCAL_DATA_BASE / "index"))
+# Checkpoint the in-memory index after this many updates or seconds, whichever comes first
+INDEX_CHECKPOINT_EVERY: int = PROCESSOR_A_CONFIG.get("index_checkpoint_every", 5000)
+INDEX_CHECKPOINT_SECONDS: float = PROCESSOR_A_CONFIG.get(
+    "index_checkpoint_seconds", 300
+)
+# Indexed commits are applied in batches of up to this many, each within this
+# many seconds of its first commit arriving (how soon a live commit is searchable)
+INDEX_BATCH_SIZE: int = PROCESSOR_A_CONFIG.get("index_batch_size", 500)
+INDEX_BATCH_MAX_SECONDS: float = PROCESSOR_A_CONFIG.get("index_batch_max_seconds", 0.25)
+# Leading characters of each commit message kept in memory (the rest is read
+# from the memory-mapped message log); 0 keeps none
+INDEX_MESSAGE_PREVIEW_CHARS: int = PROCESSOR_A_CONFIG.get("index_message_preview_chars", 128)
+
 # --- Update Logging Level Based on Config ---
 try:
     logging.getLogger().setLevel(LOG_LEVEL.upper())
@@ -124,8 +165,24 @@ logger.info(f"  Runtime Base URL: {BASE_URL}")
 logger.info(f"  Runtime Host: {HOST}")
 logger.info(f"  Runtime Port: {PORT}")
 logger.info(f"  Cache Dir: {CACHE_DIR}")
+logger.info(f"  Index Dir: {INDEX_DIR}")
+logger.info(
+    f"  Index Checkpoint: every {INDEX_CHECKPOINT_EVERY} updates / {INDEX_CHECKPOINT_SECONDS}s"
+)
+logger.info(f"  Index Batches: up to {INDEX_BATCH_SIZE} commits / {INDEX_BATCH_MAX_SECONDS}s")
+logger.info(f"  Index Message Preview Chars: {INDEX_MESSAGE_PREVIEW_CHARS}")
 logger.info(f"  Coordinator URL: {COORDINATOR_URL}")
 logger.info(f"  Specific GitHub Sensor RID: {GITHUB_SENSOR_RID or 'Not Set'}")
+logger.info(f"  Search Limit (default/max): {SEARCH_DEFAULT_LIMIT}/{SEARCH_MAX_LIMIT}")
+logger.info(f"  Search Context Chars: {SEARCH_CONTEXT_CHARS}")
+logger.info(f"  Search Batch Max Queries: {SEARCH_BATCH_MAX_QUERIES}")
+logger.info(f"  Search Cache Size: {SEARCH_CACHE_SIZE}")
+logger.info(f"  Search Facet Limit: {SEARCH_FACET_LIMIT}")
+logger.info(
+    f"  Bundle Fetch Batches: up to {BUNDLE_FETCH_BATCH_SIZE} RIDs / {BUNDLE_FETCH_WINDOW_SECONDS}s, "
+    f"{BUNDLE_FETCH_CONCURRENCY} concurrent, queue of {BUNDLE_QUEUE_SIZE} bundles"
+)
+logger.info(f"  Tokenizer: {TOKENIZER_CONFIG or 'defaults'}")
 
 # Check required config
 if not BASE_URL:
@@ -0,0 +1,142 @@
+import re
+from datetime import datetime, timezone
+
+# Commit bundle fields (see github_sensor_node backfill/webhook) kept by the index
+COMMIT_METADATA_FIELDS = (
+    "author_name",
+    "author_email",
+    "author_date",
+    "committer_name",
+    "committer_email",
+)
+
+# "author:alice", "committer:\"Jane Doe\"", "after:2025-01-01", "before:2025-03-01"
+_FILTER_RE = re.compile(
+    r'(?<!\S)(author|committer|after|before):("[^"]*"|\S+)', re.IGNORECASE
+)
+_WORD_RE = re.compile(r"\w+")
+
+
+def commit_metadata(contents: dict) -> dict:
+    """
+    Picks the indexed metadata fields out of a commit bundle's contents,
+    plus its parent SHAs (for the commit graph).
+    """
+    metadata = {
+        field: contents[field] for field in COMMIT_METADATA_FIELDS if contents.get(field)
+    }
+    # Kept even when empty: a root commit has no parents
+    metadata["parents"] = parent_shas(contents.get("parents"))
+    return metadata
+
+
+def parent_shas(parents: list | None) -> list[str]:
+    """Parent SHAs of a commit bundle: plain SHAs, or {"sha": ...} objects as in GitHub's API."""
+    shas = []
+    for parent in parents or []:
+        sha = parent.get("sha") if isinstance(parent, dict) else parent
+        if isinstance(sha, str):
+            shas.append(sha.lower())
+    return shas
+
+
+def parse_timestamp(value: str | None) -> int | None:
+    """
+    Converts an ISO 8601 date or datetime to epoch seconds (UTC when no
+    offset is given). Returns None for a missing or unparsable value.
+    """
+    if not value:
+        return None
+    try:
+        # Python 3.10's fromisoformat does not accept a "Z" suffix
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def person_label(name: str, email: str) -> str:
+    """Display form of an author or committer: "Name <email>"."""
+    if name and email:
+        return f"{name} <{email}>"
+    return name or email
+
+
+def person_keys(name: str, email: str) -> set[str]:
+    """
+    Lowercased values an author:/committer: filter matches a person by: the
+    full name, each word of it, the email address and its local part.
+    """
+    keys = set()
+    if name:
+        keys.add(name.lower())
+        keys.update(_WORD_RE.findall(name.lower()))
+    if email:
+        keys.add(email.lower())
+        keys.add(email.lower().split("@", 1)[0])
+    keys.discard("")
+    return keys
+
+
+class QueryFilters:
+    """
+    Metadata filters of a search query.
+
+    Several author: (or committer:) values match any of them; after: is
+    inclusive and before: exclusive, both on the author date.
+    """
+
+    def __init__(
+        self,
+        authors: list[str] | None = None,
+        committers: list[str] | None = None,
+        after: int | None = None,
+        before: int | None = None,
+    ):
+        self.authors = authors or []
+        self.committers = committers or []
+        self.after = after
+        self.before = before
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.authors or self.committers or self.after is not None or self.before is not None
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"QueryFilters(authors={self.authors!r}, committers={self.committers!r}, "
+            f"after={self.after!r}, before={self.before!r})"
+        )
+
+
+def parse_query(query: str) -> tuple[str, QueryFilters]:
+    """
+    Splits author:/committer:/after:/before: filters off a query.
+
+    Returns:
+        (remaining query text, QueryFilters)
+
+    Raises:
+        ValueError: If an after:/before: value is not an ISO 8601 date.
+    """
+    filters = QueryFilters()
+
+    def take(match: re.Match) -> str:
+        key = match.group(1).lower()
+        value = match.group(2).strip('"').strip()
+        if key == "author":
+            filters.authors.append(value.lower())
+        elif key == "committer":
+            filters.committers.append(value.lower())
+        else:
+            timestamp = parse_timestamp(value)
+            if timestamp is None:
+                raise ValueError(f"Invalid date for {key}: {value!r} (expected YYYY-MM-DD)")
+            setattr(filters, key, timestamp)
+        return ""
+
+    text = _FILTER_RE.sub(take, query)
+    return " ".join(text.split()), filters
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable
+
+import httpx
+from koi_net.processor import ProcessorInterface
+from koi_net.protocol.api_models import BundlesPayload, FetchBundles
+from koi_net.protocol.consts import FETCH_BUNDLES_PATH
+from rid_lib import RID
+from rid_lib.ext import Bundle
+
+logger = logging.getLogger(__name__)
+
+
+class BundlePrefetcher:
+    """
+    Fetches the bundles of announced commits ahead of the indexer.
+
+    A pipeline of three stages running on an asyncio loop in a background
+    thread (started by the first submit()):
+
+    - Coalescing: RIDs submitted by the manifest handler are collected for
+      up to window seconds after the first one arrives, or until batch_size
+      are pending.
+    - Prefetch: each batch is one fetch_bundles request to the state
+      providers of its RID type (the peers processor.network.fetch_remote_bundle
+      asks one RID at a time); RIDs a peer did not return are asked of the
+      next one. At most concurrency batches are in flight, over one pooled
+      HTTP client per peer, so connections are reused across batches.
+    - Indexing: fetched bundles go into a queue of at most queue_size
+      bundles, drained in order by on_bundle (called in a worker thread).
+
+    When the indexer falls behind the queue fills up, fetches wait for room
+    and then hold their slots, and new RIDs accumulate as pending RIDs; once
+    queue_size RIDs are pending, submit() blocks until the dispatcher takes
+    a batch. Memory stays bounded however fast the sensor announces, and the
+    backpressure reaches the caller (the manifest handler).
+    """
+
+    def __init__(
+        self,
+        processor: ProcessorInterface,
+        on_bundle: Callable[[Bundle], None],
+        window: float = 0.05,
+        batch_size: int = 100,
+        concurrency: int = 4,
+        queue_size: int = 1000,
+        timeout: float = 30.0,
+    ):
+        self.processor = processor
+        self.on_bundle = on_bundle
+        self.window = window
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.timeout = timeout
+        self.batches = 0
+        self.rids_requested = 0
+        self.bundles_fetched = 0
+        self.bundles_indexed = 0
+        self.rids_missing = 0
+        self.in_flight = 0
+        # submit() calls that had to wait for room among the pending RIDs
+        self.submits_blocked = 0
+        # Pending RIDs in arrival order (dict as an ordered set); guarded by _lock
+        self._pending: dict[RID, None] = {}
+        self._first_pending = 0.0
+        self._stopping = False
+        self._lock = threading.Lock()
+        # Notified whenever the dispatcher takes pending RIDs
+        self._room = threading.Condition(self._lock)
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+        # Created on the loop thread
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._bundles: asyncio.Queue | None = None
+        self._clients: dict[RID, httpx.AsyncClient] = {}
+
+    def submit(self, rid: RID) -> None:
+        """
+        Queues a RID whose bundle should be fetched and indexed. Blocks while
+        queue_size RIDs are already pending.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=asyncio.run, args=(self._main(),), name="bundle-prefetch", daemon=True
+                )
+                self._thread.start()
+            if rid not in self._pending and len(self._pending) >= self.queue_size:
+                self.submits_blocked += 1
+                self._room.wait_for(
+                    lambda: len(self._pending) < self.queue_size or self._stopping
+                )
+            if not self._pending:
+                self._first_pending = time.monotonic()
+            self._pending[rid] = None
+            count = len(self._pending)
+        if count == 1 or count >= self.batch_size:
+            self._ready.wait()
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stats(self) -> dict:
+        """Pipeline counters: batches sent, RIDs requested and missing, bundles fetched and indexed, backlog, blocked submits."""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "batches": self.batches,
+            "rids_requested": self.rids_requested,
+            "bundles_fetched": self.bundles_fetched,
+            "bundles_indexed": self.bundles_indexed,
+            "rids_missing": self.rids_missing,
+            "pending": pending,
+            "in_flight": self.in_flight,
+            "queued": self._bundles.qsize() if self._bundles else 0,
+            "submits_blocked": self.submits_blocked,
+        }
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Fetches and indexes whatever is still pending, then stops the pipeline."""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+            self._room.notify_all()
+        if thread is None:
+            return
+        self._ready.wait()
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+        thread.join(timeout)
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._bundles = asyncio.Queue(self.queue_size)
+        self._ready.set()
+        indexer = asyncio.create_task(self._index())
+        fetches: set[asyncio.Task] = set()
+        try:
+            await self._dispatch(fetches)
+            await asyncio.gather(*fetches)
+            await self._bundles.join()
+        finally:
+            indexer.cancel()
+            for client in self._clients.values():
+                await client.aclose()
+
+    async def _dispatch(self, fetches: set[asyncio.Task]) -> None:
+        """Coalescing stage: starts a fetch per batch, one per free slot, until stopped and drained."""
+        while True:
+            with self._lock:
+                count = len(self._pending)
+                due = self._first_pending + self.window
+                stopping = self._stopping
+            if not count and stopping:
+                return
+            # A submit() after this point sets the event again
+            self._wakeup.clear()
+            if not count:
+                await self._wakeup.wait()
+                continue
+            delay = due - time.monotonic()
+            if count < self.batch_size and delay > 0 and not stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._slots.acquire()
+            self.in_flight += 1
+            with self._lock:
+                rids = list(self._pending)[: self.batch_size]
+                for rid in rids:
+                    del self._pending[rid]
+                self._room.notify_all()
+                # The rest, if any, waited a full window already
+                self._first_pending = time.monotonic() - self.window
+            task = asyncio.create_task(self._fetch(rids))
+            fetches.add(task)
+            task.add_done_callback(fetches.discard)
+
+    async def _fetch(self, rids: list[RID]) -> None:
+        """Prefetch stage: requests one batch from each state provider in turn."""
+        fetched = 0
+        missing = 0
+        try:
+            by_type: dict[type, list[RID]] = {}
+            for rid in rids:
+                by_type.setdefault(type(rid), []).append(rid)
+            for rid_type, wanted in by_type.items():
+                remaining = dict.fromkeys(wanted)
+                for node_rid in self.processor.network.get_state_providers(rid_type):
+                    try:
+                        payload = await self._fetch_from(node_rid, list(remaining))
+                    except Exception as e:
+                        logger.warning(
+                            f"Failed to fetch {len(remaining)} bundle(s) from {node_rid}: {e}"
+                        )
+                        continue
+                    for bundle in payload.bundles:
+                        if bundle.rid not in remaining:
+                            continue
+                        del remaining[bundle.rid]
+                        # Waits while the indexer is a full queue behind
+                        await self._bundles.put(bundle)
+                        fetched += 1
+                    if not remaining:
+                        break
+                if remaining:
+                    logger.warning(
+                        f"No peer returned {len(remaining)} of {len(wanted)} requested bundle(s)"
+                    )
+                    missing += len(remaining)
+        except Exception as e:
+            logger.error(f"Bundle fetch of {len(rids)} RID(s) failed: {e}", exc_info=True)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+        self.batches += 1
+        self.rids_requested += len(rids)
+        self.bundles_fetched += fetched
+        self.rids_missing += missing
+        logger.debug(f"Fetched {fetched} of {len(rids)} bundle(s) in one batch")
+
+    async def _fetch_from(self, node_rid: RID, rids: list[RID]) -> BundlesPayload:
+        """One fetch_bundles request to a peer, over its pooled client."""
+        url = self.processor.network.request_handler.get_url(node_rid, None)
+        client = self._clients.get(node_rid)
+        if client is None:
+            client = self._clients[node_rid] = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency),
+            )
+        response = await client.post(
+            url + FETCH_BUNDLES_PATH, content=FetchBundles(rids=rids).model_dump_json()
+        )
+        response.raise_for_status()
+        payload = BundlesPayload.model_validate_json(response.text)
+        logger.info(f"Fetched {len(payload.bundles)} bundle(s) from {node_rid!r}")
+        return payload
+
+    async def _index(self) -> None:
+        """Indexing stage: hands queued bundles to on_bundle, in order, off the loop thread."""
+        while True:
+            bundles = [await self._bundles.get()]
+            while len(bundles) < self.batch_size and not self._bundles.empty():
+                bundles.append(self._bundles.get_nowait())
+            try:
+                await asyncio.to_thread(self._index_all, bundles)
+            finally:
+                for _ in bundles:
+                    self._bundles.task_done()
+
+    def _index_all(self, bundles: list[Bundle]) -> None:
+        for bundle in bundles:
+            try:
+                self.on_bundle(bundle)
+            except Exception as e:
+                logger.error(f"Failed to index fetched bundle {bundle.rid}: {e}", exc_info=True)
+            self.bundles_indexed += 1
@@ -0,0 +1,422 @@
+import copy
+import heapq
+import logging
+import threading
+from array import array
+
+import numpy as np
+
+from .index import SHA_BYTES, is_commit_sha
+
+logger = logging.getLogger(__name__)
+
+# Commits added since the last relabel are walked without reachability
+# labels; past this many (or 1/32 of the graph) the graph is relabeled
+RELABEL_MIN_UNLABELED = 4096
+
+# Paint flags of the commits_between walk
+_FROM_BASE = 1
+_FROM_HEAD = 2
+
+
+class CommitGraph:
+    """
+    Commit DAG of one repository, with integer node IDs.
+
+    Parent edges are stored CSR-style: the parents of node i are
+    _parents[_parent_start[i] : _parent_start[i] + _parent_count[i]], first
+    parent first. A parent referenced before its own bundle arrives gets a
+    placeholder node (no parents yet) whose edges are appended when the
+    bundle does. Child edges are the same CSR transposed.
+
+    Reachability labels let ancestry queries answer from a handful of nodes
+    instead of walking history:
+    - generation: 1 + the largest generation of the parents, so an ancestor
+      always has a smaller generation than its descendants;
+    - post: post-order rank in the first-parent tree, whose subtree is the
+      rank range [tree_low, post]. A commit in that range has the node on
+      its first-parent chain: a positive answer without a walk;
+    - [low, high]: the range of post ranks over all descendants. A
+      descendant's range lies within its ancestor's: a negative answer
+      (or a pruned branch) when it does not.
+
+    Labels are computed in one O(V + E) pass. A commit added on top of known
+    history (the usual webhook order) only gets its generation; the commits
+    added since the last pass are walked back to labeled ones at query time,
+    until there are enough of them to relabel. Filling in a placeholder can
+    change the labels of its descendants, so it marks the graph for
+    relabeling before the next query.
+
+    Queries and updates are serialized by an internal lock. Commits are
+    never removed: history is immutable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: dict[bytes, int] = {}
+        self._sha_bytes = bytearray()
+        self._known = bytearray()  # 1 once the commit's own bundle was added
+        self._parent_start = array("q")
+        self._parent_count = array("I")
+        self._parents = array("I")
+        self._generation = array("I")
+        # Labels and child edges of the nodes below _labeled
+        self._labeled = 0
+        self._stale = False
+        self._post = array("I")
+        self._tree_low = array("I")
+        self._low = array("I")
+        self._high = array("I")
+        self._child_offsets = array("q", [0])
+        self._children = array("I")
+
+    def __len__(self) -> int:
+        """Number of commits added (placeholders excluded)."""
+        with self._lock:
+            return self._known.count(1)
+
+    def __contains__(self, sha: str) -> bool:
+        return is_commit_sha(sha) and bytes.fromhex(sha) in self._ids
+
+    def __getstate__(self) -> dict:
+        # Copied under the lock: checkpoints pickle the graph while commits are added
+        with self._lock:
+            return {
+                name: copy.copy(value) for name, value in self.__dict__.items() if name != "_lock"
+            }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def node_count(self) -> int:
+        """Number of nodes, placeholders included."""
+        return len(self._ids)
+
+    def add(self, sha: str, parents: list[str]) -> bool:
+        """
+        Adds a commit and its parent edges. Parent SHAs that are not valid
+        commit SHAs are skipped. Returns False if the commit was already
+        added (a commit's parents never change).
+
+        Raises:
+            ValueError: If sha is not a 40-character hex commit SHA.
+        """
+        if not is_commit_sha(sha):
+            raise ValueError(f"Not a commit SHA: {sha!r}")
+        key = bytes.fromhex(sha)
+        parent_keys = [
+            parent_key
+            for parent_key in dict.fromkeys(bytes.fromhex(p) for p in parents if is_commit_sha(p))
+            if parent_key != key
+        ]
+        with self._lock:
+            placeholder = key in self._ids
+            node = self._node_for_write(key)
+            if self._known[node]:
+                return False
+            parent_ids = [self._node_for_write(parent_key) for parent_key in parent_keys]
+            self._known[node] = 1
+            if not parent_ids:
+                return True
+            self._parent_start[node] = len(self._parents)
+            self._parent_count[node] = len(parent_ids)
+            self._parents.extend(parent_ids)
+            self._generation[node] = 1 + max(self._generation[p] for p in parent_ids)
+            unlabeled = len(self._known) - self._labeled
+            if placeholder or unlabeled > max(RELABEL_MIN_UNLABELED, self._labeled // 32):
+                # Children of a placeholder already point at it: their labels may change
+                self._stale = True
+            return True
+
+    def merge(self, other: "CommitGraph") -> int:
+        """Adds every commit of other (e.g. built by a rebuild worker). Returns the number added."""
+        added = 0
+        for node in range(other.node_count):
+            if other._known[node]:
+                parents = [other._sha(p) for p in other._parent_ids(node)]
+                added += self.add(other._sha(node), parents)
+        return added
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        """
+        True if ancestor is reachable from descendant through parent edges
+        (a commit is its own ancestor, as in git merge-base --is-ancestor).
+
+        Raises:
+            KeyError: If either commit is not in the graph.
+        """
+        with self._lock:
+            self._ensure_labels()
+            return self._reaches(self._node(descendant), self._node(ancestor))
+
+    def commits_between(self, base: str, head: str, limit: int) -> tuple[list[str], bool]:
+        """
+        Commits reachable from head but not from base (git log base..head),
+        newest generation first.
+
+        Returns:
+            (up to limit SHAs, True if the range holds more commits)
+
+        Raises:
+            KeyError: If either commit is not in the graph.
+        """
+        with self._lock:
+            self._ensure_labels()
+            base_node, head_node = self._node(base), self._node(head)
+            if base_node == head_node:
+                return [], False
+            generation = self._generation
+            # Parents always come out of the queue after their children, so
+            # a node is popped once, with its final flags
+            flags = {head_node: _FROM_HEAD, base_node: _FROM_BASE}
+            queue = [(-generation[head_node], head_node), (-generation[base_node], base_node)]
+            heapq.heapify(queue)
+            pending = 1  # Queued nodes not known to be reachable from base
+            commits = []
+            while pending:
+                _, node = heapq.heappop(queue)
+                node_flags = flags[node]
+                if not node_flags & _FROM_BASE:
+                    pending -= 1
+                    if len(commits) == limit:
+                        return [self._sha(n) for n in commits], True
+                    commits.append(node)
+                for parent in self._parent_ids(node):
+                    parent_flags = flags.get(parent, 0)
+                    if parent_flags & _FROM_BASE or parent_flags == node_flags:
+                        continue
+                    flags[parent] = parent_flags | node_flags
+                    if not parent_flags:
+                        heapq.heappush(queue, (-generation[parent], parent))
+                        pending += not node_flags & _FROM_BASE
+                    else:
+                        # Queued from head, now also reachable from base
+                        pending -= 1
+            return [self._sha(n) for n in commits], False
+
+    def merge_bases(self, a: str, b: str) -> list[str]:
+        """
+        Best common ancestors of a and b (git merge-base --all): common
+        ancestors that are not ancestors of another common ancestor. Empty
+        for unrelated histories.
+
+        Raises:
+            KeyError: If either commit is not in the graph.
+        """
+        with self._lock:
+            self._ensure_labels()
+            node_a, node_b = self._node(a), self._node(b)
+            # Walk back from the older commit, which usually has fewer
+            # commits of its own, stopping at ancestors of the other one
+            if self._generation[node_a] > self._generation[node_b]:
+                node_a, node_b = node_b, node_a
+            candidates = []
+            seen = {node_a}
+            stack = [node_a]
+            while stack:
+                node = stack.pop()
+                if self._reaches(node_b, node):
+                    candidates.append(node)
+                    continue
+                for parent in self._parent_ids(node):
+                    if parent not in seen:
+                        seen.add(parent)
+                        stack.append(parent)
+            # One path may pass a common ancestor that another one skipped
+            bases = [
+                node
+                for node in candidates
+                if not any(other != node and self._reaches(other, node) for other in candidates)
+            ]
+            bases.sort(key=lambda node: -self._generation[node])
+            return [self._sha(node) for node in bases]
+
+    # --- Internals (callers hold _lock) ---
+
+    def _node(self, sha: str) -> int:
+        node = self._ids.get(bytes.fromhex(sha)) if is_commit_sha(sha) else None
+        if node is None:
+            raise KeyError(sha)
+        return node
+
+    def _node_for_write(self, key: bytes) -> int:
+        node = self._ids.get(key)
+        if node is None:
+            node = self._ids[key] = len(self._known)
+            self._sha_bytes += key
+            self._known.append(0)
+            self._parent_start.append(0)
+            self._parent_count.append(0)
+            self._generation.append(1)
+        return node
+
+    def _sha(self, node: int) -> str:
+        start = node * SHA_BYTES
+        return self._sha_bytes[start : start + SHA_BYTES].hex()
+
+    def _parent_ids(self, node: int) -> array:
+        start = self._parent_start[node]
+        return self._parents[start : start + self._parent_count[node]]
+
+    def _reaches(self, start: int, target: int) -> bool:
+        """Whether target is start or one of its ancestors."""
+        if start == target:
+            return True
+        generation = self._generation
+        target_generation = generation[target]
+        if generation[start] <= target_generation:
+            return False
+        labeled = self._labeled
+        if start < labeled:
+            # Labeled commits only have labeled ancestors
+            return target < labeled and self._reaches_labeled(start, target)
+
+        # Walk the commits added since the last relabel back to labeled ones
+        frontier = []
+        seen = {start}
+        stack = [start]
+        while stack:
+            for parent in self._parent_ids(stack.pop()):
+                if parent == target:
+                    return True
+                if parent in seen or generation[parent] <= target_generation:
+                    continue
+                seen.add(parent)
+                if parent < labeled:
+                    frontier.append(parent)
+                else:
+                    stack.append(parent)
+        return target < labeled and any(
+            self._reaches_labeled(node, target) for node in frontier
+        )
+
+    def _reaches_labeled(self, start: int, target: int) -> bool:
+        """_reaches for labeled nodes: searches forward from target for start."""
+        generation, post, tree_low = self._generation, self._post, self._tree_low
+        low, high = self._low, self._high
+        start_generation, start_post = generation[start], post[start]
+        start_low, start_high = low[start], high[start]
+
+        def may_reach(node: int) -> bool:
+            return (
+                generation[node] < start_generation
+                and low[node] <= start_low
+                and start_high <= high[node]
+            )
+
+        if tree_low[target] <= start_post <= post[target]:
+            return True
+        if not may_reach(target):
+            return False
+        offsets, children = self._child_offsets, self._children
+        seen = {target}
+        stack = [target]
+        while stack:
+            node = stack.pop()
+            for i in range(offsets[node], offsets[node + 1]):
+                child = children[i]
+                if child in seen:
+                    continue
+                # start lies on the first-parent chain of any commit here
+                if tree_low[child] <= start_post <= post[child]:
+                    return True
+                seen.add(child)
+                if may_reach(child):
+                    stack.append(child)
+        return False
+
+    def _ensure_labels(self) -> None:
+        if self._stale:
+            self._relabel()
+
+    def _relabel(self) -> None:
+        """Rebuilds the child edges and every node's labels."""
+        n = len(self._known)
+        counts = np.frombuffer(self._parent_count, dtype=np.uint32).astype(np.int64)
+        edge_child = np.repeat(np.arange(n, dtype=np.int64), counts)
+        # Position of each edge within its child's parent list (0: first parent)
+        edge_rank = np.arange(len(edge_child), dtype=np.int64) - np.repeat(
+            np.cumsum(counts) - counts, counts
+        )
+        starts = np.frombuffer(self._parent_start, dtype=np.int64)
+        parents = np.frombuffer(self._parents, dtype=np.uint32)
+        edge_parent = parents[np.repeat(starts, counts) + edge_rank].astype(np.int64)
+        del starts, parents  # Release the buffer exports so the arrays can grow again
+
+        def transposed(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            order = np.argsort(edge_parent[mask], kind="stable")
+            offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(edge_parent[mask], minlength=n), out=offsets[1:])
+            return offsets, edge_child[mask][order]
+
+        child_offsets, children = transposed(np.ones(len(edge_child), dtype=bool))
+        tree_offsets, tree_children = transposed(edge_rank == 0)
+        roots = np.flatnonzero(counts == 0).tolist()
+
+        # Post-order ranks of the first-parent forest; a subtree's ranks are contiguous
+        tree_offsets, tree_children = tree_offsets.tolist(), tree_children.tolist()
+        post, tree_low = [0] * n, [0] * n
+        visited = bytearray(n)
+        rank = 0
+        for root in roots + list(range(n)):
+            if visited[root]:
+                continue
+            visited[root] = 1
+            tree_low[root] = rank
+            stack = [[root, tree_offsets[root]]]
+            while stack:
+                frame = stack[-1]
+                node, i = frame
+                if i < tree_offsets[node + 1]:
+                    frame[1] = i + 1
+                    child = tree_children[i]
+                    if not visited[child]:
+                        visited[child] = 1
+                        tree_low[child] = rank
+                        stack.append([child, tree_offsets[child]])
+                    continue
+                stack.pop()
+                post[node] = rank
+                rank += 1
+
+        # Generations in topological order (Kahn), then descendant rank ranges in reverse
+        offsets, children = child_offsets.tolist(), children.tolist()
+        in_degree = counts.tolist()
+        generation = [1] * n
+        order = roots
+        for node in order:
+            next_generation = generation[node] + 1
+            for i in range(offsets[node], offsets[node + 1]):
+                child = children[i]
+                if generation[child] < next_generation:
+                    generation[child] = next_generation
+                in_degree[child] -= 1
+                if not in_degree[child]:
+                    order.append(child)
+        if len(order) < n:
+            logger.warning(
+                f"Commit graph has {n - len(order)} commits on parent cycles; "
+                "ancestry answers for them may be incomplete"
+            )
+        low, high = post[:], post[:]
+        for node in reversed(order):
+            node_low, node_high = low[node], high[node]
+            for i in range(offsets[node], offsets[node + 1]):
+                child = children[i]
+                if low[child] < node_low:
+                    node_low = low[child]
+                if high[child] > node_high:
+                    node_high = high[child]
+            low[node], high[node] = node_low, node_high
+
+        self._child_offsets = array("q", offsets)
+        self._children = array("I", children)
+        self._generation = array("I", generation)
+        self._post = array("I", post)
+        self._tree_low = array("I", tree_low)
+        self._low = array("I", low)
+        self._high = array("I", high)
+        self._labeled = n
+        self._stale = False
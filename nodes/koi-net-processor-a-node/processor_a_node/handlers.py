@@ -1,24 +1,73 @@
 import logging
+import re
+from collections.abc import Iterator
+from itertools import chain, islice
 
 from .core import node
 from koi_net.processor import ProcessorInterface
-from koi_net.processor.handler import HandlerType
-from koi_net.processor.knowledge_object import KnowledgeObject, KnowledgeSource
+from koi_net.processor.handler import HandlerType, STOP_CHAIN
+from koi_net.processor.knowledge_object import KnowledgeObject
 from koi_net.protocol.node import NodeProfile
 from koi_net.protocol.event import EventType
 from koi_net.protocol.edge import EdgeType
 from koi_net.protocol.helpers import generate_edge_bundle
+from rid_lib.ext import Bundle, Manifest
 from rid_lib.types import KoiNetNode, KoiNetEdge
 from rid_types.github import GithubCommit
 
 # Import config to potentially check for specific sensor RID
-from .config import GITHUB_SENSOR_RID
+from .config import (
+    CACHE_DIR,
+    GITHUB_SENSOR_RID,
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_CONTEXT_CHARS,
+    SEARCH_CACHE_SIZE,
+    SEARCH_FACET_LIMIT,
+    BUNDLE_FETCH_WINDOW_SECONDS,
+    BUNDLE_FETCH_BATCH_SIZE,
+    BUNDLE_FETCH_CONCURRENCY,
+    BUNDLE_QUEUE_SIZE,
+    INDEX_DIR,
+    INDEX_CHECKPOINT_EVERY,
+    INDEX_CHECKPOINT_SECONDS,
+    INDEX_MESSAGE_PREVIEW_CHARS,
+    INDEX_BATCH_SIZE,
+    INDEX_BATCH_MAX_SECONDS,
+    TOKENIZER_CONFIG,
+)
+from .cache import QueryCache
+from .facets import QueryFilters, commit_metadata, parse_query
+from .fetcher import BundlePrefetcher
+from .graph import CommitGraph
+from .index import is_commit_sha
+from .shards import ShardedSnapshot
+from .store import IndexStore, commit_rid
+from .tokenizer import Tokenizer
+from .writer import IndexWriter
 
 logger = logging.getLogger(__name__)
 
-# Simple in-memory index (as defined in Processor.md)
-# Structure: { sha: commit_message, keyword: [sha1, sha2, ...], ... }
-search_index = {}
+# In-memory inverted index, restored from the last on-disk checkpoint plus the
+# commit log written after it (see store.IndexStore)
+index_store = IndexStore(
+    INDEX_DIR,
+    checkpoint_every=INDEX_CHECKPOINT_EVERY,
+    checkpoint_seconds=INDEX_CHECKPOINT_SECONDS,
+    tokenizer=Tokenizer.from_config(TOKENIZER_CONFIG),
+    message_preview_chars=INDEX_MESSAGE_PREVIEW_CHARS,
+)
+search_index = index_store.load(CACHE_DIR)
+
+# Applies indexed commits in micro-batches (see writer.IndexWriter)
+index_writer = IndexWriter(
+    search_index,
+    index_store,
+    batch_size=INDEX_BATCH_SIZE,
+    max_latency=INDEX_BATCH_MAX_SECONDS,
+)
+
+# Recent query results, valid while the snapshot generation is unchanged
+query_cache = QueryCache(SEARCH_CACHE_SIZE)
 
 
 # --- Network Handlers ---
@@ -106,7 +155,11 @@ def handle_network_discovery(processor: ProcessorInterface, kobj: KnowledgeObjec
 
 @node.processor.register_handler(HandlerType.Manifest, rid_types=[GithubCommit])
 def handle_commit_manifest(processor: ProcessorInterface, kobj: KnowledgeObject):
-    """Handles incoming commit manifests, triggers bundle fetch for indexing."""
+    """
+    Handles incoming commit manifests. Manifests of commits already indexed
+    with the same hash stop here; the bundles of the others are fetched in
+    batches by bundle_prefetcher, which indexes them as they arrive.
+    """
     # Check if we can work with the RID
     try:
         rid = kobj.rid
@@ -122,15 +175,18 @@ def handle_commit_manifest(processor: ProcessorInterface, kobj: KnowledgeObject)
     manifest = kobj.manifest
     logger.info(f"Received manifest for commit: {rid.reference}")
 
-    # PRD: Optionally dereference bundles. For indexing, we need the content.
-    # Decision: Always dereference for this implementation.
-    logger.debug(f"Requesting bundle for {rid} for indexing.")
-    try:
-        processor.handle(
-            rid=rid, source=KnowledgeSource.External
-        )  # Trigger bundle fetch
-    except Exception as e:
-        logger.error(f"Error requesting bundle for {rid}: {e}", exc_info=True)
+    # Re-broadcasts, coordinator relays and sensor restarts resend manifests
+    # of commits we already indexed; only a changed hash is worth a download
+    if index_store.skip_unchanged(str(rid), manifest.sha256_hash):
+        logger.debug(f"Commit {rid} already indexed with hash {manifest.sha256_hash}; skipping bundle fetch.")
+        return STOP_CHAIN
+
+    if kobj.contents is not None:
+        return  # Bundle event: handle_commit_bundle indexes it
+    # Instead of the pipeline's own serial one-RID-per-request fetch
+    logger.debug(f"Queueing bundle fetch for {rid}.")
+    bundle_prefetcher.submit(rid)
+    return STOP_CHAIN
 
 
 # --- Bundle Handler ---
@@ -151,94 +207,429 @@ def handle_commit_bundle(processor: ProcessorInterface, kobj: KnowledgeObject):
         logger.warning(f"Error checking RID {kobj.rid}: {e}")
         return
 
-    if not kobj.contents or not isinstance(kobj.contents, dict):
-        logger.warning(f"Bundle for {kobj.rid} has no contents or invalid format.")
+    index_commit_bundle(rid, kobj.manifest, kobj.contents)
+
+
+def index_commit_bundle(
+    rid: GithubCommit, manifest: Manifest | None, contents: dict | None
+) -> None:
+    """Indexes the contents of a commit bundle (from the pipeline or bundle_prefetcher)."""
+    if not contents or not isinstance(contents, dict):
+        logger.warning(f"Bundle for {rid} has no contents or invalid format.")
         return
 
-    contents = kobj.contents
     sha = contents.get("sha")
     if not sha:
         logger.warning(
-            f"Commit bundle {kobj.rid} missing SHA in contents. Skipping index update."
+            f"Commit bundle {rid} missing SHA in contents. Skipping index update."
+        )
+        return
+    if not is_commit_sha(sha):
+        logger.warning(
+            f"Commit bundle {rid} has malformed SHA '{sha}'. Skipping index update."
         )
         return
 
-    logger.info(f"Processing bundle for commit: {sha[:7]}")
+    logger.debug(f"Queueing commit {sha[:7]} for indexing")
 
-    # --- Update Search Index (Example Implementation) ---
+    # --- Update Search Index ---
+    # index_writer applies commits in micro-batches: each batch extends the
+    # postings of its terms once per shard and publishes one new index
+    # snapshot (searches running meanwhile keep reading the previous one),
+    # and is appended to the durable commit log in one transaction
     message = contents.get("message", "")
+    manifest_hash = manifest.sha256_hash if manifest else None
+    index_writer.submit(str(rid), sha, message, manifest_hash, commit_metadata(contents))
+
+
+def index_fetched_bundle(bundle: Bundle) -> None:
+    """Indexing stage of bundle_prefetcher: caches a fetched commit bundle and indexes it."""
+    if not isinstance(bundle.rid, GithubCommit):
+        logger.warning(f"Prefetched bundle {bundle.rid} is not a commit. Skipping.")
+        return
+    node.cache.write(bundle)
+    index_commit_bundle(bundle.rid, bundle.manifest, bundle.contents)
 
-    # Clear old keyword associations for this SHA first if re-indexing
-    for keyword, sha_list in list(search_index.items()):
-        if isinstance(sha_list, list) and sha in sha_list:
-            search_index[keyword].remove(sha)
-            if not search_index[keyword]:  # Remove keyword if list becomes empty
-                del search_index[keyword]
-
-    # Index by full SHA
-    search_index[sha] = message
-
-    # Index by keywords (simple example)
-    # Consider stemming, stop words, etc. for a real implementation
-    keywords_processed = set()
-    for keyword in message.lower().split():
-        # Basic filtering: length > 3, alphanumeric, avoid duplicates per message
-        if len(keyword) > 3 and keyword.isalnum() and keyword not in keywords_processed:
-            if keyword not in search_index:
-                search_index[keyword] = []
-            # Add SHA to keyword list if not already present
-            if sha not in search_index[keyword]:
-                search_index[keyword].append(sha)
-            keywords_processed.add(keyword)
-
-    logger.debug(
-        f"Updated search index for SHA: {sha[:7]}. Index size (keys): {len(search_index)}"
-    )
+
+# Commit bundles announced by manifests are fetched in batches, several at a
+# time, into a bounded queue that index_fetched_bundle drains
+bundle_prefetcher = BundlePrefetcher(
+    node.processor,
+    index_fetched_bundle,
+    window=BUNDLE_FETCH_WINDOW_SECONDS,
+    batch_size=BUNDLE_FETCH_BATCH_SIZE,
+    concurrency=BUNDLE_FETCH_CONCURRENCY,
+    queue_size=BUNDLE_QUEUE_SIZE,
+)
 
 
 # --- Helper for Search Endpoint ---
-def query_search_index(query: str) -> list:
-    """Queries the in-memory search index."""
-    results = []
-    query_lower = query.lower()
+SEARCH_MODES = ("auto", "substring", "regex")
+
+
+def match_context(message: str, terms: list[str], width: int = SEARCH_CONTEXT_CHARS) -> str:
+    """Returns a window of the message around the first matched term."""
+    start = 0
+    if terms and len(message) > width:
+        message_lower = message.lower()
+        positions = [p for p in (message_lower.find(t) for t in terms) if p >= 0]
+        if positions:
+            start = max(0, min(positions) - width // 4)
+    snippet = message[start : start + width]
+    prefix = "..." if start > 0 else ""
+    suffix = "..." if start + width < len(message) else ""
+    return prefix + snippet + suffix
+
+
+def preview_context(
+    preview: str, terms: list[str], width: int = SEARCH_CONTEXT_CHARS
+) -> str | None:
+    """
+    match_context of a message that is longer than its inline preview,
+    computed from the preview alone, or None if that needs text past it.
+    """
+    start = 0
+    if terms:
+        positions = [p for p in (preview.lower().find(t) for t in terms) if p >= 0]
+        if not positions:
+            return None
+        first = min(positions)
+        # A term not found in the preview could still start before first
+        if first + max(len(t) for t in terms) > len(preview):
+            return None
+        start = max(0, first - width // 4)
+    if start + width > len(preview):
+        return None
+    return ("..." if start > 0 else "") + preview[start : start + width] + "..."
+
+
+def format_search_hit(
+    snapshot: ShardedSnapshot,
+    repo: str,
+    sha: str,
+    context_terms: list[str],
+    score: float | None = None,
+) -> dict:
+    """Builds one search result: full RID, repo, SHA, optional score and context."""
+    hit = {
+        "rid": commit_rid(repo, sha),
+        "repo": repo,
+        "sha": sha,
+    }
+    if score is not None:
+        hit["score"] = round(score, 4)
+    # Most contexts come from the in-memory preview without touching the message log
+    preview, complete = snapshot.get_preview(repo, sha) or ("", True)
+    context = None if complete else preview_context(preview, context_terms)
+    if context is None:
+        message = preview if complete else snapshot.get_message(repo, sha) or ""
+        context = match_context(message, context_terms)
+    hit["match_context"] = context
+    return hit
+
+
+def normalize_query(query: str, mode: str) -> str:
+    """Canonical form of a query, used as the result cache key."""
+    if mode == "regex":
+        return query  # Lowercasing would change classes like \S or \W
+    if mode == "substring":
+        return query.lower()
+    # Case is kept: the tokenizer splits "getUsers" and spots "JIRA-12" by it
+    return " ".join(query.split())
+
+
+def query_search_index(
+    query: str,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    mode: str = "auto",
+    cursor: str | None = None,
+    repos: list[str] | None = None,
+    snapshot: ShardedSnapshot | None = None,
+) -> tuple[list, str | None, dict | None]:
+    """
+    Cached front of search_commits: identical (normalized) queries are served
+    from query_cache until the index generation changes. The normalized form
+    is only the cache key; search_commits gets the query as typed, since the
+    tokenizer splits identifiers ("getUsers") and issue keys by case.
+    """
+    snapshot = snapshot or search_index.snapshot()
+    key = (
+        normalize_query(query, mode),
+        limit,
+        mode,
+        cursor,
+        tuple(sorted(set(repos))) if repos else None,
+    )
+    hit, value = query_cache.get(key, snapshot.generation)
+    if hit:
+        return value
+    value = search_commits(
+        query, limit=limit, mode=mode, cursor=cursor, repos=repos, snapshot=snapshot
+    )
+    query_cache.put(key, snapshot.generation, value)
+    return value
+
+
+def search_commits(
+    query: str,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    mode: str = "auto",
+    cursor: str | None = None,
+    repos: list[str] | None = None,
+    snapshot: ShardedSnapshot | None = None,
+) -> tuple[list, str | None, dict | None]:
+    """
+    Queries the in-memory search index, returning at most `limit` results.
+
+    Every step runs against one index snapshot (the latest one unless given),
+    so concurrent indexing never yields a half-updated or inconsistent result.
+
+    Modes:
+      - auto: SHA (full or partial) matches if any, otherwise keyword hits
+        ranked by BM25 (paginated via cursor), falling back to substring
+        matches when no keyword matches
+      - substring: case-insensitive substring of the commit message
+      - regex: case-insensitive regex over the commit message (raises re.error)
+
+    repos ("owner/repo" names) restricts the search to those repository
+    shards; None searches every repository. Each hit carries the full
+    GithubCommit RID.
+
+    In auto and substring mode the query may carry author:, committer:,
+    after: and before: filters (see facets.parse_query), resolved through the
+    index's secondary indexes. A query made only of filters lists the
+    matching commits, newest first.
+
+    Returns:
+        (results, next_cursor, facets); next_cursor is None on the last page.
+        facets (author/committer/month counts over every match) is set for
+        ranked keyword or filter results, otherwise None.
+
+    Raises:
+        ValueError: If the cursor or a date filter is malformed.
+    """
+    snapshot = snapshot or search_index.snapshot()
+    if mode == "regex":
+        text, filters = query, QueryFilters()
+    else:
+        text, filters = parse_query(query)
+    terms = search_index.tokenizer.tokenize(text)
+    # Raw query words first: stems and structured terms ("type:fix") may not
+    # occur verbatim in the message
+    context_terms = text.lower().split() + terms
+
+    def format_hit(repo: str, sha: str, score: float | None = None) -> dict:
+        return format_search_hit(snapshot, repo, sha, context_terms, score)
+
+    if mode == "substring":
+        hits = snapshot.substring_search(text, limit, repos=repos, filters=filters)
+        return [format_hit(repo, sha) for repo, sha in hits], None, None
+    if mode == "regex":
+        hits = snapshot.regex_search(query, limit, repos=repos)
+        return [format_hit(repo, sha) for repo, sha in hits], None, None
 
     # 1. Check if query is a SHA (full or partial >= 7 chars)
-    if len(query) >= 7:
-        # Check full SHA match
-        if query in search_index and isinstance(search_index[query], str):
-            # Need owner/repo to construct full RID - requires better index storage
-            # For now, return SHA and message
-            results.append(
-                {
-                    "sha": query,
-                    "match_context": search_index[query][:100]
-                    + "...",  # Truncate message
-                }
+    if len(text) >= 7 and not cursor and not filters:
+        # Exact SHA match takes precedence (one hit per repository containing it)
+        exact_hits = snapshot.find(text, repos=repos)
+        if exact_hits:
+            return [format_hit(repo, sha) for repo, sha in exact_hits[:limit]], None, None
+
+        # Check partial SHA match (bisect range over each shard's sorted SHA array)
+        prefix_hits = snapshot.prefix_lookup(text, limit=limit, repos=repos)
+        if prefix_hits:
+            return [format_hit(repo, sha) for repo, sha in prefix_hits], None, None
+
+    # 2. Keyword search, ranked with BM25 (top-k selection, cursor pagination)
+    hits, next_cursor = snapshot.rank(
+        terms, limit=limit, cursor=cursor, repos=repos, filters=filters
+    )
+    if hits or cursor:
+        facets = snapshot.facets(terms, SEARCH_FACET_LIMIT, repos=repos, filters=filters)
+        # Without terms, hits are ordered by date and have no relevance score
+        results = [
+            format_hit(repo, sha, score if terms else None) for repo, sha, score in hits
+        ]
+        return results, next_cursor, facets
+
+    # 3. Search within commit messages (trigram candidates, then verified)
+    if len(text) >= 3:
+        hits = snapshot.substring_search(text, limit, repos=repos, filters=filters)
+        return [format_hit(repo, sha) for repo, sha in hits], None, None
+    return [], None, None
+
+
+def stream_commits(
+    query: str,
+    limit: int | None = None,
+    mode: str = "auto",
+    cursor: str | None = None,
+    repos: list[str] | None = None,
+) -> Iterator[dict]:
+    """
+    search_commits for large result sets: yields every hit (at most limit,
+    when given) in the same order, formatting each one only when it is
+    consumed. Ranked hits come from a single scoring pass and substring or
+    regex matches are verified lazily, so no result list is built however
+    many commits match. A cursor resumes a ranked search; facets and next
+    cursors are not produced.
+
+    Query errors are raised by this call, before the first hit.
+
+    Raises:
+        ValueError: If the cursor or a date filter is malformed.
+        re.error: If a regex does not compile.
+    """
+    snapshot = search_index.snapshot()
+    if mode == "regex":
+        text, filters = query, QueryFilters()
+    else:
+        text, filters = parse_query(query)
+    terms = search_index.tokenizer.tokenize(text)
+    context_terms = text.lower().split() + terms
+
+    if mode == "substring":
+        hits = snapshot.iter_substring(text, repos=repos, filters=filters)
+    elif mode == "regex":
+        hits = snapshot.iter_regex(query, repos=repos)
+    else:
+        hits = []
+        if len(text) >= 7 and not cursor and not filters:
+            hits = snapshot.find(text, repos=repos) or snapshot.prefix_lookup(text, repos=repos)
+        if not hits:
+            ranked = snapshot.iter_rank(terms, cursor=cursor, repos=repos, filters=filters)
+            first = next(ranked, None)
+            if first is not None:
+                # Without terms, hits are ordered by date and have no relevance score
+                hits = (
+                    (repo, sha, score if terms else None)
+                    for repo, sha, score in chain([first], ranked)
+                )
+            elif len(text) >= 3 and not cursor:
+                hits = snapshot.iter_substring(text, repos=repos, filters=filters)
+
+    return (
+        format_search_hit(snapshot, hit[0], hit[1], context_terms, *hit[2:])
+        for hit in islice(hits, limit)
+    )
+
+
+def query_search_batch(
+    queries: list[str],
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    mode: str = "auto",
+    repos: list[str] | None = None,
+) -> list[dict]:
+    """
+    Runs many queries against the index in one call.
+
+    In auto mode, all full-SHA queries are resolved together with a single
+    pass over each shard's sorted SHA array; every other query goes through
+    query_search_index. A failing query (e.g. an invalid regex) reports its
+    error without failing the batch. The whole batch reads one index snapshot.
+
+    Returns:
+        One {"query", "results", "next_cursor", "facets"} (or {"query",
+        "error"}) entry per query, in request order.
+    """
+    snapshot = search_index.snapshot()
+    exact = {}
+    if mode == "auto":
+        exact = snapshot.find_many(
+            [q for q in queries if is_commit_sha(q)], repos=repos
+        )
+
+    responses = []
+    for query in queries:
+        hits = exact.get(query)
+        if hits:
+            results = [
+                format_search_hit(snapshot, repo, sha, []) for repo, sha in hits[:limit]
+            ]
+            responses.append(
+                {"query": query, "results": results, "next_cursor": None, "facets": None}
             )
-            return results  # Exact SHA match takes precedence
-
-        # Check partial SHA match (less efficient)
-        for sha_key, msg in search_index.items():
-            # Ensure it's a SHA key (check length or type if index structure is mixed)
-            if isinstance(msg, str) and sha_key.startswith(query):
-                results.append({"sha": sha_key, "match_context": msg[:100] + "..."})
-                # Optionally break after first partial match or collect all
-
-    # 2. Check if query is a keyword
-    if query_lower in search_index and isinstance(search_index[query_lower], list):
-        for sha in search_index[query_lower]:
-            # Avoid adding duplicates if already found via partial SHA match
-            if not any(r["sha"] == sha for r in results):
-                message = search_index.get(sha, "")  # Get message associated with SHA
-                results.append({"sha": sha, "match_context": message[:100] + "..."})
-
-    # 3. (Optional) Search within commit messages (less efficient)
-    # for sha, message in search_index.items():
-    #     if isinstance(message, str) and query_lower in message.lower():
-    #         # Add logic to avoid duplicates
-    #         results.append(...)
-
-    return results
+            continue
+        try:
+            results, next_cursor, facets = query_search_index(
+                query, limit=limit, mode=mode, repos=repos, snapshot=snapshot
+            )
+        except (re.error, ValueError) as e:
+            responses.append({"query": query, "error": str(e)})
+            continue
+        responses.append(
+            {
+                "query": query,
+                "results": results,
+                "next_cursor": next_cursor,
+                "facets": facets,
+            }
+        )
+    return responses
+
+
+# --- Commit Graph Queries ---
+
+
+def commit_graph(repo: str, *shas: str) -> CommitGraph:
+    """
+    The commit graph of repo, checked to contain every given commit.
+
+    Raises:
+        ValueError: If a SHA is not a 40-character hex commit SHA.
+        KeyError: If repo has no indexed commits or a commit is not in its graph.
+    """
+    for sha in shas:
+        if not is_commit_sha(sha):
+            raise ValueError(f"Not a commit SHA: {sha!r}")
+    graph = search_index.graph(repo)
+    if graph is None:
+        raise KeyError(f"No commits indexed for repository {repo}")
+    for sha in shas:
+        if sha not in graph:
+            raise KeyError(f"Commit {sha} is not in the commit graph of {repo}")
+    return graph
+
+
+def query_is_ancestor(repo: str, ancestor: str, descendants: list[str]) -> dict[str, bool]:
+    """
+    Which of descendants (e.g. release commits) contain ancestor (e.g. a fix).
+
+    Raises:
+        ValueError: If a SHA is malformed.
+        KeyError: If a commit is not in the repository's commit graph.
+    """
+    graph = commit_graph(repo, ancestor, *descendants)
+    return {sha: graph.is_ancestor(ancestor, sha) for sha in descendants}
+
+
+def query_commits_between(
+    repo: str, base: str, head: str, limit: int = SEARCH_DEFAULT_LIMIT
+) -> tuple[list[dict], bool]:
+    """
+    Commits reachable from head but not from base (git log base..head).
+
+    Returns:
+        (up to limit {"rid", "sha"} entries, newest first; True if truncated)
+
+    Raises:
+        ValueError: If a SHA is malformed.
+        KeyError: If a commit is not in the repository's commit graph.
+    """
+    shas, truncated = commit_graph(repo, base, head).commits_between(base, head, limit)
+    commits = [{"rid": commit_rid(repo, sha), "sha": sha} for sha in shas]
+    return commits, truncated
+
+
+def query_merge_bases(repo: str, a: str, b: str) -> list[str]:
+    """
+    Best common ancestors of two commits (git merge-base --all).
+
+    Raises:
+        ValueError: If a SHA is malformed.
+        KeyError: If a commit is not in the repository's commit graph.
+    """
+    return commit_graph(repo, a, b).merge_bases(a, b)
 
 
 logger.info("Processor A handlers registered.")
@@ -0,0 +1,1193 @@
+import base64
+import bisect
+import logging
+import math
+import re
+from array import array
+from collections import Counter
+from collections.abc import Iterator
+from itertools import islice
+
+import numpy as np
+
+# The stdlib's regex parser (private, CPython) is only used to narrow regex
+# searches with the trigram index; without it every message is checked
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    try:
+        import sre_parse
+    except ImportError:
+        sre_parse = None
+
+from .facets import QueryFilters, parse_timestamp, person_keys, person_label
+from .messages import MessageStore
+from .tokenizer import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+SHA_BYTES = 20  # binary size of a SHA-1 commit id
+_HEX_RE = re.compile(r"[0-9a-f]*")
+
+# Array typecodes for packed integers, smallest first
+_TYPECODES = ("B", "H", "I")
+_DTYPES = {"B": np.uint8, "H": np.uint16, "I": np.uint32}
+_LIMITS = {tc: 1 << (8 * array(tc).itemsize) for tc in _TYPECODES}
+
+# Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Recently inserted docs are kept in a small ordered run that is copied on
+# every insert; past this size it is merged into the large base run
+_DELTA_MAX = 4096
+
+# Batched index updates append shorter runs of new docs to a posting one doc at
+# a time rather than through NumPy
+_EXTEND_MIN = 32
+
+# Author date of a commit without one
+_NO_DATE = np.iinfo(np.int64).min
+
+
+def is_commit_sha(sha: str) -> bool:
+    """True for a full 40-character hex commit SHA."""
+    return len(sha) == 2 * SHA_BYTES and _HEX_RE.fullmatch(sha.lower()) is not None
+
+
+def _typecode_for(value: int) -> str:
+    for typecode in _TYPECODES:
+        if value < _LIMITS[typecode]:
+            return typecode
+    raise OverflowError(f"{value} does not fit in an unsigned 32-bit array")
+
+
+def _pack(values: np.ndarray) -> array:
+    """Packs non-negative integers into the smallest array typecode that holds them."""
+    typecode = _typecode_for(int(values.max()) if len(values) else 0)
+    packed = array(typecode)
+    packed.frombytes(values.astype(_DTYPES[typecode]).tobytes())
+    return packed
+
+
+def _unpack(packed: array) -> np.ndarray:
+    """Copies a packed array into a NumPy array (safe against concurrent appends)."""
+    return np.frombuffer(packed.tobytes(), dtype=_DTYPES[packed.typecode])
+
+
+def _append(packed: array, value: int) -> array:
+    """Appends value, widening to a larger typecode first if it does not fit."""
+    if value >= _LIMITS[packed.typecode]:
+        packed = array(_typecode_for(value), packed)
+    packed.append(value)
+    return packed
+
+
+def trigrams(text: str) -> set[str]:
+    """Returns the set of 3-character substrings of text."""
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def required_literals(parsed) -> list[str]:
+    """
+    Extracts literal runs that every match of a parsed regex must contain.
+
+    Only mandatory parts of the pattern contribute: optional repeats,
+    alternations and character classes end the current run and are skipped.
+    """
+    runs = []
+    current = []
+
+    def flush():
+        if current:
+            runs.append("".join(current))
+            current.clear()
+
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(arg))
+            continue
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            runs.extend(required_literals(arg[-1]))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] >= 1:
+            runs.extend(required_literals(arg[2]))
+    flush()
+    return runs
+
+
+def regex_literals(pattern: str) -> list[str]:
+    """
+    required_literals of a regex pattern, or [] (no trigram narrowing) if the
+    stdlib regex parser is missing or its parse tree is not the expected shape.
+    """
+    if sre_parse is None:
+        return []
+    try:
+        return required_literals(sre_parse.parse(pattern, re.IGNORECASE))
+    except Exception as e:
+        logger.debug(f"Could not extract literals from regex {pattern!r}: {e}")
+        return []
+
+
+def encode_cursor(score: float, doc: int, shard: str = "") -> str:
+    """Encodes the sort key of the last returned hit as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{score!r}:{doc}:{shard}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[float, int, str]:
+    """
+    Decodes a cursor produced by encode_cursor into (score, doc, shard).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        score, doc, shard = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 2)
+        return float(score), int(doc), shard
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k best scores, ordered by score desc then position."""
+    if len(scores) > k:
+        # Partial selection of the k-th best score; ties at that score are
+        # broken by position (= doc ID order) so cursors never skip a hit
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[: k - len(above)]
+        candidates = np.concatenate([above, tied])
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+class _DocList:
+    """
+    Ascending doc IDs stored as gaps (delta encoding) in the smallest array
+    typecode that fits the largest gap, so dense postings cost ~1 byte per doc.
+
+    Lists are append-only (doc IDs are never reused or rewritten), so a reader
+    decoding concurrently with the writer sees a consistent prefix.
+    """
+
+    __slots__ = ("gaps", "last")
+
+    def __init__(self):
+        self.gaps = array("B")
+        self.last = 0
+
+    def __len__(self) -> int:
+        return len(self.gaps)
+
+    def docs(self) -> np.ndarray:
+        """Decodes the doc IDs (cumulative sum of the gaps)."""
+        return np.cumsum(_unpack(self.gaps), dtype=np.uint32)
+
+    def append(self, doc: int) -> None:
+        """Appends a doc ID above the current maximum."""
+        gaps = self.gaps
+        gap = doc - self.last
+        if gap < _LIMITS[gaps.typecode]:
+            gaps.append(gap)
+        else:
+            self.gaps = _append(gaps, gap)
+        self.last = doc
+
+    def extend(self, docs: np.ndarray) -> None:
+        """Appends ascending doc IDs that are all above the current maximum."""
+        if not len(docs):
+            return
+        gaps = np.diff(docs.astype(np.int64), prepend=self.last if self.gaps else 0)
+        if int(gaps.max()) < _LIMITS[self.gaps.typecode]:
+            self.gaps.frombytes(gaps.astype(_DTYPES[self.gaps.typecode]).tobytes())
+        else:
+            self.gaps = _pack(
+                np.concatenate([_unpack(self.gaps).astype(np.int64), gaps])
+            )
+        self.last = int(docs[-1])
+
+
+class _Postings(_DocList):
+    """Delta-encoded doc IDs for one term plus their packed term frequencies."""
+
+    __slots__ = ("tfs",)
+
+    def __init__(self):
+        super().__init__()
+        self.tfs = array("B")
+
+    def append(self, doc: int, tf: int) -> None:
+        """Appends a doc ID above the current maximum with its term frequency."""
+        # Term frequency first: readers truncate to the shorter of the two arrays
+        tfs = self.tfs
+        if tf < _LIMITS[tfs.typecode]:
+            tfs.append(tf)
+        else:
+            self.tfs = _append(tfs, tf)
+        super().append(doc)
+
+    def extend(self, docs: np.ndarray, tfs: np.ndarray) -> None:
+        """Appends ascending doc IDs above the current maximum with their tfs."""
+        if not len(docs):
+            return
+        if int(tfs.max()) < _LIMITS[self.tfs.typecode]:
+            self.tfs.frombytes(tfs.astype(_DTYPES[self.tfs.typecode]).tobytes())
+        else:
+            self.tfs = _pack(np.concatenate([_unpack(self.tfs), tfs]).astype(np.uint32))
+        super().extend(docs)
+
+    def to_numpy(self) -> tuple[np.ndarray, np.ndarray]:
+        """Decodes doc IDs and term frequencies into NumPy arrays."""
+        tfs = _unpack(self.tfs)
+        docs = self.docs()
+        n = min(len(docs), len(tfs))
+        return docs[:n], tfs[:n]
+
+
+class _SortedRuns:
+    """
+    Doc IDs ordered by a key, kept as a large base run plus a small run of
+    recent inserts. Runs are replaced, never mutated (the small one is copied
+    on every insert), so snapshots can share them.
+    """
+
+    __slots__ = ("runs",)
+
+    def __init__(self):
+        self.runs = (array("I"), array("I"))
+
+    def insert(self, doc: int, key, merge) -> None:
+        """Inserts doc by key(doc); merge(base, docs) builds a new base run."""
+        base, delta = self.runs
+        delta = array("I", delta)
+        bisect.insort(delta, doc, key=key)
+        if len(delta) > _DELTA_MAX:
+            self.runs = (merge(base, _unpack(delta)), array("I"))
+        else:
+            self.runs = (base, delta)
+
+    def insert_many(self, docs: list[int], key, merge) -> None:
+        """
+        Inserts docs (in order, as repeated insert() calls would), merging
+        into a new base run only once the small run would outgrow _DELTA_MAX.
+        """
+        base, delta = self.runs
+        if len(delta) + len(docs) > _DELTA_MAX:
+            self.extend(np.array(docs, dtype=np.uint32), merge)
+        else:
+            delta = array("I", delta)
+            for doc in docs:
+                bisect.insort(delta, doc, key=key)
+            self.runs = (base, delta)
+
+    def extend(self, docs: np.ndarray, merge) -> None:
+        """Inserts many docs at once, straight into a new base run."""
+        base, delta = self.runs
+        self.runs = (merge(base, np.concatenate([_unpack(delta), docs])), array("I"))
+
+
+class CommitIndex:
+    """
+    In-memory inverted index over commit messages, with snapshot-isolated reads.
+
+    Each commit version gets a dense integer doc ID, and its SHA is stored
+    once, as 20 raw bytes in a flat bytearray (doc ID -> bytes). Postings are
+    delta-encoded arrays of doc IDs with packed term frequencies
+    ({ term: _Postings }). Document lengths and the total length are kept
+    incrementally, so BM25 scoring needs no pass over the index.
+
+    The index is multi-versioned so that readers never take a lock: every
+    structure a reader touches is either append-only or replaced whole.
+    Re-indexing a commit appends a new doc and tombstones the old one with the
+    generation that deleted it, so postings and trigram lists are only ever
+    appended to. After each mutation the writer publishes an immutable
+    CommitSnapshot (generation, doc ID watermark, live totals and SHA order),
+    and queries run against a snapshot: docs past its watermark, or deleted at
+    or before its generation, are invisible to it. compacted() drops
+    tombstoned docs.
+
+    Docs ordered by SHA bytes back exact and partial SHA lookups with bisect,
+    so a prefix query costs O(log n + k) instead of a scan over every commit.
+
+    Commit metadata is kept per doc (author and committer person IDs, author
+    date) with secondary indexes for author:/committer:/after:/before:
+    filters: doc lists per person ({ person ID: _DocList }, people found by
+    name, name word or email) and docs ordered by author date, so a date
+    range is two bisects. Both orders are _SortedRuns.
+
+    A trigram index ({ trigram: _DocList } over lowercased messages) narrows
+    substring and regex searches to the intersection of a few sorted doc ID
+    arrays, which is then verified against the actual message text.
+
+    Message text is kept in a MessageStore (the on-disk message log, shared
+    by the shards of a ShardedCommitIndex); the index holds each doc's
+    offset and length in it plus the store's short inline preview, which is
+    the whole message when that is short enough.
+
+    Only one thread may mutate the index at a time (IndexStore serializes
+    writers with its lock); any number of threads may read snapshots.
+    Messages are split into terms by the index's Tokenizer; queries must be
+    tokenized with the same one (index.tokenizer.tokenize).
+    """
+
+    def __init__(
+        self,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        tokenizer: Tokenizer | None = None,
+        messages: MessageStore | None = None,
+    ):
+        self.tokenizer = tokenizer or Tokenizer()
+        self.messages = MessageStore() if messages is None else messages
+        self.k1 = k1
+        self.b = b
+        self.generation = 0
+        self._sha_bytes = bytearray()
+        # Per-doc message location in the store, and inline preview
+        self._msg_offset = np.zeros(1024, dtype=np.uint64)
+        self._msg_len = np.zeros(1024, dtype=np.uint32)
+        self._previews: list[str] = []
+        self._doc_len = np.zeros(1024, dtype=np.uint32)
+        # Generation that deleted each doc (0 while it is live)
+        self._deleted_at = np.zeros(1024, dtype=np.uint64)
+        self._live_count = 0
+        self._total_len = 0
+        self._postings: dict[str, _Postings] = {}
+        self._trigrams: dict[str, _DocList] = {}
+        # Per-doc metadata: person IDs (0 = unknown) and author date (epoch seconds)
+        self._author_id = np.zeros(1024, dtype=np.uint32)
+        self._committer_id = np.zeros(1024, dtype=np.uint32)
+        self._author_date = np.full(1024, _NO_DATE, dtype=np.int64)
+        self._people: list[tuple[str, str]] = [("", "")]  # (name, email) by person ID
+        self._person_ids: dict[tuple[str, str], int] = {}
+        self._person_keys: dict[str, list[int]] = {}  # see facets.person_keys
+        self._author_docs: dict[int, _DocList] = {}
+        self._committer_docs: dict[int, _DocList] = {}
+        self._by_sha = _SortedRuns()
+        self._by_date = _SortedRuns()
+        self._snapshot = CommitSnapshot(self)
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    @property
+    def term_count(self) -> int:
+        """Number of distinct terms in the index (including tombstoned docs' terms)."""
+        return len(self._postings)
+
+    @property
+    def dead_count(self) -> int:
+        """Number of tombstoned doc versions still held (until compacted)."""
+        return len(self._previews) - self._live_count
+
+    def snapshot(self) -> "CommitSnapshot":
+        """The latest published, immutable view of the index."""
+        return self._snapshot
+
+    def add(self, sha: str, message: str, metadata: dict | None = None) -> bool:
+        """
+        Indexes (or re-indexes) a commit message under its SHA and publishes
+        a new snapshot. metadata holds the facets.COMMIT_METADATA_FIELDS of
+        the commit bundle. Returns False, publishing nothing, if the commit is
+        already indexed with the same message and metadata.
+
+        Raises:
+            ValueError: If sha is not a 40-character hex commit SHA.
+        """
+        if not is_commit_sha(sha):
+            raise ValueError(f"Not a commit SHA: {sha!r}")
+        fields = self._metadata_fields(metadata or {})
+        current = self._snapshot.find(sha)
+        if current is not None:
+            if self._doc_fields(current) == fields and self._message(current) == message:
+                return False
+            self._tombstone(current)
+        doc = self._append_doc(sha, message, fields)
+        self._by_sha.insert(doc, self._sha_key, self._merge_by_sha)
+        if fields[2] != _NO_DATE:
+            self._by_date.insert(doc, self._date_key, self._merge_by_date)
+        self._publish()
+        return True
+
+    def add_many(self, commits: list[tuple]) -> int:
+        """
+        Indexes (or re-indexes) many commits and publishes one snapshot for
+        all of them.
+
+        commits are (sha, message, metadata, term_freqs) tuples, term_freqs
+        being Counter(tokenizer.tokenize(message)) if the caller tokenized
+        already, else None. Each term's postings and each trigram's doc list
+        are extended once for the whole batch. A SHA repeated in the batch
+        ends up with its last version. Returns the number of commits added or
+        changed.
+
+        Raises:
+            ValueError: If a sha is not a 40-character hex commit SHA (before
+                anything is indexed).
+        """
+        for sha, _message, _metadata, _term_freqs in commits:
+            if not is_commit_sha(sha):
+                raise ValueError(f"Not a commit SHA: {sha!r}")
+        term_docs: dict[str, tuple[list[int], list[int]]] = {}
+        gram_docs: dict[str, list[int]] = {}
+        added: dict[str, int] = {}
+        new_docs = []
+        for sha, message, metadata, term_freqs in commits:
+            fields = self._metadata_fields(metadata or {})
+            current = added.get(sha)
+            if current is None:
+                current = self._snapshot.find(sha)
+            if current is not None:
+                if self._doc_fields(current) == fields and self._message(current) == message:
+                    continue
+                self._tombstone(current)
+            if term_freqs is None:
+                term_freqs = Counter(self.tokenizer.tokenize(message))
+            doc = self._reserve_doc(
+                sha, self._store_message(message), sum(term_freqs.values()), fields
+            )
+            added[sha] = doc
+            new_docs.append(doc)
+            for term, tf in term_freqs.items():
+                entry = term_docs.get(term)
+                if entry is None:
+                    entry = term_docs[term] = ([], [])
+                entry[0].append(doc)
+                entry[1].append(tf)
+            for gram in trigrams(message.lower()):
+                docs = gram_docs.get(gram)
+                if docs is None:
+                    gram_docs[gram] = [doc]
+                else:
+                    docs.append(doc)
+        if not new_docs:
+            return 0
+
+        # New doc IDs are all larger than existing ones, so appending keeps
+        # every posting sorted. Rare terms are appended doc by doc: the
+        # vectorized extend only pays off for longer runs.
+        for term, (docs, tfs) in term_docs.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+            if len(docs) < _EXTEND_MIN:
+                for doc, tf in zip(docs, tfs):
+                    postings.append(doc, tf)
+            else:
+                postings.extend(np.array(docs, dtype=np.uint32), np.array(tfs, dtype=np.uint32))
+        for gram, docs in gram_docs.items():
+            doc_list = self._trigrams.get(gram)
+            if doc_list is None:
+                doc_list = self._trigrams[gram] = _DocList()
+            if len(docs) < _EXTEND_MIN:
+                for doc in docs:
+                    doc_list.append(doc)
+            else:
+                doc_list.extend(np.array(docs, dtype=np.uint32))
+
+        # Versions superseded within the batch are tombstoned already and
+        # dropped by the merges
+        live = [doc for doc in new_docs if self._deleted_at[doc] == 0]
+        self._by_sha.insert_many(live, self._sha_key, self._merge_by_sha)
+        self._by_date.insert_many(
+            [doc for doc in live if self._author_date[doc] != _NO_DATE],
+            self._date_key,
+            self._merge_by_date,
+        )
+        self._publish()
+        return len(new_docs)
+
+    def remove(self, sha: str) -> bool:
+        """Removes a commit from the index. Returns False if it was not indexed."""
+        doc = self._snapshot.find(sha)
+        if doc is None:
+            return False
+        self._tombstone(doc)
+        self._publish()
+        return True
+
+    def merge(self, other: "CommitIndex", view: "CommitSnapshot | None" = None) -> int:
+        """
+        Merges a separately built (partial) index into this one.
+
+        The live commits of other that are new here, or whose message or
+        metadata differs, are appended in bulk: their doc IDs are remapped past the
+        current maximum and each term's postings are extended once. One
+        snapshot is published for the whole merge. Returns the number of
+        commits added or changed.
+
+        view selects the snapshot of other to merge (default: its latest).
+        Only the docs it sees are read, so other may still be written to by
+        another thread.
+
+        Raises:
+            ValueError: If other was built with a different tokenizer.
+        """
+        if other.tokenizer != self.tokenizer:
+            raise ValueError(
+                f"Cannot merge indexes built with different tokenizers: {other.tokenizer!r}"
+            )
+        if view is None:
+            view = other.snapshot()
+        same_store = other.messages is self.messages
+        mapping = np.full(view.watermark, -1, dtype=np.int64)
+        new_docs = []
+        for old_doc in range(view.watermark):
+            if not view.is_visible(old_doc):
+                continue
+            sha = other.doc_sha(old_doc)
+            fields = (
+                self._person_id(*other._people[other._author_id[old_doc]]),
+                self._person_id(*other._people[other._committer_id[old_doc]]),
+                int(other._author_date[old_doc]),
+            )
+            current = self._snapshot.find(sha)
+            if current is not None:
+                if self._doc_fields(current) == fields and (
+                    self._message(current) == other._message(old_doc)
+                ):
+                    continue
+                self._tombstone(current)
+            if same_store:
+                stored = (
+                    int(other._msg_offset[old_doc]),
+                    int(other._msg_len[old_doc]),
+                    other._previews[old_doc],
+                )
+            else:
+                stored = self._store_message(other._message(old_doc))
+            doc = self._reserve_doc(sha, stored, int(other._doc_len[old_doc]), fields)
+            mapping[old_doc] = doc
+            new_docs.append(doc)
+        if not new_docs:
+            return 0
+
+        # New doc IDs are all larger than existing ones (and assigned in the
+        # other index's doc order), so appending keeps every posting sorted
+        # Copied first: the writer of other may be adding terms
+        for term, other_postings in list(other._postings.items()):
+            docs, tfs = other_postings.to_numpy()
+            n = int(np.searchsorted(docs, view.watermark))
+            mapped = mapping[docs[:n]]
+            keep = mapped >= 0
+            if keep.any():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = _Postings()
+                postings.extend(mapped[keep], tfs[:n][keep])
+        for gram, other_docs in list(other._trigrams.items()):
+            docs = other_docs.docs()
+            mapped = mapping[docs[: int(np.searchsorted(docs, view.watermark))]]
+            mapped = mapped[mapped >= 0]
+            if len(mapped):
+                doc_list = self._trigrams.get(gram)
+                if doc_list is None:
+                    doc_list = self._trigrams[gram] = _DocList()
+                doc_list.extend(mapped)
+
+        new_docs = np.array(new_docs, dtype=np.uint32)
+        self._by_sha.extend(new_docs, self._merge_by_sha)
+        self._by_date.extend(
+            new_docs[self._author_date[new_docs] != _NO_DATE], self._merge_by_date
+        )
+        self._publish()
+        return len(new_docs)
+
+    def compacted(self) -> "CommitIndex":
+        """
+        Returns a copy of the index holding only its live commits (no
+        tombstones). It shares the message store: messages are not copied.
+        """
+        index = CommitIndex(self.k1, self.b, self.tokenizer, self.messages)
+        index.merge(self)
+        return index
+
+    def doc_sha(self, doc: int) -> str:
+        """Returns the SHA of a doc ID (as returned by score)."""
+        start = doc * SHA_BYTES
+        return self._sha_bytes[start : start + SHA_BYTES].hex()
+
+    def _message(self, doc: int) -> str:
+        """Full message of a doc: its preview if that is complete, else read from the store."""
+        preview, complete = self._preview(doc)
+        if complete:
+            return preview
+        return self.messages.get(int(self._msg_offset[doc]), int(self._msg_len[doc]))
+
+    def _preview(self, doc: int) -> tuple[str, bool]:
+        """(inline preview, whether it is the whole message) of a doc."""
+        preview = self._previews[doc]
+        length = int(self._msg_len[doc])
+        return preview, len(preview) == length or len(preview.encode("utf-8")) == length
+
+    def _store_message(self, message: str) -> tuple[int, int, str]:
+        """Appends a message to the store: (offset, length, preview)."""
+        offset, length = self.messages.append(message)
+        return offset, length, self.messages.preview(message)
+
+    def _sha_key(self, doc: int) -> bytes:
+        start = doc * SHA_BYTES
+        return bytes(self._sha_bytes[start : start + SHA_BYTES])
+
+    def _date_key(self, doc: int) -> int:
+        return int(self._author_date[doc])
+
+    def _metadata_fields(self, metadata: dict) -> tuple[int, int, int]:
+        """(author ID, committer ID, author date) of commit metadata, interning new people."""
+        timestamp = parse_timestamp(metadata.get("author_date"))
+        return (
+            self._person_id(
+                metadata.get("author_name") or "", metadata.get("author_email") or ""
+            ),
+            self._person_id(
+                metadata.get("committer_name") or "", metadata.get("committer_email") or ""
+            ),
+            _NO_DATE if timestamp is None else timestamp,
+        )
+
+    def _doc_fields(self, doc: int) -> tuple[int, int, int]:
+        return (
+            int(self._author_id[doc]),
+            int(self._committer_id[doc]),
+            int(self._author_date[doc]),
+        )
+
+    def _person_id(self, name: str, email: str) -> int:
+        if not name and not email:
+            return 0
+        person_id = self._person_ids.get((name, email))
+        if person_id is None:
+            person_id = len(self._people)
+            self._people.append((name, email))
+            self._person_ids[(name, email)] = person_id
+            for key in person_keys(name, email):
+                ids = self._person_keys.get(key)
+                if ids is None:
+                    self._person_keys[key] = [person_id]
+                else:
+                    ids.append(person_id)
+        return person_id
+
+    def _append_doc(self, sha: str, message: str, fields: tuple[int, int, int]) -> int:
+        """Allocates a doc for a commit version and appends it to every posting."""
+        term_freqs = Counter(self.tokenizer.tokenize(message))
+        doc = self._reserve_doc(
+            sha, self._store_message(message), sum(term_freqs.values()), fields
+        )
+        for term, tf in term_freqs.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+            postings.append(doc, tf)
+        for gram in trigrams(message.lower()):
+            doc_list = self._trigrams.get(gram)
+            if doc_list is None:
+                doc_list = self._trigrams[gram] = _DocList()
+            doc_list.append(doc)
+        return doc
+
+    def _reserve_doc(
+        self,
+        sha: str,
+        stored: tuple[int, int, str],
+        doc_len: int,
+        fields: tuple[int, int, int],
+    ) -> int:
+        """
+        Allocates the next doc ID and its per-doc entries (but neither term
+        postings nor SHA and date order). stored is the message's (offset,
+        length, preview) in the message store.
+        """
+        doc = len(self._previews)
+        if doc >= len(self._doc_len):
+            # Grown arrays are published before any doc ID that needs them
+            for name, fill in (
+                ("_msg_offset", 0),
+                ("_msg_len", 0),
+                ("_doc_len", 0),
+                ("_deleted_at", 0),
+                ("_author_id", 0),
+                ("_committer_id", 0),
+                ("_author_date", _NO_DATE),
+            ):
+                values = getattr(self, name)
+                grown = np.full(len(values) * 2, fill, dtype=values.dtype)
+                grown[: len(values)] = values
+                setattr(self, name, grown)
+        self._sha_bytes += bytes.fromhex(sha)
+        offset, length, preview = stored
+        self._msg_offset[doc] = offset
+        self._msg_len[doc] = length
+        self._doc_len[doc] = doc_len
+        author_id, committer_id, author_date = fields
+        self._author_date[doc] = author_date
+        for person_id, ids, doc_lists in (
+            (author_id, self._author_id, self._author_docs),
+            (committer_id, self._committer_id, self._committer_docs),
+        ):
+            ids[doc] = person_id
+            if person_id:
+                doc_list = doc_lists.get(person_id)
+                if doc_list is None:
+                    doc_list = doc_lists[person_id] = _DocList()
+                doc_list.append(doc)
+        self._previews.append(preview)
+        self._live_count += 1
+        self._total_len += doc_len
+        return doc
+
+    def _tombstone(self, doc: int) -> None:
+        """Marks a doc deleted as of the generation about to be published."""
+        self._deleted_at[doc] = self.generation + 1
+        self._live_count -= 1
+        self._total_len -= int(self._doc_len[doc])
+
+    def _merge_by_sha(self, base: array, docs: np.ndarray) -> array:
+        keys = np.frombuffer(bytes(self._sha_bytes), dtype=f"S{SHA_BYTES}")
+        return self._merged_run(base, docs, keys)
+
+    def _merge_by_date(self, base: array, docs: np.ndarray) -> array:
+        return self._merged_run(base, docs, self._author_date)
+
+    def _merged_run(self, base: array, docs: np.ndarray, keys: np.ndarray) -> array:
+        """A new base run: the live docs of base merged with docs, ordered by keys[doc]."""
+        base = _unpack(base)
+        base = base[self._deleted_at[base] == 0]
+        docs = docs[self._deleted_at[docs] == 0]
+        docs = docs[np.argsort(keys[docs], kind="stable")]
+        merged = np.insert(
+            base, np.searchsorted(keys[base], keys[docs], side="right"), docs
+        )
+        run = array("I")
+        run.frombytes(merged.astype(np.uint32).tobytes())
+        return run
+
+    def _publish(self) -> None:
+        self.generation += 1
+        self._snapshot = CommitSnapshot(self)
+
+
+class CommitSnapshot:
+    """
+    Immutable view of a CommitIndex as of one generation.
+
+    Shares the index's append-only structures but only sees the docs below
+    its watermark that were not deleted at or before its generation, so it
+    can be queried from any thread while the writer keeps indexing; every
+    query against one snapshot sees the same commits and BM25 statistics.
+    Document frequencies are counted over visible docs on first use and
+    memoized per snapshot.
+    """
+
+    __slots__ = (
+        "index",
+        "generation",
+        "watermark",
+        "n_docs",
+        "total_len",
+        "_by_sha",
+        "_by_date",
+        "_has_tombstones",
+        "_dfs",
+    )
+
+    def __init__(self, index: CommitIndex):
+        self.index = index
+        self.generation = index.generation
+        self.watermark = len(index._previews)
+        self.n_docs = index._live_count
+        self.total_len = index._total_len
+        self._by_sha = index._by_sha.runs
+        self._by_date = index._by_date.runs
+        self._has_tombstones = index.dead_count > 0
+        self._dfs: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def __contains__(self, sha: str) -> bool:
+        return self.find(sha) is not None
+
+    def is_visible(self, doc: int) -> bool:
+        """True if doc is a live commit version in this snapshot."""
+        if doc >= self.watermark:
+            return False
+        deleted_at = int(self.index._deleted_at[doc])
+        return deleted_at == 0 or deleted_at > self.generation
+
+    def find(self, sha: str) -> int | None:
+        """Doc ID of a commit in this snapshot, or None."""
+        if not is_commit_sha(sha):
+            return None
+        key = bytes.fromhex(sha)
+        for docs in self._by_sha:
+            doc = self._find_in(docs, key)[1]
+            if doc is not None:
+                return doc
+        return None
+
+    def find_many(self, shas: list[str]) -> dict[str, int]:
+        """
+        Resolves many full SHAs at once, returning {sha: doc ID} for those indexed.
+
+        The query keys are sorted and matched in a single forward pass over
+        each SHA-ordered run (each bisect starts where the previous one ended).
+        """
+        keys = sorted(
+            {bytes.fromhex(sha): sha for sha in shas if is_commit_sha(sha)}.items()
+        )
+        found = {}
+        for docs in self._by_sha:
+            pos = 0
+            for key, sha in keys:
+                if sha in found:
+                    continue
+                pos, doc = self._find_in(docs, key, pos)
+                if pos == len(docs):
+                    break
+                if doc is not None:
+                    found[sha] = doc
+        return found
+
+    def get_message(self, sha: str) -> str | None:
+        """Returns the indexed message for a full SHA, if present."""
+        doc = self.find(sha)
+        return None if doc is None else self.index._message(doc)
+
+    def get_preview(self, sha: str) -> tuple[str, bool] | None:
+        """
+        Returns the inline message preview for a full SHA, and whether it is
+        the whole message, if present. Never reads the message store.
+        """
+        doc = self.find(sha)
+        return None if doc is None else self.index._preview(doc)
+
+    def doc_sha(self, doc: int) -> str:
+        return self.index.doc_sha(doc)
+
+    def prefix_lookup(self, prefix: str, limit: int | None = None) -> list[str]:
+        """Returns indexed SHAs starting with a hex prefix, in sorted order, up to limit."""
+        prefix = prefix.lower()
+        if len(prefix) > 2 * SHA_BYTES or not _HEX_RE.fullmatch(prefix):
+            return []
+        # Every SHA with this prefix lies between the prefix padded with 0s and with fs
+        low = bytes.fromhex(prefix.ljust(2 * SHA_BYTES, "0"))
+        high = bytes.fromhex(prefix.ljust(2 * SHA_BYTES, "f"))
+        sha_key = self.index._sha_key
+        shas = []
+        for docs in self._by_sha:
+            start = bisect.bisect_left(docs, low, key=sha_key)
+            end = bisect.bisect_right(docs, high, lo=start, key=sha_key)
+            visible = (doc for doc in docs[start:end] if self.is_visible(doc))
+            shas.extend(self.doc_sha(doc) for doc in islice(visible, limit))
+        shas.sort()
+        return shas[:limit]
+
+    def term_stats(self, terms: list[str]) -> tuple[int, int, dict[str, int]]:
+        """Returns (doc count, total doc length, {term: doc frequency}) for BM25."""
+        dfs = {}
+        for term in terms:
+            df = self._dfs.get(term)
+            if df is None:
+                postings = self.index._postings.get(term)
+                df = 0 if postings is None else len(self._visible_postings(postings)[0])
+                self._dfs[term] = df
+            if df:
+                dfs[term] = df
+        return self.n_docs, self.total_len, dfs
+
+    def score(
+        self,
+        terms: list[str],
+        stats: tuple[int, int, dict[str, int]] | None = None,
+        within: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        BM25-scores every commit in the snapshot containing any of terms.
+
+        stats overrides the collection statistics (see term_stats), so several
+        indexes can be scored as one corpus. within (see filter_docs) limits
+        scoring to those docs; with no terms, every doc in within is scored
+        by its author date (newest first). Returns (doc IDs ascending, scores).
+        """
+        index = self.index
+        if not terms and within is not None:
+            return within, index._author_date[within].astype(np.float64)
+        postings = []
+        for term in dict.fromkeys(terms):
+            if term in index._postings:
+                docs, tfs = self._visible_postings(index._postings[term])
+                self._dfs.setdefault(term, len(docs))
+                if within is not None:
+                    keep = np.isin(docs, within, assume_unique=True)
+                    docs, tfs = docs[keep], tfs[keep]
+                if len(docs):
+                    postings.append((term, docs, tfs))
+        n_docs, total_len, dfs = stats or self.term_stats(terms)
+        if not postings or n_docs == 0:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0)
+        doc_len = index._doc_len  # Read after the postings (see _visible_postings)
+        avgdl = max(total_len / n_docs, 1.0)
+
+        doc_parts, score_parts = [], []
+        for term, docs, tfs in postings:
+            df = dfs.get(term, len(docs))
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            tf = tfs.astype(np.float64)
+            norm = index.k1 * (1.0 - index.b + index.b * doc_len[docs] / avgdl)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (index.k1 + 1.0) / (tf + norm))
+
+        if len(doc_parts) == 1:
+            return doc_parts[0], score_parts[0]
+        # Sum per-term contributions for docs matching several terms
+        docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        return docs, np.bincount(inverse, weights=np.concatenate(score_parts))
+
+    def rank(
+        self,
+        terms: list[str],
+        limit: int,
+        cursor: str | None = None,
+        within: np.ndarray | None = None,
+    ) -> tuple[list[tuple[str, float]], str | None]:
+        """
+        Scores commits containing any of terms with BM25 and returns the top hits.
+
+        Hits are ordered by score (descending), then doc ID. Passing the returned
+        cursor back resumes after the last hit of the previous page.
+
+        Returns:
+            ([(sha, score), ...], next_cursor or None)
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        docs, scores = self.score(terms, within=within)
+
+        if after is not None:
+            after_score, after_doc, _ = after
+            mask = (scores < after_score) | ((scores == after_score) & (docs > after_doc))
+            docs, scores = docs[mask], scores[mask]
+
+        selected = top_k(scores, limit)
+        hits = [(self.doc_sha(int(docs[i])), float(scores[i])) for i in selected]
+
+        next_cursor = None
+        if len(scores) > limit and len(selected):
+            last = selected[-1]
+            next_cursor = encode_cursor(float(scores[last]), int(docs[last]))
+        return hits, next_cursor
+
+    def substring_search(
+        self, text: str, limit: int | None = None, within: np.ndarray | None = None
+    ) -> list[str]:
+        """Returns SHAs whose message contains text (case-insensitive)."""
+        return list(islice(self.iter_substring(text, within), limit))
+
+    def regex_search(
+        self, pattern: str, limit: int | None = None, within: np.ndarray | None = None
+    ) -> list[str]:
+        """
+        Returns SHAs whose message matches a regex (case-insensitive).
+
+        Raises:
+            re.error: If the pattern does not compile.
+        """
+        return list(islice(self.iter_regex(pattern, within), limit))
+
+    def iter_substring(self, text: str, within: np.ndarray | None = None) -> Iterator[str]:
+        """Lazy substring_search: SHAs are produced as candidates are verified."""
+        needle = text.lower()
+        return self._verified(self._candidates([needle], within), lambda msg: needle in msg.lower())
+
+    def iter_regex(self, pattern: str, within: np.ndarray | None = None) -> Iterator[str]:
+        """
+        Lazy regex_search: SHAs are produced as candidates are verified.
+
+        Raises:
+            re.error: If the pattern does not compile.
+        """
+        compiled = re.compile(pattern, re.IGNORECASE)
+        return self._verified(
+            self._candidates([lit.lower() for lit in regex_literals(pattern)], within),
+            lambda msg: compiled.search(msg) is not None,
+        )
+
+    def filter_docs(self, filters: QueryFilters | None) -> np.ndarray | None:
+        """
+        Visible docs (ascending) matching author:/committer:/after:/before:
+        filters, intersected smallest first. None when there are no filters.
+        """
+        if not filters:
+            return None
+        index = self.index
+        parts = []
+        if filters.authors:
+            parts.append(self._people_docs(index._author_docs, filters.authors))
+        if filters.committers:
+            parts.append(self._people_docs(index._committer_docs, filters.committers))
+        if filters.after is not None or filters.before is not None:
+            parts.append(self._date_range(filters.after, filters.before))
+        parts.sort(key=len)
+        docs = parts[0]
+        for part in parts[1:]:
+            docs = np.intersect1d(docs, part, assume_unique=True)
+        return docs
+
+    def matching_docs(self, terms: list[str], within: np.ndarray | None = None) -> np.ndarray:
+        """Visible docs containing any of terms (all of within when there are no terms)."""
+        if not terms:
+            return np.zeros(0, dtype=np.uint32) if within is None else within
+        postings = self.index._postings
+        parts = [
+            self._visible_postings(postings[term])[0]
+            for term in dict.fromkeys(terms)
+            if term in postings
+        ]
+        if not parts:
+            return np.zeros(0, dtype=np.uint32)
+        if len(parts) == 1:
+            docs = parts[0]
+        else:
+            # Union through a doc mask: cheaper than sorting the concatenation
+            mask = np.zeros(self.watermark, dtype=bool)
+            for part in parts:
+                mask[part] = True
+            docs = np.flatnonzero(mask).astype(np.uint32)
+        if within is not None:
+            docs = np.intersect1d(docs, within, assume_unique=True)
+        return docs
+
+    def facet_counts(self, docs: np.ndarray) -> dict[str, Counter]:
+        """Counts docs per author, committer and author month ("2025-01")."""
+        index = self.index
+        author_ids = index._author_id[docs]
+        committer_ids = index._committer_id[docs]
+        dates = index._author_date[docs]
+        people = index._people
+        counts = {}
+        for facet, ids in (("author", author_ids), ("committer", committer_ids)):
+            counts[facet] = Counter(
+                {
+                    person_label(*people[person_id]): int(n)
+                    for person_id, n in enumerate(np.bincount(ids))
+                    if n and person_id
+                }
+            )
+        months = (
+            dates[dates != _NO_DATE].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+        )
+        counts["month"] = Counter()
+        if len(months):
+            first = int(months.min())
+            for offset, n in enumerate(np.bincount(months - first)):
+                if n:
+                    counts["month"][str(np.datetime64(first + offset, "M"))] = int(n)
+        return counts
+
+    def _visible_postings(self, postings: _Postings) -> tuple[np.ndarray, np.ndarray]:
+        """Decodes a term's postings, keeping only docs visible in this snapshot."""
+        docs, tfs = postings.to_numpy()
+        n = int(np.searchsorted(docs, self.watermark))
+        docs, tfs = docs[:n], tfs[:n]
+        if not self._has_tombstones:
+            return docs, tfs
+        # Read the per-doc arrays after the postings: the writer grows them
+        # before it appends a new doc ID to any posting
+        dead = self.index._deleted_at[docs]
+        visible = (dead == 0) | (dead > self.generation)
+        if not visible.all():
+            docs, tfs = docs[visible], tfs[visible]
+        return docs, tfs
+
+    def _visible_docs(self, docs: np.ndarray) -> np.ndarray:
+        """Keeps the docs of an ascending doc ID array that are visible in this snapshot."""
+        docs = docs[: int(np.searchsorted(docs, self.watermark))]
+        if self._has_tombstones:
+            dead = self.index._deleted_at[docs]
+            docs = docs[(dead == 0) | (dead > self.generation)]
+        return docs
+
+    def _people_docs(self, doc_lists: dict[int, _DocList], values: list[str]) -> np.ndarray:
+        """Visible docs of every person matching any of values (see facets.person_keys)."""
+        person_ids = set()
+        for value in values:
+            person_ids.update(self.index._person_keys.get(value, ()))
+        parts = [doc_lists[i].docs() for i in person_ids if i in doc_lists]
+        if not parts:
+            return np.zeros(0, dtype=np.uint32)
+        return self._visible_docs(np.unique(np.concatenate(parts)))
+
+    def _date_range(self, after: int | None, before: int | None) -> np.ndarray:
+        """Visible docs with after <= author date < before, by bisecting the date runs."""
+        date_key = self.index._date_key
+        parts = []
+        for run in self._by_date:
+            lo = 0 if after is None else bisect.bisect_left(run, after, key=date_key)
+            hi = (
+                len(run)
+                if before is None
+                else bisect.bisect_left(run, before, lo=lo, key=date_key)
+            )
+            parts.append(_unpack(run[lo:hi]))
+        return self._visible_docs(np.sort(np.concatenate(parts)))
+
+    def _find_in(self, docs: array, key: bytes, lo: int = 0) -> tuple[int, int | None]:
+        """
+        Bisects a SHA-ordered run for key, returning (position, visible doc or None).
+
+        A run may hold several versions of one SHA (re-indexed or removed
+        commits); at most one of them is visible in a snapshot.
+        """
+        sha_key = self.index._sha_key
+        pos = bisect.bisect_left(docs, key, lo=lo, key=sha_key)
+        for i in range(pos, len(docs)):
+            doc = docs[i]
+            if sha_key(doc) != key:
+                break
+            if self.is_visible(doc):
+                return pos, doc
+        return pos, None
+
+    def _candidates(
+        self, literals: list[str], within: np.ndarray | None = None
+    ) -> np.ndarray | None:
+        """
+        Intersects the sorted trigram doc lists of all literals, smallest first
+        (and within, when given).
+
+        Returns None when no literal is long enough to use the trigram index
+        and there is no within, meaning every indexed commit is a candidate.
+        """
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal)
+        if not grams:
+            return within
+        doc_lists = sorted(
+            (self.index._trigrams.get(gram) or _DocList() for gram in grams), key=len
+        )
+        candidates = doc_lists[0].docs()
+        for doc_list in doc_lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, doc_list.docs(), assume_unique=True)
+        if within is not None:
+            candidates = np.intersect1d(candidates, within, assume_unique=True)
+        return candidates
+
+    def _verified(self, candidates, matches) -> Iterator[str]:
+        """Filters candidate docs down to the visible SHAs whose message actually matches."""
+        if candidates is None:
+            logger.debug("Query has no indexable trigrams; verifying every commit.")
+            candidates = range(self.watermark)
+        message = self.index._message
+        for doc in candidates:
+            doc = int(doc)
+            if self.is_visible(doc) and matches(message(doc)):
+                yield self.doc_sha(doc)
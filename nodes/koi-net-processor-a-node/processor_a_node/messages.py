@@ -0,0 +1,130 @@
+import mmap
+import os
+from pathlib import Path
+
+# The message log file is grown (sparsely) in steps of at least this many bytes
+# so that appends do not remap it every time
+MESSAGE_LOG_MIN_GROWTH = 1 << 20
+
+
+class MessageStore:
+    """
+    Append-only store of commit message text, addressed by (offset, length)
+    in UTF-8 bytes.
+
+    With a path, messages are appended to a log file and read back through
+    mmap, so their bytes live in the OS page cache (which can evict them)
+    rather than in the processor's heap; the index only keeps each message's
+    offset, length and a short preview (see preview()). Without a path (the
+    partial indexes built by rebuild workers) messages are kept in memory.
+
+    The file is extended ahead of the written size and mapped once per
+    growth step. Only one thread may append at a time (the index writer);
+    reads may come from any thread. Messages are never rewritten: the bytes
+    of re-indexed or compacted-away versions stay in the log until it is
+    rebuilt from an empty index.
+
+    Opening a path starts an empty log. Pickling keeps only the path and
+    the size written as of the last sync(), so a checkpoint taken while
+    messages are still being appended only counts bytes already on disk.
+    Unpickling reopens the file and drops whatever was appended after that
+    size (the commit log replay appends those messages again).
+    """
+
+    def __init__(self, path: str | Path | None = None, preview_chars: int = 0):
+        self.path = Path(path) if path is not None else None
+        self.preview_chars = preview_chars
+        self._size = 0
+        self._synced_size = 0
+        self._buffer = bytearray()
+        self._fd: int | None = None
+        self._map: mmap.mmap | None = None
+        if self.path is not None:
+            self._open(0)
+
+    def __len__(self) -> int:
+        """Bytes of message text written."""
+        return self._size
+
+    def __getstate__(self) -> dict:
+        if self.path is None:
+            return {
+                "path": None,
+                "preview_chars": self.preview_chars,
+                "data": bytes(self._buffer),
+            }
+        return {"path": str(self.path), "preview_chars": self.preview_chars, "size": self._synced_size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(preview_chars=state["preview_chars"])
+        if state["path"] is None:
+            self._buffer = bytearray(state["data"])
+            self._size = len(self._buffer)
+        else:
+            self.path = Path(state["path"])
+            self._open(state["size"])
+
+    def preview(self, message: str) -> str:
+        """The inline preview kept in the index for a message: its first preview_chars characters."""
+        return message[: self.preview_chars]
+
+    def append(self, message: str) -> tuple[int, int]:
+        """Appends a message, returning its (offset, length)."""
+        data = message.encode("utf-8")
+        offset = self._size
+        if self.path is None:
+            self._buffer += data
+        else:
+            if offset + len(data) > self._capacity():
+                self._grow(offset + len(data))
+            os.pwrite(self._fd, data, offset)
+        self._size = offset + len(data)
+        return offset, len(data)
+
+    def get(self, offset: int, length: int) -> str:
+        """Reads back a message appended at offset."""
+        if self.path is None:
+            return self._buffer[offset : offset + length].decode("utf-8")
+        # A message's map is published (by _grow) before its offset is
+        return self._map[offset : offset + length].decode("utf-8")
+
+    def sync(self) -> None:
+        """Flushes the log file to disk (before a checkpoint references its size)."""
+        if self._fd is not None:
+            size = self._size
+            os.fsync(self._fd)
+            self._synced_size = size
+
+    def close(self) -> None:
+        """Closes the log file. Snapshots still reading it keep their own map."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _open(self, size: int) -> None:
+        """
+        Opens the log file keeping its first size bytes.
+
+        Raises:
+            ValueError: If the file holds fewer than size bytes.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < size:
+            os.close(self._fd)
+            self._fd = None
+            raise ValueError(f"Message log {self.path} is shorter than {size} bytes")
+        self._size = self._synced_size = size
+        self._map = None
+        os.ftruncate(self._fd, size)
+        self._grow(size)
+
+    def _capacity(self) -> int:
+        return 0 if self._map is None else len(self._map)
+
+    def _grow(self, needed: int) -> None:
+        """Extends the file to at least needed bytes (doubling) and maps it again."""
+        capacity = max(needed, 2 * self._capacity(), MESSAGE_LOG_MIN_GROWTH)
+        os.ftruncate(self._fd, capacity)
+        # The old map stays valid for readers still holding it
+        self._map = mmap.mmap(self._fd, capacity, access=mmap.ACCESS_READ)
@@ -0,0 +1,211 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from .facets import commit_metadata
+from .index import is_commit_sha
+from .shards import ShardedCommitIndex
+from .store import GITHUB_COMMIT_RID_PREFIX, IndexStore, repository_of
+from .tokenizer import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+class RebuildProgress:
+    """Progress and throughput of a running (or finished) index rebuild."""
+
+    def __init__(self):
+        self.state = "idle"
+        self.files_scanned = 0
+        self.commits_indexed = 0
+        self.commits_merged = 0
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.error: str | None = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def as_dict(self) -> dict:
+        elapsed = self.elapsed
+        return {
+            "state": self.state,
+            "files_scanned": self.files_scanned,
+            "commits_indexed": self.commits_indexed,
+            "commits_merged": self.commits_merged,
+            "elapsed_seconds": round(elapsed, 2),
+            "files_per_second": round(self.files_scanned / elapsed, 1) if elapsed else 0.0,
+            "error": self.error,
+        }
+
+
+def _index_chunk(
+    paths: list[str], tokenizer: Tokenizer
+) -> tuple[ShardedCommitIndex, list[tuple], int]:
+    """
+    Worker: parses a chunk of cached bundles into a partial index.
+
+    Runs in a separate process; returns the partial index, the
+    (rid, sha, message, manifest_hash, metadata) records for the commit log,
+    and the number of files read.
+    """
+    partial = ShardedCommitIndex(tokenizer=tokenizer)
+    records = []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                bundle = json.load(f)
+        except (OSError, ValueError):
+            continue
+        manifest = bundle.get("manifest") or {}
+        rid = manifest.get("rid", "")
+        contents = bundle.get("contents") or {}
+        sha = contents.get("sha") or ""
+        if not rid.startswith(GITHUB_COMMIT_RID_PREFIX) or not is_commit_sha(sha):
+            continue
+        message = contents.get("message", "")
+        metadata = commit_metadata(contents)
+        partial.add(repository_of(rid), sha, message, metadata)
+        records.append((rid, sha, message, manifest.get("sha256_hash"), metadata))
+    return partial, records, len(paths)
+
+
+def _chunks(cache_dir: str, chunk_size: int):
+    """Streams cache file paths in chunks without listing the whole directory."""
+    with os.scandir(cache_dir) as entries:
+        paths = (e.path for e in entries if e.name.endswith(".json"))
+        while chunk := list(islice(paths, chunk_size)):
+            yield chunk
+
+
+def rebuild_from_cache(
+    index: ShardedCommitIndex,
+    store: IndexStore,
+    cache_dir: str,
+    workers: int | None = None,
+    chunk_size: int = 1000,
+    progress: RebuildProgress | None = None,
+    log_every: float = 5.0,
+    stop: threading.Event | None = None,
+) -> RebuildProgress:
+    """
+    Rebuilds the index from every commit bundle in the local RID cache.
+
+    Bundles are parsed and tokenized in a process pool; each worker returns a
+    partial index for its chunk, which is merged into the live index (and
+    appended to the commit log) as soon as it completes. At most two chunks
+    per worker are in flight, so memory stays bounded on large caches.
+
+    Once stop is set, chunks not yet started are cancelled and the rebuild
+    ends (state "cancelled") after merging the ones already running.
+    """
+    progress = progress or RebuildProgress()
+    progress.state = "running"
+    progress.started_at = time.time()
+    workers = workers or os.cpu_count() or 1
+    last_log = time.monotonic()
+    logger.info(f"Rebuilding search index from {cache_dir} with {workers} worker(s)...")
+
+    try:
+        # spawn (not fork): the server process runs several threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            chunks = _chunks(cache_dir, chunk_size)
+            pending = set()
+            while True:
+                if stop is not None and stop.is_set():
+                    for future in pending:
+                        future.cancel()
+                    pending = {future for future in pending if not future.cancelled()}
+                while len(pending) < workers * 2 and not (stop is not None and stop.is_set()):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.add(pool.submit(_index_chunk, chunk, index.tokenizer))
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    partial, records, files = future.result()
+                    progress.files_scanned += files
+                    progress.commits_indexed += len(records)
+                    progress.commits_merged += store.record_many(index, partial, records)
+
+                if time.monotonic() - last_log >= log_every:
+                    last_log = time.monotonic()
+                    stats = progress.as_dict()
+                    logger.info(
+                        f"Rebuild progress: {stats['files_scanned']} files, "
+                        f"{stats['commits_indexed']} commits ({stats['files_per_second']} files/s)"
+                    )
+
+        if stop is not None and stop.is_set():
+            progress.state = "cancelled"
+        else:
+            store.checkpoint(index)
+            progress.state = "finished"
+    except Exception as e:
+        progress.state = "failed"
+        progress.error = str(e)
+        logger.error(f"Index rebuild failed: {e}", exc_info=True)
+    finally:
+        progress.finished_at = time.time()
+
+    stats = progress.as_dict()
+    logger.info(
+        f"Rebuild {progress.state}: {stats['files_scanned']} files, {stats['commits_indexed']} commits, "
+        f"{stats['commits_merged']} added/changed in {stats['elapsed_seconds']}s "
+        f"({stats['files_per_second']} files/s)"
+    )
+    return progress
+
+
+class RebuildRunner:
+    """Runs at most one background rebuild at a time for the admin endpoint."""
+
+    def __init__(self, index: ShardedCommitIndex, store: IndexStore, cache_dir: str):
+        self.index = index
+        self.store = store
+        self.cache_dir = cache_dir
+        self.progress = RebuildProgress()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, workers: int | None = None) -> bool:
+        """Starts a rebuild thread. Returns False if one is already running."""
+        if self.running:
+            return False
+        self.progress = RebuildProgress()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=rebuild_from_cache,
+            args=(self.index, self.store, self.cache_dir),
+            kwargs={"workers": workers, "progress": self.progress, "stop": self._stop},
+            name="index-rebuild",
+            daemon=True,
+        )
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 60.0) -> bool:
+        """
+        Cancels a running rebuild and waits for it to end. Returns False if
+        it is still running after timeout seconds.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
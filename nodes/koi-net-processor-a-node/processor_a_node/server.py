@@ -1,6 +1,12 @@
+import json
 import logging
+import re
+import threading
+from collections.abc import Iterable, Iterator
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 
 from koi_net.protocol.api_models import (
     PollEvents,
@@ -22,12 +28,38 @@ from koi_net.protocol.consts import (
 from koi_net.processor.knowledge_object import KnowledgeSource
 
 from .core import node  # Import the initialized node instance
+from .config import (
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_MAX_LIMIT,
+    SEARCH_BATCH_MAX_QUERIES,
+    CACHE_DIR,
+)
 
 # Import the query helper and index from handlers
-from .handlers import query_search_index, search_index
+from .handlers import (
+    query_search_index,
+    query_search_batch,
+    stream_commits,
+    query_is_ancestor,
+    query_commits_between,
+    query_merge_bases,
+    query_cache,
+    search_index,
+    index_store,
+    index_writer,
+    bundle_prefetcher,
+    SEARCH_MODES,
+)
+from .rebuild import RebuildRunner
 
 logger = logging.getLogger(__name__)
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Streamed search hits are sent in chunks of about this many bytes
+STREAM_CHUNK_BYTES = 64 * 1024
+
+rebuild_runner = RebuildRunner(search_index, index_store, CACHE_DIR)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -41,14 +73,34 @@ async def lifespan(app: FastAPI):
         # Potentially exit or raise to prevent FastAPI from starting improperly
         raise RuntimeError("Failed to initialize KOI-net node") from e
 
+    # The index is already searchable from its checkpoint; pick up bundles that
+    # changed in the RID cache since then without blocking startup
+    threading.Thread(
+        target=index_store.reconcile_cache,
+        args=(search_index, CACHE_DIR),
+        name="index-reconcile",
+        daemon=True,
+    ).start()
+
     yield  # Application runs here
 
     logger.info("Shutting down Processor A...")
+    bundle_prefetcher.stop()
+    index_writer.stop()
     try:
         node.stop()
         logger.info("Processor A KOI-net node stopped successfully.")
     except Exception as e:
         logger.error(f"Error stopping KOI-net node: {e}", exc_info=True)
+    # A rebuild records into index_store: it must end before the store closes
+    if not rebuild_runner.stop():
+        logger.error("Index rebuild did not stop in time; skipping the final checkpoint.")
+    else:
+        try:
+            index_store.close(search_index)
+            logger.info("Processor A search index checkpointed.")
+        except Exception as e:
+            logger.error(f"Error checkpointing search index: {e}", exc_info=True)
     logger.info("Processor A shutdown complete.")
 
 
@@ -142,23 +194,91 @@ async def health():
 app.include_router(koi_net_router)
 
 # --- Custom Search API Router ---
+# Search and graph endpoints are plain (sync) functions: FastAPI runs them in
+# its threadpool, so a slow query (e.g. a regex with no trigram to narrow it)
+# does not stall the event loop serving KOI-net events and /health
 search_router = APIRouter()
 
 
+def ndjson_chunks(hits: Iterable[dict]) -> Iterator[bytes]:
+    """Encodes hits as NDJSON lines, batched into chunks of about STREAM_CHUNK_BYTES."""
+    buffer = []
+    size = 0
+    for hit in hits:
+        line = json.dumps(hit).encode() + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
 @search_router.get("/search")
-async def search_commits_endpoint(q: str):
-    """Endpoint to search the indexed commit data."""
+def search_commits_endpoint(
+    request: Request,
+    q: str,
+    limit: int | None = None,
+    mode: str = "auto",
+    cursor: str | None = None,
+    repo: list[str] | None = Query(None),
+    stream: bool = False,
+):
+    """
+    Endpoint to search the indexed commit data.
+
+    Pass repo=owner/name (repeatable) to search only those repositories.
+    Queries may include author:, committer:, after: and before: filters.
+
+    With stream=1 (or Accept: application/x-ndjson) every hit is streamed as
+    one JSON line, up to limit if given, instead of one page of results.
+    """
+    stream = stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
     if not q:
         raise HTTPException(status_code=400, detail="Query parameter 'q' is required.")
+    if stream:
+        if limit is not None and limit < 1:
+            raise HTTPException(
+                status_code=400, detail="Query parameter 'limit' must be at least 1."
+            )
+    elif limit is None:
+        limit = SEARCH_DEFAULT_LIMIT
+    elif not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query parameter 'limit' must be between 1 and {SEARCH_MAX_LIMIT}.",
+        )
+    if mode not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query parameter 'mode' must be one of {', '.join(SEARCH_MODES)}.",
+        )
 
-    logger.info(f"Search request received: q='{q}'")
+    logger.info(
+        f"Search request received: q='{q}', limit={limit}, mode={mode}, "
+        f"repo={repo or 'all'}, stream={stream}"
+    )
     try:
+        if stream:
+            hits = stream_commits(q, limit=limit, mode=mode, cursor=cursor, repos=repo)
+            return StreamingResponse(ndjson_chunks(hits), media_type=NDJSON_MEDIA_TYPE)
         # Use the helper function from handlers
-        results = query_search_index(q)
+        results, next_cursor, facets = query_search_index(
+            q, limit=limit, mode=mode, cursor=cursor, repos=repo
+        )
         logger.info(f"Search for '{q}' yielded {len(results)} results.")
-        # Note: The current index only returns SHA and context.
-        # A real implementation would likely reconstruct the full RID.
-        return {"query": q, "results": results}
+        return {
+            "query": q,
+            "results": results,
+            "next_cursor": next_cursor,
+            "facets": facets,
+        }
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regex: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error during search for query '{q}': {e}", exc_info=True)
         raise HTTPException(
@@ -166,7 +286,147 @@ async def search_commits_endpoint(q: str):
         )
 
 
+class BatchSearchRequest(BaseModel):
+    """Body of POST /search/batch; limit, mode and repo apply to every query."""
+
+    queries: list[str]
+    limit: int = SEARCH_DEFAULT_LIMIT
+    mode: str = "auto"
+    repo: list[str] | None = None
+
+
+@search_router.post("/search/batch")
+def search_batch_endpoint(req: BatchSearchRequest):
+    """Resolves a list of queries (e.g. hundreds of SHAs) in one request."""
+    if not 1 <= len(req.queries) <= SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'queries' must contain between 1 and {SEARCH_BATCH_MAX_QUERIES} entries.",
+        )
+    if not 1 <= req.limit <= SEARCH_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'limit' must be between 1 and {SEARCH_MAX_LIMIT}.",
+        )
+    if req.mode not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'mode' must be one of {', '.join(SEARCH_MODES)}.",
+        )
+
+    logger.info(
+        f"Batch search request received: {len(req.queries)} queries, limit={req.limit}, mode={req.mode}"
+    )
+    try:
+        responses = query_search_batch(
+            req.queries, limit=req.limit, mode=req.mode, repos=req.repo
+        )
+    except Exception as e:
+        logger.error(f"Error during batch search: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500, detail="Internal server error during search."
+        )
+    return {"responses": responses}
+
+
 # Include the custom search router *without* the /koi-net prefix
 app.include_router(search_router)
 
+# --- Commit Graph Router ---
+graph_router = APIRouter(prefix="/graph")
+
+
+def graph_query(query, *args):
+    """Runs a commit graph query, mapping lookup errors to HTTP errors."""
+    try:
+        return query(*args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except Exception as e:
+        logger.error(f"Error during commit graph query {query.__name__}{args}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500, detail="Internal server error during commit graph query."
+        )
+
+
+@graph_router.get("/is-ancestor")
+def is_ancestor_endpoint(
+    repo: str, ancestor: str, descendant: list[str] = Query(...)
+):
+    """
+    Whether ancestor (e.g. a fix) is contained in each descendant (e.g. a
+    release commit); descendant is repeatable.
+    """
+    contains = graph_query(query_is_ancestor, repo, ancestor, descendant)
+    return {"repo": repo, "ancestor": ancestor, "descendants": contains}
+
+
+@graph_router.get("/between")
+def commits_between_endpoint(
+    repo: str, base: str, head: str, limit: int = SEARCH_DEFAULT_LIMIT
+):
+    """Commits reachable from head but not from base (git log base..head), newest first."""
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query parameter 'limit' must be between 1 and {SEARCH_MAX_LIMIT}.",
+        )
+    commits, truncated = graph_query(query_commits_between, repo, base, head, limit)
+    return {"repo": repo, "base": base, "head": head, "commits": commits, "truncated": truncated}
+
+
+@graph_router.get("/merge-base")
+def merge_base_endpoint(repo: str, a: str, b: str):
+    """Best common ancestors of two commits (git merge-base --all)."""
+    merge_bases = graph_query(query_merge_bases, repo, a, b)
+    return {"repo": repo, "a": a, "b": b, "merge_bases": merge_bases}
+
+
+app.include_router(graph_router)
+
+# --- Admin Router ---
+admin_router = APIRouter(prefix="/admin")
+
+
+@admin_router.post("/rebuild", status_code=202)
+async def start_rebuild_endpoint(workers: int | None = None):
+    """Starts a background rebuild of the search index from the local RID cache."""
+    if workers is not None and workers < 1:
+        raise HTTPException(
+            status_code=400, detail="Query parameter 'workers' must be at least 1."
+        )
+    if not rebuild_runner.start(workers=workers):
+        raise HTTPException(status_code=409, detail="A rebuild is already running.")
+    logger.info(f"Index rebuild started (workers={workers or 'auto'}).")
+    return rebuild_runner.progress.as_dict()
+
+
+@admin_router.get("/rebuild")
+async def rebuild_status_endpoint():
+    """Reports progress and throughput of the current or last rebuild."""
+    return rebuild_runner.progress.as_dict()
+
+
+@admin_router.get("/cache")
+async def query_cache_stats_endpoint():
+    """Reports query result cache size and hit/miss counters."""
+    return {**query_cache.stats(), "index_generation": search_index.generation}
+
+
+# A plain function, run in the threadpool: IndexStore.stats waits for the
+# store lock, which the index writer holds while applying a batch
+@admin_router.get("/index")
+def index_stats_endpoint():
+    """Reports index size, commit log and checkpoint position, bundle fetch and batch writer counters."""
+    return {
+        **index_store.stats(search_index),
+        "bundle_fetches": bundle_prefetcher.stats(),
+        "writer": index_writer.stats(),
+    }
+
+
+app.include_router(admin_router)
+
 logger.info("Processor A FastAPI application configured with KOI and Search routers.")
@@ -0,0 +1,502 @@
+import logging
+import re
+from collections import Counter
+from collections.abc import Iterator
+from itertools import islice
+
+import numpy as np
+
+from .facets import QueryFilters
+from .graph import CommitGraph
+from .index import CommitIndex, CommitSnapshot, decode_cursor, encode_cursor, top_k
+from .messages import MessageStore
+from .tokenizer import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+# A shard is compacted once it holds at least this many tombstoned doc
+# versions and more tombstoned than live ones
+COMPACT_MIN_DEAD = 1024
+
+
+class ShardedCommitIndex:
+    """
+    Commit index partitioned per repository ("owner/repo").
+
+    Every repository gets its own CommitIndex shard, so a query scoped to a
+    few repositories only touches their postings. Commits are addressed by
+    (repo, sha); the same SHA may be indexed in several repositories (forks).
+
+    This is the writer side: mutations must come from one thread at a time
+    (IndexStore serializes them). Each mutation publishes a new immutable
+    ShardedSnapshot by swapping a single attribute, and all queries run
+    against snapshot(), so searches never block the writer and never see a
+    half-applied update.
+
+    generation is bumped by every mutation that changes the index, so cached
+    query results can be validated with a single integer comparison. It is
+    index-wide rather than per shard or term: any new commit shifts the
+    global BM25 statistics.
+
+    Each repository also gets a CommitGraph built from the commits' parent
+    SHAs, for ancestry and range queries. It is not part of the snapshots:
+    history only ever grows, and the graph serializes its own queries.
+
+    All shards keep their message text in one MessageStore (in memory
+    unless one backed by a file is given; see IndexStore).
+    """
+
+    def __init__(
+        self, tokenizer: Tokenizer | None = None, messages: MessageStore | None = None
+    ):
+        self.tokenizer = tokenizer or Tokenizer()
+        self.messages = MessageStore() if messages is None else messages
+        self.generation = 0
+        self._shards: dict[str, CommitIndex] = {}
+        self._graphs: dict[str, CommitGraph] = {}
+        self._snapshot = ShardedSnapshot(0, {})
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+    @property
+    def repos(self) -> list[str]:
+        """Indexed repositories, sorted."""
+        return self._snapshot.repos
+
+    @property
+    def term_count(self) -> int:
+        """Number of distinct terms, summed over shards."""
+        return sum(shard.term_count for shard in list(self._shards.values()))
+
+    def shard(self, repo: str) -> CommitIndex | None:
+        return self._shards.get(repo)
+
+    def graph(self, repo: str) -> CommitGraph | None:
+        """Commit graph of repo, or None if no commit of it was indexed."""
+        return self._graphs.get(repo)
+
+    def snapshot(self) -> "ShardedSnapshot":
+        """The latest published, immutable view of every shard; queries run against it."""
+        return self._snapshot
+
+    def add(
+        self, repo: str, sha: str, message: str, metadata: dict | None = None
+    ) -> bool:
+        """
+        Indexes (or re-indexes) a commit of repo with its metadata (see
+        CommitIndex.add), and adds it to the repository's commit graph.
+        Returns False if it was already indexed unchanged.
+
+        Raises:
+            ValueError: If sha is not a 40-character hex commit SHA.
+        """
+        changed = self._shard_for_write(repo).add(sha, message, metadata)
+        graph = self._graphs.get(repo)
+        if graph is None:
+            graph = self._graphs[repo] = CommitGraph()
+        if graph.add(sha, (metadata or {}).get("parents") or []):
+            changed = True
+        if changed:
+            self._publish([repo])
+        return changed
+
+    def add_many(self, commits: list[tuple]) -> int:
+        """
+        Indexes (or re-indexes) many (repo, sha, message, metadata,
+        term_freqs) commits, shard by shard with CommitIndex.add_many, and
+        adds them to their commit graphs, publishing one snapshot for all of
+        them. Returns the number of commits added or changed.
+
+        Raises:
+            ValueError: If a sha is not a 40-character hex commit SHA.
+        """
+        by_repo: dict[str, list[tuple]] = {}
+        for repo, sha, message, metadata, term_freqs in commits:
+            by_repo.setdefault(repo, []).append((sha, message, metadata, term_freqs))
+        changed = 0
+        changed_repos = []
+        for repo, repo_commits in by_repo.items():
+            count = self._shard_for_write(repo).add_many(repo_commits)
+            graph = self._graphs.get(repo)
+            if graph is None:
+                graph = self._graphs[repo] = CommitGraph()
+            graph_changed = False
+            for sha, _message, metadata, _term_freqs in repo_commits:
+                if graph.add(sha, (metadata or {}).get("parents") or []):
+                    graph_changed = True
+            changed += count
+            if count or graph_changed:
+                changed_repos.append(repo)
+        if changed_repos:
+            self._publish(changed_repos)
+        return changed
+
+    def remove(self, repo: str, sha: str) -> bool:
+        """Removes a commit. Returns False if it was not indexed."""
+        shard = self._shards.get(repo)
+        if shard is None or not shard.remove(sha):
+            return False
+        self._publish([repo])
+        return True
+
+    def merge(self, other: "ShardedCommitIndex") -> int:
+        """
+        Merges a separately built (partial) sharded index, shard by shard,
+        publishing one snapshot for the whole merge.
+
+        Returns the number of commits added or changed.
+
+        Raises:
+            ValueError: If other was built with a different tokenizer.
+        """
+        if other.tokenizer != self.tokenizer:
+            raise ValueError(
+                f"Cannot merge indexes built with different tokenizers: {other.tokenizer!r}"
+            )
+        merged = 0
+        changed_repos = []
+        for repo, shard in other._shards.items():
+            count = self._shard_for_write(repo).merge(shard)
+            graph = other._graphs.get(repo)
+            if graph is not None:
+                count = max(count, self._graphs.setdefault(repo, CommitGraph()).merge(graph))
+            if count:
+                merged += count
+                changed_repos.append(repo)
+        if changed_repos:
+            self._publish(changed_repos)
+        return merged
+
+    def copy(self, snapshot: "ShardedSnapshot") -> "ShardedCommitIndex":
+        """
+        Returns a new index holding the live commits of snapshot (one of this
+        index's), compacted, sharing this index's message store and commit
+        graphs. Only what the snapshot sees is read, so the copy can be made
+        on another thread while the writer keeps indexing.
+        """
+        copy = ShardedCommitIndex(self.tokenizer, self.messages)
+        for repo, view in snapshot.shards.items():
+            shard = copy._shards[repo] = CommitIndex(tokenizer=self.tokenizer, messages=self.messages)
+            shard.merge(view.index, view)
+        copy._graphs = dict(self._graphs)
+        copy._publish(list(copy._shards))
+        return copy
+
+    def _publish(self, repos: list[str]) -> None:
+        """Publishes a snapshot with the current state of the given shards."""
+        for repo in repos:
+            shard = self._shards[repo]
+            if shard.dead_count >= max(COMPACT_MIN_DEAD, len(shard)):
+                # Readers of older snapshots keep the uncompacted shard alive.
+                # Doc IDs change, so cursors into this shard may repeat a tie.
+                self._shards[repo] = shard.compacted()
+                logger.info(
+                    f"Compacted index shard {repo}: dropped {shard.dead_count} stale commit versions"
+                )
+        previous = self._snapshot
+        shards = dict(previous.shards)
+        for repo in repos:
+            shards[repo] = self._shards[repo].snapshot()
+        new_repos = len(shards) != len(previous.shards)
+        self.generation += 1
+        self._snapshot = ShardedSnapshot(
+            self.generation, shards, None if new_repos else previous.repos
+        )
+
+    def _shard_for_write(self, repo: str) -> CommitIndex:
+        shard = self._shards.get(repo)
+        if shard is None:
+            shard = self._shards[repo] = CommitIndex(
+                tokenizer=self.tokenizer, messages=self.messages
+            )
+            logger.info(f"Created index shard for repository {repo}")
+        return shard
+
+
+class ShardedSnapshot:
+    """
+    Immutable view of a ShardedCommitIndex at one generation.
+
+    BM25 collection statistics (doc count, average length, document
+    frequencies) are summed over all shards, so scores are comparable across
+    shards and do not change when a query is narrowed to a subset of repos.
+    Ranked hits are ordered by score (descending), then repository, then
+    doc ID; cursors carry the repository of the last hit.
+
+    Queries take optional QueryFilters (author, committer, date range),
+    resolved per shard through its secondary indexes before any scoring.
+    """
+
+    def __init__(
+        self,
+        generation: int,
+        shards: dict[str, CommitSnapshot],
+        repos: list[str] | None = None,
+    ):
+        self.generation = generation
+        self.shards = shards
+        self.repos = sorted(shards) if repos is None else repos
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards.values())
+
+    def get_message(self, repo: str, sha: str) -> str | None:
+        shard = self.shards.get(repo)
+        return None if shard is None else shard.get_message(sha)
+
+    def get_preview(self, repo: str, sha: str) -> tuple[str, bool] | None:
+        """(inline message preview, whether it is the whole message); see CommitSnapshot.get_preview."""
+        shard = self.shards.get(repo)
+        return None if shard is None else shard.get_preview(sha)
+
+    def find(self, sha: str, repos: list[str] | None = None) -> list[tuple[str, str]]:
+        """Returns (repo, sha) for every selected repository containing a full SHA."""
+        return [(repo, sha) for repo, shard in self._select(repos) if sha in shard]
+
+    def find_many(
+        self, shas: list[str], repos: list[str] | None = None
+    ) -> dict[str, list[tuple[str, str]]]:
+        """Resolves many full SHAs with one pass per shard: {sha: [(repo, sha), ...]}."""
+        found: dict[str, list[tuple[str, str]]] = {}
+        for repo, shard in self._select(repos):
+            for sha in shard.find_many(shas):
+                found.setdefault(sha, []).append((repo, sha))
+        return found
+
+    def prefix_lookup(
+        self, prefix: str, limit: int | None = None, repos: list[str] | None = None
+    ) -> list[tuple[str, str]]:
+        """Returns (repo, sha) pairs whose SHA starts with prefix, by SHA then repo."""
+        hits = [
+            (sha, repo)
+            for repo, shard in self._select(repos)
+            for sha in shard.prefix_lookup(prefix, limit)
+        ]
+        hits.sort()
+        return [(repo, sha) for sha, repo in hits[:limit]]
+
+    def rank(
+        self,
+        terms: list[str],
+        limit: int,
+        cursor: str | None = None,
+        repos: list[str] | None = None,
+        filters: QueryFilters | None = None,
+    ) -> tuple[list[tuple[str, str, float]], str | None]:
+        """
+        BM25-ranks commits of the selected repositories containing any of terms
+        and matching filters. With filters but no terms, every matching commit
+        is returned, newest (author date) first.
+
+        Each shard contributes at most limit candidates; these are merged by
+        (score desc, repo, doc ID).
+
+        Returns:
+            ([(repo, sha, score), ...], next_cursor or None)
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        parts = []
+        remaining = 0
+        for repo_pos, repo, shard, docs, scores in self._scored(terms, cursor, repos, filters):
+            remaining += len(scores)
+            selected = top_k(scores, limit)
+            parts.append((repo_pos, repo, shard, docs[selected], scores[selected]))
+        if not parts:
+            return [], None
+
+        order, by_pos, repo_pos, docs, scores = _merge_parts(parts)
+        order = order[:limit]
+        hits = []
+        for i in order:
+            repo, shard = by_pos[int(repo_pos[i])]
+            hits.append((repo, shard.doc_sha(int(docs[i])), float(scores[i])))
+
+        next_cursor = None
+        if remaining > limit:
+            last = order[-1]
+            repo = by_pos[int(repo_pos[last])][0]
+            next_cursor = encode_cursor(float(scores[last]), int(docs[last]), repo)
+        return hits, next_cursor
+
+    def iter_rank(
+        self,
+        terms: list[str],
+        cursor: str | None = None,
+        repos: list[str] | None = None,
+        filters: QueryFilters | None = None,
+    ) -> Iterator[tuple[str, str, float]]:
+        """
+        Every hit of rank() (from cursor on), in the same order, produced
+        lazily: scores are computed and sorted once, and hits are resolved
+        to SHAs only as they are consumed.
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        parts = list(self._scored(terms, cursor, repos, filters))
+        return self._iter_ranked(parts)
+
+    def _iter_ranked(self, parts: list[tuple]) -> Iterator[tuple[str, str, float]]:
+        if not parts:
+            return
+        order, by_pos, repo_pos, docs, scores = _merge_parts(parts)
+        for i in order:
+            repo, shard = by_pos[int(repo_pos[i])]
+            yield repo, shard.doc_sha(int(docs[i])), float(scores[i])
+
+    def _scored(
+        self,
+        terms: list[str],
+        cursor: str | None,
+        repos: list[str] | None,
+        filters: QueryFilters | None,
+    ) -> Iterator[tuple[int, str, CommitSnapshot, np.ndarray, np.ndarray]]:
+        """
+        Scores the matching docs of each selected shard, keeping those after
+        cursor: (repo position, repo, shard, docs, scores) per non-empty shard.
+
+        Raises:
+            ValueError: If the cursor is malformed.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        stats = self.term_stats(terms)
+        for repo_pos, (repo, shard) in enumerate(self._select(repos)):
+            within = shard.filter_docs(filters)
+            if within is not None and not len(within):
+                continue
+            docs, scores = shard.score(terms, stats, within)
+            if after is not None:
+                after_score, after_doc, after_repo = after
+                if repo < after_repo:
+                    mask = scores < after_score
+                elif repo > after_repo:
+                    mask = scores <= after_score
+                else:
+                    mask = (scores < after_score) | (
+                        (scores == after_score) & (docs > after_doc)
+                    )
+                docs, scores = docs[mask], scores[mask]
+            if len(scores):
+                yield repo_pos, repo, shard, docs, scores
+
+    def facets(
+        self,
+        terms: list[str],
+        limit: int,
+        repos: list[str] | None = None,
+        filters: QueryFilters | None = None,
+    ) -> dict[str, list[dict]]:
+        """
+        Counts every commit a ranked query matches (not just one page) by
+        author and committer (the top limit of each) and by author month.
+
+        Returns:
+            {"author": [{"value", "count"}, ...], "committer": [...], "month": [...]}
+        """
+        totals = {"author": Counter(), "committer": Counter(), "month": Counter()}
+        for _repo, shard in self._select(repos):
+            docs = shard.matching_docs(terms, shard.filter_docs(filters))
+            if len(docs):
+                for facet, counts in shard.facet_counts(docs).items():
+                    totals[facet].update(counts)
+        return {
+            "author": _facet_values(totals["author"].most_common(limit)),
+            "committer": _facet_values(totals["committer"].most_common(limit)),
+            "month": _facet_values(sorted(totals["month"].items())),
+        }
+
+    def term_stats(self, terms: list[str]) -> tuple[int, int, dict[str, int]]:
+        """BM25 collection statistics summed over every shard."""
+        n_docs = total_len = 0
+        dfs: dict[str, int] = {}
+        for shard in self.shards.values():
+            shard_docs, shard_len, shard_dfs = shard.term_stats(terms)
+            n_docs += shard_docs
+            total_len += shard_len
+            for term, df in shard_dfs.items():
+                dfs[term] = dfs.get(term, 0) + df
+        return n_docs, total_len, dfs
+
+    def substring_search(
+        self,
+        text: str,
+        limit: int | None = None,
+        repos: list[str] | None = None,
+        filters: QueryFilters | None = None,
+    ) -> list[tuple[str, str]]:
+        """Returns (repo, sha) pairs whose message contains text (case-insensitive)."""
+        return list(islice(self.iter_substring(text, repos, filters), limit))
+
+    def regex_search(
+        self,
+        pattern: str,
+        limit: int | None = None,
+        repos: list[str] | None = None,
+        filters: QueryFilters | None = None,
+    ) -> list[tuple[str, str]]:
+        """
+        Returns (repo, sha) pairs whose message matches a regex (case-insensitive).
+
+        Raises:
+            re.error: If the pattern does not compile.
+        """
+        return list(islice(self.iter_regex(pattern, repos, filters), limit))
+
+    def iter_substring(
+        self,
+        text: str,
+        repos: list[str] | None = None,
+        filters: QueryFilters | None = None,
+    ) -> Iterator[tuple[str, str]]:
+        """Lazy substring_search: shard by shard (in repo order), as matches are verified."""
+        return self._iter_matches(
+            lambda shard: shard.iter_substring(text, shard.filter_docs(filters)), repos
+        )
+
+    def iter_regex(
+        self,
+        pattern: str,
+        repos: list[str] | None = None,
+        filters: QueryFilters | None = None,
+    ) -> Iterator[tuple[str, str]]:
+        """
+        Lazy regex_search: shard by shard (in repo order), as matches are verified.
+
+        Raises:
+            re.error: If the pattern does not compile.
+        """
+        re.compile(pattern)  # Fail fast, even when no shard is selected
+        return self._iter_matches(
+            lambda shard: shard.iter_regex(pattern, shard.filter_docs(filters)), repos
+        )
+
+    def _iter_matches(self, search, repos) -> Iterator[tuple[str, str]]:
+        for repo, shard in self._select(repos):
+            for sha in search(shard):
+                yield repo, sha
+
+    def _select(self, repos: list[str] | None) -> list[tuple[str, CommitSnapshot]]:
+        """The (repo, shard) pairs a query runs against, in repo order."""
+        names = self.repos if repos is None else sorted(set(repos))
+        return [(repo, self.shards[repo]) for repo in names if repo in self.shards]
+
+
+def _merge_parts(parts: list[tuple]) -> tuple:
+    """
+    Orders the scored docs of several shards by (score desc, repo, doc ID).
+
+    Returns:
+        (order, {repo position: (repo, shard)}, repo positions, docs, scores)
+    """
+    repo_pos = np.concatenate([np.full(len(p[3]), p[0]) for p in parts])
+    docs = np.concatenate([p[3] for p in parts])
+    scores = np.concatenate([p[4] for p in parts])
+    by_pos = {p[0]: (p[1], p[2]) for p in parts}
+    return np.lexsort((docs, repo_pos, -scores)), by_pos, repo_pos, docs, scores
+
+
+def _facet_values(counts) -> list[dict]:
+    return [{"value": value, "count": count} for value, count in counts]
@@ -0,0 +1,465 @@
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from rid_lib.ext.utils import b64_encode
+
+from .facets import commit_metadata
+from .index import is_commit_sha
+from .messages import MessageStore
+from .shards import ShardedCommitIndex, ShardedSnapshot
+from .tokenizer import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the pickled index layout changes; older checkpoints are
+# then ignored and every logged commit is re-indexed from the RID cache
+# instead. The same happens when the checkpoint was built with a different
+# tokenizer pipeline.
+CHECKPOINT_VERSION = 1
+
+# Every checkpoint rewrites the whole index, so once the index is large one
+# is only due after this fraction of it was updated; the bytes written by
+# checkpoints then grow linearly with the number of updates
+CHECKPOINT_GROWTH = 0.25
+
+GITHUB_COMMIT_RID_PREFIX = "orn:github.commit:"
+
+
+def repository_of(rid: str) -> str:
+    """Returns "owner/repo" of a GithubCommit RID string ("orn:github.commit:owner/repo/sha")."""
+    return rid[len(GITHUB_COMMIT_RID_PREFIX) :].rsplit("/", 1)[0]
+
+
+def commit_rid(repo: str, sha: str) -> str:
+    """Returns the GithubCommit RID string of sha in repo ("owner/repo")."""
+    return f"{GITHUB_COMMIT_RID_PREFIX}{repo}/{sha}"
+
+
+class IndexStore:
+    """
+    Durable backing store for the processor's ShardedCommitIndex.
+
+    Every indexed commit is appended to a SQLite commit log (WAL mode), so an
+    update is durable as soon as record() returns. The full in-memory index is
+    periodically checkpointed (pickled, then atomically renamed) together with
+    the log sequence number it covers. On startup the checkpoint is loaded and
+    only log entries written after it are replayed.
+
+    Checkpoints are written by a background thread: the writer only grabs the
+    index's current snapshot under the lock, and the checkpoint thread copies
+    that snapshot's commits into a private index (ShardedCommitIndex.copy)
+    and pickles it, so indexing and stats() never wait for the disk.
+
+    The commit log holds each commit's RID, SHA, manifest hash and metadata,
+    not its message: message text lives only in the index's memory-mapped
+    message log (messages.log), whose covered size the checkpoint records,
+    and in the node's RID cache. Replayed entries re-read their message from
+    the cached bundle; an entry whose cached bundle is missing or has another
+    manifest hash is not replayed, and its hash is forgotten so the next
+    announcement of the commit fetches it again.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        checkpoint_every: int = 5000,
+        checkpoint_seconds: float = 300.0,
+        tokenizer: Tokenizer | None = None,
+        message_preview_chars: int = 0,
+    ):
+        self.tokenizer = tokenizer or Tokenizer()
+        self.message_preview_chars = message_preview_chars
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.directory / "commits.db"
+        self.checkpoint_path = self.directory / "checkpoint.pkl"
+        self.messages_path = self.directory / "messages.log"
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+
+        # Serializes index mutation + log append + checkpointing
+        self.lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS commits (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                rid TEXT NOT NULL UNIQUE,
+                sha TEXT NOT NULL,
+                manifest_hash TEXT,
+                metadata TEXT
+            )
+            """
+        )
+        self._conn.commit()
+
+        self.indexed_hashes: dict[str, str | None] = {}
+        # Commits logged without metadata (or parent SHAs); a rebuild fills
+        # them in
+        self._missing_metadata: set[str] = set()
+        self._checkpoint_seq = 0
+        self._checkpoint_time = 0.0
+        # Cache files modified since then are looked at by reconcile_cache
+        self._reconcile_since = 0.0
+        self._last_seq = 0
+        self._since_checkpoint = 0
+        self._checkpoint_thread: threading.Thread | None = None
+        # Commit manifests dropped by skip_unchanged (bundle fetches avoided)
+        self.skipped_fetches = 0
+
+    def load(self, cache_dir: str) -> ShardedCommitIndex:
+        """
+        Loads the last checkpoint and replays the commit log written after
+        it, reading the replayed commits' messages from the RID cache in
+        cache_dir.
+        """
+        started = time.perf_counter()
+        index = None
+        if self.checkpoint_path.is_file():
+            try:
+                with open(self.checkpoint_path, "rb") as f:
+                    state = pickle.load(f)
+                if state.get("version") != CHECKPOINT_VERSION:
+                    logger.warning(
+                        f"Ignoring index checkpoint with version {state.get('version')} (expected {CHECKPOINT_VERSION})."
+                    )
+                elif state.get("tokenizer") != self.tokenizer.fingerprint:
+                    logger.warning(
+                        "Tokenizer configuration changed since the last checkpoint; "
+                        "re-indexing the full commit log."
+                    )
+                else:
+                    index = state["index"]
+                    # Applies to messages indexed from now on
+                    index.messages.preview_chars = self.message_preview_chars
+                    self._checkpoint_seq = state["seq"]
+                    self._checkpoint_time = self._reconcile_since = state["time"]
+            except Exception as e:
+                logger.error(f"Failed to load index checkpoint {self.checkpoint_path}: {e}")
+        if index is None:
+            messages = MessageStore(self.messages_path, self.message_preview_chars)
+            index = ShardedCommitIndex(tokenizer=self.tokenizer, messages=messages)
+            self._checkpoint_seq = 0
+            # Counts from now: a fresh index is not checkpointed on its first commit
+            self._checkpoint_time = time.time()
+            # ...but every cached bundle may be missing from it
+            self._reconcile_since = 0.0
+
+        self.indexed_hashes = dict(
+            self._conn.execute("SELECT rid, manifest_hash FROM commits")
+        )
+        replayed = stale = 0
+        rows = self._conn.execute(
+            "SELECT rid, sha, manifest_hash, metadata FROM commits WHERE seq > ? ORDER BY seq",
+            (self._checkpoint_seq,),
+        )
+        for rid, sha, manifest_hash, metadata in rows:
+            bundle = self._read_cached(cache_dir, rid)
+            if bundle is None or bundle.get("manifest", {}).get("sha256_hash") != manifest_hash:
+                self.indexed_hashes[rid] = None
+                stale += 1
+                continue
+            message = (bundle.get("contents") or {}).get("message", "")
+            index.add(
+                repository_of(rid), sha, message, json.loads(metadata) if metadata else None
+            )
+            replayed += 1
+        self._missing_metadata = {
+            rid
+            for (rid,) in self._conn.execute(
+                "SELECT rid FROM commits WHERE json_extract(metadata, '$.parents') IS NULL"
+            )
+        }
+        self._last_seq = self._conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM commits"
+        ).fetchone()[0]
+        self._since_checkpoint = replayed
+
+        logger.info(
+            f"Loaded commit index from {self.directory}: {len(index)} commits "
+            f"(checkpoint seq {self._checkpoint_seq}, replayed {replayed} log entries, "
+            f"{stale} without a matching cached bundle) in {time.perf_counter() - started:.2f}s"
+        )
+        return index
+
+    @staticmethod
+    def _read_cached(cache_dir: str, rid: str) -> dict | None:
+        """The raw JSON of a commit's bundle in the RID cache, or None if missing or unreadable."""
+        path = os.path.join(cache_dir, f"{b64_encode(rid)}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read cached bundle of {rid}: {e}")
+            return None
+
+    def skip_unchanged(self, rid: str, manifest_hash: str | None) -> bool:
+        """
+        True if rid is already indexed from a bundle with this manifest hash
+        (and complete metadata), so fetching the bundle again can be
+        skipped; such skips are counted in skipped_fetches.
+        """
+        with self.lock:
+            if (
+                not manifest_hash
+                or self.indexed_hashes.get(rid) != manifest_hash
+                or rid in self._missing_metadata
+            ):
+                return False
+            self.skipped_fetches += 1
+            return True
+
+    def stats(self, index: ShardedCommitIndex) -> dict:
+        """Size of the index and commit log, checkpoint position and skipped fetches."""
+        with self.lock:
+            return {
+                "commits": len(index),
+                "repositories": len(index.repos),
+                "generation": index.generation,
+                "log_seq": self._last_seq,
+                "checkpoint_seq": self._checkpoint_seq,
+                "skipped_fetches": self.skipped_fetches,
+            }
+
+    def record(
+        self,
+        index: ShardedCommitIndex,
+        rid: str,
+        sha: str,
+        message: str,
+        manifest_hash: str | None,
+        metadata: dict | None = None,
+    ) -> None:
+        """Indexes a commit (with its facets.commit_metadata) and appends it to the durable commit log."""
+        metadata = metadata or {}
+        with self.lock:
+            index.add(repository_of(rid), sha, message, metadata)
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO commits (rid, sha, manifest_hash, metadata) VALUES (?, ?, ?, ?)",
+                (rid, sha, manifest_hash, json.dumps(metadata)),
+            )
+            self._conn.commit()
+            self._last_seq = cursor.lastrowid
+            self.indexed_hashes[rid] = manifest_hash
+            self._missing_metadata.discard(rid)
+            self._since_checkpoint += 1
+            self._maybe_checkpoint(index)
+
+    def record_many(
+        self,
+        index: ShardedCommitIndex,
+        partial: ShardedCommitIndex,
+        records: list[tuple],
+    ) -> int:
+        """
+        Merges a partial index into index and appends its commits to the log.
+
+        records are (rid, sha, message, manifest_hash, metadata) tuples
+        describing the commits in partial, in the order they were indexed.
+        Returns the number of commits added or changed.
+        """
+        with self.lock:
+            merged = index.merge(partial)
+            self._log_records(index, records)
+            return merged
+
+    def record_batch(
+        self,
+        index: ShardedCommitIndex,
+        records: list[tuple],
+        term_freqs: list | None = None,
+    ) -> int:
+        """
+        Indexes a batch of commits with one ShardedCommitIndex.add_many call
+        (one published snapshot) and appends them to the log in one
+        transaction.
+
+        records are (rid, sha, message, manifest_hash, metadata) tuples;
+        term_freqs, if given, holds each record's already tokenized message
+        (see CommitIndex.add_many). Returns the number of commits added or
+        changed.
+        """
+        if term_freqs is None:
+            term_freqs = [None] * len(records)
+        with self.lock:
+            changed = index.add_many(
+                [
+                    (repository_of(rid), sha, message, metadata, freqs)
+                    for (rid, sha, message, _manifest_hash, metadata), freqs in zip(records, term_freqs)
+                ]
+            )
+            self._log_records(index, records)
+            return changed
+
+    def _log_records(self, index: ShardedCommitIndex, records: list[tuple]) -> None:
+        """Appends the records not logged with the same manifest hash yet, in one transaction."""
+        changed = [
+            r
+            for r in records
+            if r[0] not in self.indexed_hashes
+            or self.indexed_hashes[r[0]] != r[3]
+            or r[0] in self._missing_metadata
+        ]
+        if not changed:
+            return
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO commits (rid, sha, manifest_hash, metadata) VALUES (?, ?, ?, ?)",
+            [(rid, sha, manifest_hash, json.dumps(metadata)) for rid, sha, _message, manifest_hash, metadata in changed],
+        )
+        self._conn.commit()
+        self._last_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM commits").fetchone()[0]
+        for rid, _sha, _message, manifest_hash, _metadata in changed:
+            self.indexed_hashes[rid] = manifest_hash
+            self._missing_metadata.discard(rid)
+        self._since_checkpoint += len(changed)
+        self._maybe_checkpoint(index)
+
+    def _maybe_checkpoint(self, index: ShardedCommitIndex) -> None:
+        """
+        Starts a background checkpoint after checkpoint_every updates (or a
+        quarter of the index, if that is more) or checkpoint_seconds,
+        whichever comes first, unless one is still being written.
+        """
+        if self._checkpoint_thread is not None and self._checkpoint_thread.is_alive():
+            return
+        if self._since_checkpoint >= max(
+            self.checkpoint_every, int(len(index) * CHECKPOINT_GROWTH)
+        ) or (time.time() - self._checkpoint_time >= self.checkpoint_seconds):
+            self._start_checkpoint(index)
+
+    def checkpoint(self, index: ShardedCommitIndex) -> None:
+        """Checkpoints the latest snapshot of the index and waits until it is on disk."""
+        with self.lock:
+            # The checkpoint thread never takes the lock, so it can be joined here
+            self.wait_for_checkpoint()
+            if self._checkpoint_seq == self._last_seq and self.checkpoint_path.is_file():
+                return
+            thread = self._start_checkpoint(index)
+        thread.join()
+
+    def wait_for_checkpoint(self, timeout: float | None = None) -> None:
+        """Waits for the checkpoint being written in the background, if any."""
+        thread = self._checkpoint_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _start_checkpoint(self, index: ShardedCommitIndex) -> threading.Thread:
+        """Starts writing a checkpoint of the index's current snapshot (called with the lock held)."""
+        now = time.time()
+        self._checkpoint_time = now
+        self._since_checkpoint = 0
+        self._checkpoint_thread = threading.Thread(
+            target=self._write_checkpoint,
+            args=(index, index.snapshot(), self._last_seq, now),
+            name="index-checkpoint",
+            daemon=True,
+        )
+        self._checkpoint_thread.start()
+        return self._checkpoint_thread
+
+    def _write_checkpoint(
+        self, index: ShardedCommitIndex, snapshot: ShardedSnapshot, seq: int, now: float
+    ) -> None:
+        """
+        Atomically writes a copy of snapshot to disk as the checkpoint of
+        commit log entry seq. Runs on the checkpoint thread, without the lock:
+        the writer keeps indexing meanwhile.
+        """
+        started = time.perf_counter()
+        try:
+            frozen = index.copy(snapshot)
+            # Every message the checkpoint points to must be on disk first
+            index.messages.sync()
+            state = {
+                "version": CHECKPOINT_VERSION,
+                "seq": seq,
+                "time": now,
+                "tokenizer": index.tokenizer.fingerprint,
+                "index": frozen,
+            }
+            tmp_path = self.checkpoint_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_path)
+        except Exception as e:
+            logger.error(f"Failed to checkpoint the commit index: {e}", exc_info=True)
+            return
+        self._checkpoint_seq = seq
+        logger.info(
+            f"Checkpointed commit index ({len(frozen)} commits, seq {seq}) "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def reconcile_cache(self, index: ShardedCommitIndex, cache_dir: str) -> int:
+        """
+        Re-indexes cached commit bundles whose manifest hash changed since indexing.
+
+        Only cache files modified after the last checkpoint are opened, so a warm
+        restart does not have to read every bundle. Returns the number of commits
+        re-indexed.
+        """
+        started = time.perf_counter()
+        since = self._reconcile_since
+        checked = reindexed = 0
+        try:
+            entries = os.scandir(cache_dir)
+        except FileNotFoundError:
+            return 0
+        with entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    if entry.stat().st_mtime < since:
+                        continue
+                    with open(entry.path, encoding="utf-8") as f:
+                        bundle = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable cache file {entry.name}: {e}")
+                    continue
+
+                manifest = bundle.get("manifest") or {}
+                rid = manifest.get("rid", "")
+                contents = bundle.get("contents") or {}
+                if not rid.startswith(GITHUB_COMMIT_RID_PREFIX) or not is_commit_sha(
+                    contents.get("sha") or ""
+                ):
+                    continue
+                checked += 1
+                manifest_hash = manifest.get("sha256_hash")
+                if self.indexed_hashes.get(rid) == manifest_hash:
+                    continue
+                self.record(
+                    index,
+                    rid,
+                    contents["sha"],
+                    contents.get("message", ""),
+                    manifest_hash,
+                    commit_metadata(contents),
+                )
+                reindexed += 1
+
+        logger.info(
+            f"Cache reconciliation checked {checked} changed bundles, re-indexed {reindexed} "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return reindexed
+
+    def close(self, index: ShardedCommitIndex) -> None:
+        """Writes a final checkpoint and closes the commit log."""
+        with self.lock:
+            self.checkpoint(index)
+            self._conn.close()
+            index.messages.close()
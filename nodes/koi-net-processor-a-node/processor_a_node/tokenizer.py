@@ -0,0 +1,174 @@
+import logging
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Precompiled patterns (shared by every Tokenizer instance) ---
+
+# Conventional-commit header: "type(scope)!: subject" at the start of the message
+_CONVENTIONAL_RE = re.compile(
+    r"^\s*(?P<type>[A-Za-z]+)(?:\((?P<scope>[^)\s]+)\))?!?:(?:\s|$)", re.ASCII
+)
+# Issue / PR references: "#123", "GH-123", "JIRA-4711", "owner/repo#12"
+_ISSUE_RE = re.compile(
+    r"(?<![\w/])(?:(?P<repo>[\w.-]+/[\w.-]+))?#(?P<num>\d+)\b"
+    r"|\b(?P<key>[A-Z][A-Z0-9]+-\d+)\b",
+    re.ASCII,
+)
+# Words, keeping identifiers and versions joined by . _ - together
+# ("snake_case", "bug-123", "v2.1", "index.py")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+(?:[._-][A-Za-z0-9]+)*")
+# Parts of a compound word: separators and camelCase / ALLCapsWord boundaries
+_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+# Light English suffix stripping, tried in order (first match wins)
+_STEM_RULES = (
+    (re.compile(r"sses$"), "ss"),
+    (re.compile(r"(?<=[a-z]{2})ie[sd]$"), "y"),
+    (re.compile(r"(?<=[a-z]{2}[^aeiou])es$"), ""),
+    (re.compile(r"(?<=[a-z]{2}[^sui])s$"), ""),
+    (re.compile(r"(?<=[a-z]{3})(?:ing|ed|ly)$"), ""),
+)
+# Then undouble a final consonant ("mapping" -> "mapp" -> "map") and drop a
+# final "e", so "parse", "parses", "parsed" and "parsing" share one stem
+_DOUBLE_RE = re.compile(r"(?<=[a-z]{2})([b-df-hj-km-rtv-y])\1$")
+_FINAL_E_RE = re.compile(r"(?<=[a-z]{2}[^e])e$")
+
+DEFAULT_STOP_WORDS = frozenset(
+    """
+    a an and are as at be but by for from has have if in into is it its of on
+    or so such that the their then there these this to was were when which
+    will with
+    """.split()
+)
+
+
+@lru_cache(maxsize=65536)  # commit vocabularies are small; most words repeat
+def stem(word: str) -> str:
+    """Reduces an alphabetic word to a light stem (not necessarily a real word)."""
+    for pattern, replacement in _STEM_RULES:
+        stemmed, n = pattern.subn(replacement, word)
+        if n:
+            word = stemmed
+            break
+    word = _DOUBLE_RE.sub(r"\1", word)
+    return _FINAL_E_RE.sub("", word)
+
+
+class Tokenizer:
+    """
+    Configurable pipeline turning commit messages into index terms.
+
+    Stages (each can be switched off):
+      - conventional: "fix(parser)!: ..." also emits "type:fix" and "scope:parser"
+      - issue_refs: "#123", "owner/repo#12" and "JIRA-4711" become single terms
+      - split_identifiers: "parseHTTPHeader", "snake_case", "v2.1" are indexed
+        whole and as their parts ("parse", "http", "header")
+      - stop_words: drops common English words (True for the built-in list,
+        or an explicit list of words)
+      - stemming: light suffix stripping ("fixes", "fixed", "fixing" -> "fix")
+      - min_length: drops plain words shorter than this (terms produced by the
+        structural stages are always kept)
+
+    The same pipeline must be applied to indexed messages and to queries.
+    Terms are returned in message order, with repeats.
+    """
+
+    def __init__(
+        self,
+        conventional: bool = True,
+        issue_refs: bool = True,
+        split_identifiers: bool = True,
+        stop_words: bool | list[str] = True,
+        stemming: bool = True,
+        min_length: int = 2,
+    ):
+        self.conventional = conventional
+        self.issue_refs = issue_refs
+        self.split_identifiers = split_identifiers
+        if stop_words is True:
+            self.stop_words = DEFAULT_STOP_WORDS
+        else:
+            self.stop_words = frozenset(w.lower() for w in (stop_words or ()))
+        self.stemming = stemming
+        self.min_length = min_length
+
+    @classmethod
+    def from_config(cls, config: dict | None) -> "Tokenizer":
+        """Builds a tokenizer from the processor_a.tokenizer config section."""
+        config = dict(config or {})
+        unknown = config.keys() - {
+            "conventional",
+            "issue_refs",
+            "split_identifiers",
+            "stop_words",
+            "stemming",
+            "min_length",
+        }
+        for key in sorted(unknown):
+            logger.warning(f"Ignoring unknown tokenizer option '{key}'.")
+            del config[key]
+        return cls(**config)
+
+    @property
+    def fingerprint(self) -> str:
+        """Stable description of the pipeline; indexes built with a different one are stale."""
+        return (
+            f"conventional={self.conventional};issue_refs={self.issue_refs};"
+            f"split_identifiers={self.split_identifiers};stemming={self.stemming};"
+            f"min_length={self.min_length};stop_words={','.join(sorted(self.stop_words))}"
+        )
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Tokenizer) and self.fingerprint == other.fingerprint
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint)
+
+    def __repr__(self) -> str:
+        return (
+            f"Tokenizer(conventional={self.conventional}, issue_refs={self.issue_refs}, "
+            f"split_identifiers={self.split_identifiers}, "
+            f"stop_words={len(self.stop_words)} words, stemming={self.stemming}, "
+            f"min_length={self.min_length})"
+        )
+
+    def tokenize(self, text: str) -> list[str]:
+        """Splits text into index terms (with repeats)."""
+        terms = []
+        refs = set()
+        if self.conventional:
+            header = _CONVENTIONAL_RE.match(text)
+            if header:
+                terms.append(f"type:{header['type'].lower()}")
+                if header["scope"]:
+                    terms.append(f"scope:{header['scope'].lower()}")
+        if self.issue_refs and ("#" in text or "-" in text):
+            for ref in _ISSUE_RE.finditer(text):
+                if ref["key"]:
+                    refs.add(ref["key"])
+                    terms.append(ref["key"].lower())
+                else:
+                    terms.append(f"#{ref['num']}")
+                    if ref["repo"]:
+                        terms.append(f"{ref['repo'].lower()}#{ref['num']}")
+
+        for match in _WORD_RE.finditer(text):
+            word = match.group()
+            if not self.split_identifiers:
+                self._add_word(terms, word.lower())
+                continue
+            parts = _PART_RE.findall(word)
+            if len(parts) > 1 and word not in refs:
+                terms.append(word.lower())
+            for part in parts:
+                self._add_word(terms, part.lower())
+        return terms
+
+    def _add_word(self, terms: list[str], word: str) -> None:
+        if len(word) < self.min_length or word in self.stop_words:
+            return
+        if self.stemming and word.isalpha():
+            word = stem(word)
+        terms.append(word)
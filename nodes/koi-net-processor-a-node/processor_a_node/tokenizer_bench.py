@@ -0,0 +1,117 @@
+"""
+Micro-benchmark for the commit message tokenizer.
+
+Runs every pipeline configuration over the same messages and reports
+tokens/second, so the cost of each stage can be compared:
+
+    python -m processor_a_node.tokenizer_bench
+    python -m processor_a_node.tokenizer_bench --cache-dir .koi/processor-a/cache
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from itertools import islice
+
+from .tokenizer import Tokenizer
+
+# Each configuration enables one more stage than the previous one
+PIPELINES = {
+    "words": dict(
+        conventional=False,
+        issue_refs=False,
+        split_identifiers=False,
+        stop_words=False,
+        stemming=False,
+    ),
+    "+split_identifiers": dict(
+        conventional=False, issue_refs=False, stop_words=False, stemming=False
+    ),
+    "+conventional+issue_refs": dict(stop_words=False, stemming=False),
+    "+stop_words": dict(stemming=False),
+    "+stemming (default)": dict(),
+}
+
+_SAMPLE_MESSAGES = [
+    "fix(parser): handle parseHTTPHeader for snake_case ids (#{n})",
+    "feat!: drop support for Python 3.8, bump version to v2.{n}.0",
+    "Merge pull request #{n} from koi-net/feature/fetch-coalescer",
+    "Fixes racing conditions in the file watcher; see BUG-{n}",
+    "docs: update README with the new search endpoints and examples",
+    "refactor(index): replace dict postings with sorted arrays for {n} terms",
+    "chore(deps): bump numpy from 1.26.{n} to 2.0.0 in /nodes/processor-a",
+    "Added retries to fetchBundles when the sensor returns HTTP 503",
+]
+
+
+def legacy_tokenize(message: str) -> list[str]:
+    """The original whitespace tokenizer, kept as the benchmark baseline."""
+    return [
+        keyword
+        for keyword in message.lower().split()
+        if len(keyword) > 3 and keyword.isalnum()
+    ]
+
+
+def synthetic_messages(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        rng.choice(_SAMPLE_MESSAGES).format(n=rng.randint(1, 9999))
+        for _ in range(count)
+    ]
+
+
+def cached_messages(cache_dir: str, count: int) -> list[str]:
+    """Reads commit messages from bundles in a local RID cache."""
+    messages = []
+    with os.scandir(cache_dir) as entries:
+        for entry in islice((e for e in entries if e.name.endswith(".json")), count):
+            with open(entry.path, encoding="utf-8") as f:
+                contents = json.load(f).get("contents") or {}
+            if contents.get("message"):
+                messages.append(contents["message"])
+    return messages
+
+
+def bench(tokenize, messages: list[str], repeat: int) -> tuple[int, float]:
+    """Returns (tokens per pass, best seconds per pass)."""
+    best = float("inf")
+    tokens = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        tokens = sum(len(tokenize(message)) for message in messages)
+        best = min(best, time.perf_counter() - started)
+    return tokens, best
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="processor_a_node.tokenizer_bench")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages per pass")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes per pipeline (best is reported)")
+    parser.add_argument("--cache-dir", help="Benchmark on cached commit bundles instead of synthetic messages")
+    args = parser.parse_args()
+
+    if args.cache_dir:
+        messages = cached_messages(args.cache_dir, args.messages)
+    else:
+        messages = synthetic_messages(args.messages)
+    if not messages:
+        raise SystemExit("No messages to benchmark.")
+
+    pipelines = {"legacy (split + isalnum)": legacy_tokenize}
+    for name, options in PIPELINES.items():
+        pipelines[name] = Tokenizer(**options).tokenize
+
+    print(f"{len(messages)} messages, best of {args.repeat} passes")
+    print(f"{'pipeline':<28} {'tokens':>9} {'msgs/s':>11} {'tokens/s':>12}")
+    for name, tokenize in pipelines.items():
+        tokens, seconds = bench(tokenize, messages, args.repeat)
+        print(
+            f"{name:<28} {tokens:>9} {len(messages) / seconds:>11,.0f} {tokens / seconds:>12,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
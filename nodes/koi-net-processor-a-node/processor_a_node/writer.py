@@ -0,0 +1,143 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from .shards import ShardedCommitIndex
+from .store import IndexStore
+
+logger = logging.getLogger(__name__)
+
+# Queue markers: apply the current batch now / stop the writer thread
+_FLUSH = object()
+_STOP = object()
+
+
+class IndexWriter:
+    """
+    Applies indexed commits to the live index in micro-batches.
+
+    Commits are tokenized by submit(), in the submitting thread, and queued
+    as (rid, sha, message, manifest_hash, metadata) records with their term
+    frequencies. A writer thread collects them until batch_size are waiting
+    or max_latency seconds have passed since the first of them, and applies
+    each batch with IndexStore.record_batch: every term's postings are
+    extended once per shard, one index generation is published and the
+    commit log is appended in one transaction, for the whole batch. A
+    commit is searchable (and durable) once its batch is applied.
+
+    The queue holds at most queue_size commits; submit() blocks while it is
+    full, so producers are slowed down to the writer's pace.
+    """
+
+    def __init__(
+        self,
+        index: ShardedCommitIndex,
+        store: IndexStore,
+        batch_size: int = 500,
+        max_latency: float = 0.25,
+        queue_size: int | None = None,
+    ):
+        self.index = index
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.max_latency = max_latency
+        self.batches = 0
+        self.commits = 0
+        self._queue: queue.Queue = queue.Queue(queue_size or 4 * self.batch_size)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def submit(
+        self,
+        rid: str,
+        sha: str,
+        message: str,
+        manifest_hash: str | None,
+        metadata: dict | None = None,
+    ) -> None:
+        """Tokenizes a commit (with its facets.commit_metadata) and queues it for the next batch."""
+        self._start()
+        term_freqs = Counter(self.index.tokenizer.tokenize(message))
+        self._queue.put(((rid, sha, message, manifest_hash, metadata or {}), term_freqs))
+
+    def flush(self) -> None:
+        """Applies every commit submitted so far without waiting out the batch latency."""
+        if self._thread is None:
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Applies what is still queued, then stops the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Batches applied, commits applied and commits waiting."""
+        return {"batches": self.batches, "commits": self.commits, "queued": self._queue.qsize()}
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="index-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            taken = 1
+            deadline = time.monotonic() + self.max_latency
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if item is _FLUSH:
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        item = self._queue.get(timeout=timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+            if stopping:
+                # Everything queued before stop() still gets applied
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    taken += 1
+                    if item is not _STOP and item is not _FLUSH:
+                        batch.append(item)
+            try:
+                if batch:
+                    self._apply(batch)
+            except Exception as e:
+                logger.error(f"Failed to apply a batch of {len(batch)} commits: {e}", exc_info=True)
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    def _apply(self, batch: list[tuple]) -> None:
+        started = time.perf_counter()
+        changed = self.store.record_batch(
+            self.index, [record for record, _ in batch], [term_freqs for _, term_freqs in batch]
+        )
+        self.batches += 1
+        self.commits += len(batch)
+        logger.info(
+            f"Indexed {len(batch)} commits ({changed} added/changed) in one batch "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms; index has {len(self.index)} commits"
+        )
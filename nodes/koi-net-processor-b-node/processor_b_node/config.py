@@ -78,6 +78,10 @@ COORDINATOR_URL = EDGES_CONFIG.get("coordinator_url")  # Should be defined in ya
 # Optional specific sensor RID
 HACKMD_SENSOR_RID: str | None = PROCESSOR_B_CONFIG.get("hackmd_sensor_rid")
 
+# Search results per page: default and largest allowed limit
+SEARCH_DEFAULT_LIMIT: int = PROCESSOR_B_CONFIG.get("search_default_limit", 20)
+SEARCH_MAX_LIMIT: int = PROCESSOR_B_CONFIG.get("search_max_limit", 500)
+
 # Determine Cache Dir
 # Prioritize environment variable, then YAML, then fallback
 env_cache_dir = os.getenv("RID_CACHE_DIR")
@@ -100,6 +104,14 @@ else:
 # Ensure the resolved CACHE_DIR exists
 Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
 
+# Persistent note metadata + index checkpoints; lives on the state volume in Docker
+INDEX_DIR: str = PROCESSOR_B_CONFIG.get("index_dir", str(LOCAL_DATA_BASE / "index"))
+# Checkpoint the in-memory index after this many indexed notes or seconds, whichever comes first
+INDEX_CHECKPOINT_EVERY: int = PROCESSOR_B_CONFIG.get("index_checkpoint_every", 1000)
+INDEX_CHECKPOINT_SECONDS: float = PROCESSOR_B_CONFIG.get(
+    "index_checkpoint_seconds", 300
+)
+
 # --- Update Logging Level Based on Config ---
 try:
     logging.getLogger().setLevel(LOG_LEVEL.upper())
@@ -121,6 +133,11 @@ logger.info(f"  Runtime Port: {PORT}")
 logger.info(f"  Cache Dir: {CACHE_DIR}")
 logger.info(f"  Coordinator URL: {COORDINATOR_URL}")
 logger.info(f"  Specific HackMD Sensor RID: {HACKMD_SENSOR_RID or 'Not Set'}")
+logger.info(f"  Search Limit (default/max): {SEARCH_DEFAULT_LIMIT}/{SEARCH_MAX_LIMIT}")
+logger.info(f"  Index Dir: {INDEX_DIR}")
+logger.info(
+    f"  Index Checkpoint: every {INDEX_CHECKPOINT_EVERY} notes / {INDEX_CHECKPOINT_SECONDS}s"
+)
 
 # Check required config
 if not BASE_URL:
@@ -2,8 +2,8 @@ import logging
 
 from .core import node
 from koi_net.processor import ProcessorInterface
-from koi_net.processor.handler import HandlerType
-from koi_net.processor.knowledge_object import KnowledgeObject, KnowledgeSource
+from koi_net.processor.handler import HandlerType, STOP_CHAIN
+from koi_net.processor.knowledge_object import KnowledgeObject
 from koi_net.protocol.node import NodeProfile
 from koi_net.protocol.event import EventType
 from koi_net.protocol.edge import EdgeType
@@ -12,17 +12,31 @@ from rid_lib.types import KoiNetNode, KoiNetEdge
 from rid_types.hackmd import HackMDNote
 
 # Import config to potentially check for specific sensor RID
-from .config import HACKMD_SENSOR_RID
+from .config import (
+    CACHE_DIR,
+    HACKMD_SENSOR_RID,
+    INDEX_CHECKPOINT_EVERY,
+    INDEX_CHECKPOINT_SECONDS,
+    INDEX_DIR,
+    SEARCH_DEFAULT_LIMIT,
+)
+from .store import NoteStore
 
 
 logger = logging.getLogger(__name__)
 
-# Simple in-memory index (as defined in Processor.md)
-# Structure:
-# search_index = { "tag": [rid_str1, rid_str2], "title_word": [rid_str1, rid_str3], note_id: [rid_str] }
+# In-memory note index: note IDs and tags as exact keys, title and markdown
+# content words as positional postings, and per-note sort keys (see
+# index.NoteIndex). Restored from the last on-disk checkpoint plus the notes
+# stored after it, re-indexed from the RID cache (see store.NoteStore)
+note_store = NoteStore(
+    INDEX_DIR,
+    checkpoint_every=INDEX_CHECKPOINT_EVERY,
+    checkpoint_seconds=INDEX_CHECKPOINT_SECONDS,
+)
+search_index = note_store.load(CACHE_DIR)
 # note_metadata = { rid_str: {"title": title, "tags": tags, "lastChangedAt": ts}}
-search_index = {}
-note_metadata = {}
+note_metadata = note_store.metadata
 
 
 # --- Network Handlers ---
@@ -95,7 +109,11 @@ def handle_network_discovery(processor: ProcessorInterface, kobj: KnowledgeObjec
 # --- Manifest Handler ---
 @node.processor.register_handler(HandlerType.Manifest, rid_types=[HackMDNote])
 def handle_note_manifest(processor: ProcessorInterface, kobj: KnowledgeObject):
-    """Handles incoming note manifests, triggers bundle fetch for indexing."""
+    """
+    Handles incoming note manifests. Notes already indexed with the same
+    manifest hash stop here; for the others the pipeline fetches the bundle
+    (if the event did not carry it) and handle_note_bundle indexes it.
+    """
     if HackMDNote == object:
         logger.error("HackMDNote type not properly imported. Cannot process manifests.")
         return
@@ -108,14 +126,11 @@ def handle_note_manifest(processor: ProcessorInterface, kobj: KnowledgeObject):
     rid: HackMDNote = kobj.rid
     logger.info(f"Received manifest for HackMD note: {rid.reference}")
 
-    # PRD: Always dereference notes for indexing.
-    logger.debug(f"Requesting bundle for {rid} for indexing.")
-    try:
-        processor.handle(
-            rid=rid, source=KnowledgeSource.External
-        )  # Trigger bundle fetch
-    except Exception as e:
-        logger.error(f"Error requesting bundle for {rid}: {e}", exc_info=True)
+    # Sensor polls and restarts resend manifests of notes we already indexed;
+    # only a changed hash is worth a download and a re-index
+    if note_store.skip_unchanged(str(rid), manifest.sha256_hash):
+        logger.debug(f"Note {rid} already indexed with hash {manifest.sha256_hash}; skipping.")
+        return STOP_CHAIN
 
 
 # --- Bundle Handler ---
@@ -142,87 +157,55 @@ def handle_note_bundle(processor: ProcessorInterface, kobj: KnowledgeObject):
 
     logger.info(f"Processing bundle for note: {note_id} - '{title}'")
 
-    # --- Check Timestamp to Avoid Re-indexing ---
+    # --- Update Search Index and Stored Metadata ---
+    # Replaces the note's previous postings: its ID and tags as exact keys,
+    # title and markdown content words with their positions. A note whose
+    # title and content are unchanged (tags/lastChangedAt only) is not
+    # re-tokenized. Stores its manifest hash, so the manifest handler skips
+    # the note until it changes, across restarts too
     last_changed = contents.get("lastChangedAt")
-    if rid_str in note_metadata and last_changed == note_metadata[rid_str].get(
-        "lastChangedAt"
-    ):
-        logger.debug(
-            f"Note {note_id} has not changed ({last_changed}) since last index. Skipping."
-        )
-        return
-
-    # --- Update Metadata Cache ---
-    current_tags = contents.get("tags", [])
-    note_metadata[rid_str] = {
-        "title": title,
-        "tags": current_tags,
-        "lastChangedAt": last_changed,
-    }
-
-    # --- Update Search Index (Example: Tags, Title words, Note ID) ---
-    # Clear old index entries for this note first
-    for key, rid_list in list(search_index.items()):
-        if isinstance(rid_list, list) and rid_str in rid_list:
-            search_index[key].remove(rid_str)
-            # Remove key if list becomes empty after removing the RID
-            if not search_index[key]:
-                del search_index[key]
-
-    # Index by tags
-    for tag in current_tags:
-        tag_key = tag.lower()  # Case-insensitive tag indexing
-        if tag_key not in search_index:
-            search_index[tag_key] = []
-        # Avoid adding duplicates if somehow the clear logic failed
-        if rid_str not in search_index[tag_key]:
-            search_index[tag_key].append(rid_str)
-
-    # Index by title words
-    for word in title.lower().split():
-        if len(word) > 2:  # Basic filtering
-            if word not in search_index:
-                search_index[word] = []
-            if rid_str not in search_index[word]:
-                search_index[word].append(rid_str)
-
-    # Index by note ID itself for direct lookup
-    note_id_key = note_id  # Use the actual note ID as the key
-    if note_id_key not in search_index:
-        search_index[note_id_key] = []
-    if rid_str not in search_index[note_id_key]:
-        search_index[note_id_key].append(rid_str)
-
-    # Note: Markdown content parsing is omitted as per simplified scope.
-    # md_content = contents.get("content", "")
-    # If implemented, parse md_content and add relevant keywords/entities to search_index.
+    current_tags = contents.get("tags") or []
+    md_content = contents.get("content") or ""
+    word_count = note_store.record(
+        search_index,
+        rid_str,
+        note_id,
+        kobj.manifest.sha256_hash if kobj.manifest else None,
+        title,
+        current_tags,
+        md_content,
+        last_changed,
+    )
 
     logger.debug(
-        f"Updated search index for note {note_id}. Index size (keys): {len(search_index)}"
+        f"Updated search index for note {note_id}: {word_count} words tokenized. "
+        f"Index: {len(search_index)} notes, {search_index.term_count} terms"
     )
 
 
 # --- Helper for Search Endpoint ---
-def query_note_index(query: str) -> list:
-    """Queries the in-memory note search index."""
-    results_rids = set()  # Use a set to automatically handle duplicates
-    query_lower = query.lower()
-
-    # 1. Check if query is a direct Note ID match
-    if query in search_index and isinstance(search_index[query], list):
-        results_rids.update(search_index[query])
-
-    # 2. Check if query matches a tag (case-insensitive)
-    if query_lower in search_index and isinstance(search_index[query_lower], list):
-        results_rids.update(search_index[query_lower])
-
-    # 3. Check if query matches a title word (case-insensitive)
-    if query_lower in search_index and isinstance(search_index[query_lower], list):
-        results_rids.update(search_index[query_lower])
-
-    # Format results using metadata cache
+def query_note_index(
+    query: str,
+    order: str = "title",
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    Queries the in-memory note search index: notes whose ID or a tag is the
+    query, or matching it as a boolean query over title and content words
+    (see query.parse_query: implicit AND, OR, NOT / -word, "phrases",
+    groups). Returns one page of results in the given order (see
+    index.SEARCH_ORDERS) and the cursor of the next page, if any.
+
+    Raises:
+        ValueError: If order is unknown, the cursor is malformed or the
+            query nests too deep.
+    """
+    rids, next_cursor = search_index.search(query, order, limit, cursor)
+
+    # Format the page using metadata cache
     results = []
-    for rid_str in results_rids:
+    for rid_str in rids:
         meta = note_metadata.get(rid_str, {})  # Get cached metadata
         results.append(
             {
@@ -231,11 +214,7 @@ def query_note_index(query: str) -> list:
                 "tags": meta.get("tags", []),
             }
         )
-
-    # Optional: Sort results, e.g., alphabetically by title
-    results.sort(key=lambda x: x.get("title", "").lower())
-
-    return results
+    return results, next_cursor
 
 
 logger.info("Processor B handlers registered.")
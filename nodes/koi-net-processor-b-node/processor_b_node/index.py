@@ -0,0 +1,478 @@
+import base64
+import bisect
+import hashlib
+import heapq
+import json
+import logging
+import math
+import threading
+from array import array
+from datetime import datetime
+from itertools import chain
+
+from .query import And, Not, Or, Phrase, parse_query
+from .suggest import PrefixSuggester
+from .tokenizer import markdown_terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Result orderings: title (A-Z), lastChangedAt (newest first), relevance (BM25)
+SEARCH_ORDERS = ("title", "lastChangedAt", "relevance")
+
+# BM25 parameters of the relevance order
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Added to the relevance of notes whose ID or a tag is the whole query
+KEY_MATCH_BOOST = 100.0
+
+
+def parse_timestamp(value) -> float:
+    """
+    Seconds since the epoch of a note's lastChangedAt: epoch milliseconds
+    (as the HackMD API returns it, number or numeric string) or an ISO 8601
+    string. Returns 0.0 if missing or unparseable.
+    """
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            try:
+                return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                return 0.0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000.0
+    return 0.0
+
+
+def encode_cursor(order: str, key, doc: int) -> str:
+    """Encodes the sort key of the last returned note as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps([order, key, doc]).encode()).decode()
+
+
+def decode_cursor(cursor: str, order: str) -> tuple:
+    """
+    Decodes a cursor produced by encode_cursor into the (key, doc) sort key
+    of the note it ended at.
+
+    Raises:
+        ValueError: If the cursor is malformed or was made for another order.
+    """
+    try:
+        cursor_order, key, doc = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        doc = int(doc)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if cursor_order != order:
+        raise ValueError(f"Cursor is for order {cursor_order!r}, not {order!r}")
+    # Sort keys are title strings or (negated) timestamps / scores
+    if order == "title":
+        valid = isinstance(key, str)
+    else:
+        valid = isinstance(key, (int, float)) and not isinstance(key, bool)
+    if not valid:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return key, doc
+
+
+# --- Sorted doc ID list operations ---
+
+
+def intersect(a: array, b: array) -> array:
+    """Doc IDs in both sorted a and b; each doc of the shorter is bisected for in the longer."""
+    if len(a) > len(b):
+        a, b = b, a
+    result = array("I")
+    lo, end = 0, len(b)
+    for doc in a:
+        lo = bisect.bisect_left(b, doc, lo)
+        if lo == end:
+            break
+        if b[lo] == doc:
+            result.append(doc)
+    return result
+
+
+def unite(lists: list[array]) -> array:
+    """Doc IDs in any of the sorted lists."""
+    lists = [docs for docs in lists if docs]
+    if not lists:
+        return array("I")
+    if all(docs is lists[0] for docs in lists):
+        return lists[0]
+    return array("I", sorted(set().union(*lists)))
+
+
+def subtract(a: array, b: array) -> array:
+    """Doc IDs of sorted a not in sorted b."""
+    if not b:
+        return a
+    result = array("I")
+    lo, end = 0, len(b)
+    for doc in a:
+        lo = bisect.bisect_left(b, doc, lo)
+        if lo == end or b[lo] != doc:
+            result.append(doc)
+    return result
+
+
+class _Positions:
+    """Sorted doc IDs of one term, each with the (ascending) positions of the term in the doc."""
+
+    __slots__ = ("docs", "positions")
+
+    def __init__(self):
+        self.docs = array("I")
+        self.positions: list[array] = []
+
+    def add(self, doc: int, positions: array) -> None:
+        i = bisect.bisect_left(self.docs, doc)
+        self.docs.insert(i, doc)
+        self.positions.insert(i, positions)
+
+    def remove(self, doc: int) -> None:
+        i = bisect.bisect_left(self.docs, doc)
+        if i < len(self.docs) and self.docs[i] == doc:
+            del self.docs[i]
+            del self.positions[i]
+
+    def get(self, doc: int) -> array | None:
+        """Positions of the term in doc, or None if doc does not contain it."""
+        i = bisect.bisect_left(self.docs, doc)
+        if i < len(self.docs) and self.docs[i] == doc:
+            return self.positions[i]
+        return None
+
+
+class NoteIndex:
+    """
+    In-memory search index of HackMD notes.
+
+    Each note gets a small integer doc ID, kept when it is re-indexed. There
+    are two kinds of postings:
+      - keys: exact lookup keys (the note ID and its lowercased tags) ->
+        sorted doc IDs
+      - terms: words of the title and markdown content (see
+        tokenizer.markdown_terms) -> sorted doc IDs, each with the positions
+        of the word in the note, so phrase queries can check adjacency.
+        Title and content are numbered as one stream with a gap between
+        them, so a phrase never spans the two.
+
+    Title words and tags also feed a PrefixSuggester for type-ahead,
+    updated with every (re-)indexed or removed note.
+
+    A digest of each note's title and content is kept, so re-indexing a
+    note whose text did not change (a tag or lastChangedAt bump) skips
+    tokenization and only updates its keys, suggestions and sort keys.
+
+    Every method takes the index lock: the koi-net processor thread indexes
+    while the API thread searches. The index pickles without it (see
+    store.NoteStore checkpoints).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rids: list[str | None] = []
+        # Sort keys per doc, computed at index time
+        self._title_keys: list[str] = []
+        self._changed_keys = array("d")  # -lastChangedAt: newest first
+        self._doc_len = array("I")
+        self._total_len = 0
+        self._docs: dict[str, int] = {}
+        self._keys: dict[str, array] = {}
+        self._terms: dict[str, _Positions] = {}
+        # Forward index (doc -> its keys / distinct terms), to unindex a note
+        self._doc_keys: dict[int, list[str]] = {}
+        self._doc_terms: dict[int, list[str]] = {}
+        self._doc_suggestions: dict[int, dict[str, None]] = {}
+        self._doc_digests: dict[int, bytes] = {}
+        self._suggester = PrefixSuggester()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of indexed notes."""
+        return len(self._docs)
+
+    @property
+    def term_count(self) -> int:
+        """Number of distinct title/content terms."""
+        return len(self._terms)
+
+    def add(
+        self,
+        rid: str,
+        note_id: str,
+        title: str,
+        tags: list[str],
+        content: str,
+        last_changed=None,
+    ) -> int:
+        """
+        Indexes (or re-indexes) a note, replacing its previous postings.
+        last_changed is its lastChangedAt (see parse_timestamp). Returns the
+        number of title and content words tokenized: 0 if the note was
+        already indexed with the same title and content.
+        """
+        digest = hashlib.blake2b(
+            f"{title}\0{content}".encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        keys = list(dict.fromkeys([note_id, *(tag.lower() for tag in tags)]))
+        suggestions = dict.fromkeys([*tokenize(title), *(tag.lower() for tag in tags)])
+
+        with self._lock:
+            doc = self._docs.get(rid)
+            if doc is not None and self._doc_digests.get(doc) == digest:
+                self._unindex_keys(doc)
+                self._index_keys(doc, keys, suggestions)
+                self._changed_keys[doc] = -parse_timestamp(last_changed)
+                return 0
+
+        positions: dict[str, array] = {}
+        words = chain(tokenize(title), [None], markdown_terms(content))
+        count = 0
+        for position, term in enumerate(words):
+            if term is None:  # the gap between title and content
+                continue
+            term_positions = positions.get(term)
+            if term_positions is None:
+                positions[term] = array("I", [position])
+            else:
+                term_positions.append(position)
+            count += 1
+
+        with self._lock:
+            doc = self._docs.get(rid)
+            if doc is None:
+                doc = self._docs[rid] = len(self._rids)
+                self._rids.append(rid)
+                self._title_keys.append("")
+                self._changed_keys.append(0.0)
+                self._doc_len.append(0)
+            else:
+                self._unindex(doc)
+            self._title_keys[doc] = title.casefold()
+            self._changed_keys[doc] = -parse_timestamp(last_changed)
+            self._doc_len[doc] = count
+            self._total_len += count
+            for term, term_positions in positions.items():
+                postings = self._terms.get(term)
+                if postings is None:
+                    postings = self._terms[term] = _Positions()
+                postings.add(doc, term_positions)
+            self._index_keys(doc, keys, suggestions)
+            self._doc_terms[doc] = list(positions)
+            self._doc_digests[doc] = digest
+        return count
+
+    def remove(self, rid: str) -> bool:
+        """Unindexes a note. Returns False if it was not indexed."""
+        with self._lock:
+            doc = self._docs.pop(rid, None)
+            if doc is None:
+                return False
+            self._unindex(doc)
+            self._suggester.remove(self._doc_suggestions.pop(doc, []))
+            self._doc_digests.pop(doc, None)
+            self._rids[doc] = None
+            return True
+
+    def lookup(self, key: str) -> list[str]:
+        """RIDs of the notes with this exact note ID or (lowercased) tag."""
+        with self._lock:
+            return [self._rids[doc] for doc in self._keys.get(key, ())]
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[tuple[str, int]]:
+        """
+        Title words and tags starting with prefix (lowercased), as (term,
+        number of notes) pairs, most common first.
+        """
+        with self._lock:
+            return self._suggester.suggest(prefix.lower(), limit)
+
+    def search(
+        self,
+        query: str,
+        order: str = "title",
+        limit: int = 20,
+        cursor: str | None = None,
+    ) -> tuple[list[str], str | None]:
+        """
+        One page of the notes whose ID or a (lowercased) tag is the whole
+        query, or that match it as a boolean query (see query.parse_query),
+        in one of SEARCH_ORDERS. Ties are broken by doc ID.
+
+        Only the sort keys precomputed at index time (and, for relevance,
+        each note's BM25 score over the query's non-negated words) are
+        looked at; the page is picked with a heap of limit + 1 entries, so a
+        page costs O(matches * log(limit)) rather than a full sort. Pass the
+        returned cursor to get the next page.
+
+        Returns:
+            ([rid, ...], next_cursor or None)
+
+        Raises:
+            ValueError: If order is unknown, the cursor is malformed or
+                made for another order, or the query nests too deep.
+        """
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"Unknown order {order!r}, expected one of {', '.join(SEARCH_ORDERS)}")
+        after = decode_cursor(cursor, order) if cursor else None
+        parsed = parse_query(query)
+        with self._lock:
+            key_docs = unite(
+                [self._keys.get(query, array("I")), self._keys.get(query.lower(), array("I"))]
+            )
+            docs = key_docs if parsed is None else unite([key_docs, self._evaluate(parsed, None)])
+            keyed = zip(map(self._sort_key(order, parsed, key_docs), docs), docs)
+            if after is not None:
+                keyed = filter(after.__lt__, keyed)
+            page = heapq.nsmallest(limit + 1, keyed)
+            next_cursor = encode_cursor(order, *page[limit - 1]) if len(page) > limit else None
+            return [self._rids[doc] for _, doc in page[:limit]], next_cursor
+
+    def match(self, query) -> list[str]:
+        """RIDs of the notes matching a query.parse_query tree, in doc ID order."""
+        with self._lock:
+            return [self._rids[doc] for doc in self._evaluate(query, None)]
+
+    def _evaluate(self, node, candidates: array | None) -> array:
+        """
+        Sorted doc IDs matching a query node, among candidates (sorted doc
+        IDs) if given: every node only looks at the docs that can still
+        match, so an AND costs about as much as its rarest part.
+        """
+        if isinstance(node, Phrase):
+            return self._phrase_docs(node.words, candidates)
+        if isinstance(node, Or):
+            return unite([self._evaluate(part, candidates) for part in node.parts])
+        if isinstance(node, Not):
+            if candidates is None:
+                candidates = array("I", sorted(self._docs.values()))
+            return subtract(candidates, self._evaluate(node.part, candidates))
+        # And: rarest part first, each later one restricted to the docs
+        # matched so far; negations last, once the candidates are fewest
+        parts = sorted(
+            node.parts, key=lambda part: (isinstance(part, Not), self._estimate(part))
+        )
+        for part in parts:
+            candidates = self._evaluate(part, candidates)
+            if not candidates:
+                break
+        return candidates
+
+    def _sort_key(self, order: str, query, key_docs: array):
+        """The ascending sort key function (doc -> key) of an order."""
+        if order == "title":
+            return self._title_keys.__getitem__
+        if order == "lastChangedAt":
+            return self._changed_keys.__getitem__
+
+        # relevance: BM25 over the query's words that are not negated
+        scored = []
+        for word in dict.fromkeys(_positive_words(query)):
+            postings = self._terms.get(word)
+            if postings is not None:
+                df = len(postings.docs)
+                scored.append((postings, math.log(1 + (len(self._docs) - df + 0.5) / (df + 0.5))))
+        avg_len = self._total_len / len(self._docs) if self._docs else 1.0
+        key_matches = set(key_docs)
+        doc_len = self._doc_len
+
+        def negative_score(doc: int) -> float:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[doc] / (avg_len or 1.0))
+            score = KEY_MATCH_BOOST if doc in key_matches else 0.0
+            for postings, idf in scored:
+                positions = postings.get(doc)
+                if positions is not None:
+                    tf = len(positions)
+                    score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+            return -score
+
+        return negative_score
+
+    def _estimate(self, node) -> int:
+        """Upper bound of the number of docs matching a query node, from posting lengths."""
+        if isinstance(node, Phrase):
+            return min(
+                len(self._terms[word].docs) if word in self._terms else 0 for word in node.words
+            )
+        if isinstance(node, And):
+            return min(self._estimate(part) for part in node.parts)
+        if isinstance(node, Or):
+            return sum(self._estimate(part) for part in node.parts)
+        return len(self._docs)
+
+    def _phrase_docs(self, words: list[str], candidates: array | None) -> array:
+        """Sorted doc IDs (among candidates, if given) containing words consecutively."""
+        postings = [self._terms.get(word) for word in words]
+        if any(p is None for p in postings):
+            return array("I")
+        # The rarest word yields the docs to check; the others are probed
+        order = sorted(range(len(words)), key=lambda i: len(postings[i].docs))
+        rarest = postings[order[0]]
+        docs = rarest.docs if candidates is None else intersect(candidates, rarest.docs)
+        if len(words) == 1:
+            return docs
+        matches = array("I")
+        for doc in docs:
+            # Start positions of the phrase consistent with every word so far
+            starts = {p - order[0] for p in rarest.get(doc)}
+            for i in order[1:]:
+                positions = postings[i].get(doc)
+                if positions is None:
+                    break
+                starts.intersection_update(p - i for p in positions)
+                if not starts:
+                    break
+            else:
+                matches.append(doc)
+        return matches
+
+    def _index_keys(self, doc: int, keys: list[str], suggestions: dict[str, None]) -> None:
+        for key in keys:
+            docs = self._keys.get(key)
+            if docs is None:
+                docs = self._keys[key] = array("I")
+            bisect.insort(docs, doc)
+        # Only the title words and tags that changed are re-counted
+        previous = self._doc_suggestions.get(doc, {})
+        self._suggester.remove([term for term in previous if term not in suggestions])
+        self._suggester.add([term for term in suggestions if term not in previous])
+        self._doc_keys[doc] = keys
+        self._doc_suggestions[doc] = suggestions
+
+    def _unindex_keys(self, doc: int) -> None:
+        for key in self._doc_keys.pop(doc, ()):
+            docs = self._keys[key]
+            i = bisect.bisect_left(docs, doc)
+            if i < len(docs) and docs[i] == doc:
+                del docs[i]
+            if not docs:
+                del self._keys[key]
+
+    def _unindex(self, doc: int) -> None:
+        self._total_len -= self._doc_len[doc]
+        self._doc_len[doc] = 0
+        self._unindex_keys(doc)
+        for term in self._doc_terms.pop(doc, ()):
+            postings = self._terms[term]
+            postings.remove(doc)
+            if not postings.docs:
+                del self._terms[term]
+
+
+def _positive_words(node) -> list[str]:
+    """Words of a query tree outside any Not (those that can add to a note's relevance)."""
+    if node is None or isinstance(node, Not):
+        return []
+    if isinstance(node, Phrase):
+        return node.words
+    return [word for part in node.parts for word in _positive_words(part)]
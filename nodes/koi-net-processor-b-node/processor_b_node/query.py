@@ -0,0 +1,156 @@
+import re
+
+from .tokenizer import tokenize
+
+# Query syntax tokens: parentheses, "quoted phrases" (closing quote
+# optional), a leading "-" negating the next operand, and bare words
+_QUERY_TOKEN_RE = re.compile(
+    r'(?P<open>\()|(?P<close>\))|"(?P<phrase>[^"]*)"?|(?P<minus>-)(?=[^\s-])|(?P<word>[^\s()"]+)'
+)
+
+# Operators are only recognized in upper case; "and" / "or" are plain words
+_OPERATORS = {"AND", "OR", "NOT"}
+
+# Deepest nesting of groups and negations a query may have; the parser and
+# the index evaluate query trees recursively
+MAX_QUERY_DEPTH = 32
+
+
+class Phrase:
+    """Notes containing words consecutively in their title or content (one word: anywhere)."""
+
+    def __init__(self, words: list[str]):
+        self.words = words
+
+    def __repr__(self) -> str:
+        return f"Phrase({self.words!r})"
+
+
+class And:
+    """Notes matching every one of parts."""
+
+    def __init__(self, parts: list):
+        self.parts = parts
+
+    def __repr__(self) -> str:
+        return f"And({self.parts!r})"
+
+
+class Or:
+    """Notes matching any of parts."""
+
+    def __init__(self, parts: list):
+        self.parts = parts
+
+    def __repr__(self) -> str:
+        return f"Or({self.parts!r})"
+
+
+class Not:
+    """Notes not matching part."""
+
+    def __init__(self, part):
+        self.part = part
+
+    def __repr__(self) -> str:
+        return f"Not({self.part!r})"
+
+
+def parse_query(text: str):
+    """
+    Parses a boolean search query into a tree of Phrase, And, Or and Not
+    nodes, or returns None if it has no words.
+
+    Syntax: words next to each other must all match (AND is implied); OR
+    binds looser than AND; NOT or a leading "-" negates the following word,
+    phrase or group; "double quotes" match a phrase and (parentheses) group.
+    A bare word the tokenizer splits ("design-review", "v1.2") is matched as
+    a phrase. Parsing is lenient: unbalanced quotes and parentheses and
+    dangling operators are ignored rather than rejected.
+
+    Example: 'design review -draft OR "release notes"' is
+    Or([And([design, review, Not(draft)]), Phrase([release, notes])]).
+
+    Raises:
+        ValueError: If groups and negations nest deeper than MAX_QUERY_DEPTH.
+    """
+    tokens = []
+    for match in _QUERY_TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "word" and match.group() in _OPERATORS:
+            tokens.append((match.group(), None))
+        elif kind in ("word", "phrase"):
+            words = list(tokenize(match.group(kind)))
+            if words:
+                tokens.append(("words", Phrase(words)))
+        else:
+            tokens.append((kind, None))
+    parser = _Parser(tokens)
+    parts = [parser.parse_or()]
+    # Stray ")" end a group early; whatever follows them is parsed as well
+    while parser.pos < len(tokens):
+        parser.pos += 1
+        parts.append(parser.parse_or())
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else And(parts)
+
+
+class _Parser:
+    """Recursive descent over the (kind, node) tokens of parse_query."""
+
+    def __init__(self, tokens: list[tuple]):
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = 0
+
+    def _peek(self) -> str | None:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def parse_or(self):
+        parts = []
+        while True:
+            part = self.parse_and()
+            if part is not None:
+                parts.append(part)
+            if self._peek() != "OR":
+                break
+            self.pos += 1
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else Or(parts)
+
+    def parse_and(self):
+        parts = []
+        while self._peek() not in (None, "OR", "close"):
+            if self._peek() == "AND":
+                self.pos += 1
+                continue
+            part = self.parse_unary()
+            if part is not None:
+                parts.append(part)
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else And(parts)
+
+    def parse_unary(self):
+        kind, node = self.tokens[self.pos]
+        self.pos += 1
+        if kind not in ("NOT", "minus", "open"):
+            return node
+        self.depth += 1
+        if self.depth > MAX_QUERY_DEPTH:
+            raise ValueError(f"Query nests groups and negations deeper than {MAX_QUERY_DEPTH} levels")
+        try:
+            if kind == "open":
+                group = self.parse_or()
+                if self._peek() == "close":
+                    self.pos += 1
+                return group
+            if self._peek() in (None, "OR", "close"):
+                return None
+            part = self.parse_unary()
+            return None if part is None else Not(part)
+        finally:
+            self.depth -= 1
@@ -1,6 +1,6 @@
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query
 
 from koi_net.protocol.api_models import (
     PollEvents,
@@ -21,10 +21,13 @@ from koi_net.protocol.consts import (
 )
 from koi_net.processor.knowledge_object import KnowledgeSource
 
+from .config import SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
 from .core import node  # Import the initialized node instance
 
-# Import the query helper from handlers
-from .handlers import query_note_index
+# Import the query helpers from handlers
+from .handlers import note_store, query_note_index, search_index
+from .index import SEARCH_ORDERS
+from .suggest import MAX_SUGGESTIONS
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +51,11 @@ async def lifespan(app: FastAPI):
         logger.info("Processor B KOI-net node stopped successfully.")
     except Exception as e:
         logger.error(f"Error stopping KOI-net node: {e}", exc_info=True)
+    try:
+        note_store.close(search_index)
+        logger.info("Processor B search index checkpointed.")
+    except Exception as e:
+        logger.error(f"Error checkpointing search index: {e}", exc_info=True)
     logger.info("Processor B shutdown complete.")
 
 
@@ -135,28 +143,80 @@ async def health():
 app.include_router(koi_net_router)
 
 # --- Custom Search API Router ---
+# /search and /suggest are plain (sync) functions: FastAPI runs them in its
+# threadpool, so evaluating a broad query or prefix does not stall the event
+# loop serving KOI-net events and /health
 search_router = APIRouter()
 
 
 @search_router.get("/search")
-async def search_notes_endpoint(q: str):
-    """Endpoint to search the indexed note data."""
+def search_notes_endpoint(
+    q: str,
+    order: str = "title",
+    limit: int | None = None,
+    cursor: str | None = None,
+):
+    """
+    Endpoint to search the indexed note data.
+
+    Results come one page of limit at a time, ordered by title (A-Z),
+    lastChangedAt (newest first) or relevance; pass next_cursor back as
+    cursor (with the same q and order) for the next page.
+    """
     if not q:
         raise HTTPException(status_code=400, detail="Query parameter 'q' is required.")
+    if limit is None:
+        limit = SEARCH_DEFAULT_LIMIT
+    elif not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query parameter 'limit' must be between 1 and {SEARCH_MAX_LIMIT}.",
+        )
+    if order not in SEARCH_ORDERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query parameter 'order' must be one of {', '.join(SEARCH_ORDERS)}.",
+        )
 
-    logger.info(f"Search request received: q='{q}'")
+    logger.info(f"Search request received: q='{q}', order={order}, limit={limit}")
     try:
         # Use the helper function from handlers
-        results = query_note_index(q)
-        logger.info(f"Search for '{q}' yielded {len(results)} results.")
-        return {"query": q, "results": results}
+        results, next_cursor = query_note_index(q, order, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error during search for query '{q}': {e}", exc_info=True)
         raise HTTPException(
             status_code=500, detail="Internal server error during search."
         )
+    logger.info(f"Search for '{q}' returned {len(results)} results.")
+    return {"query": q, "results": results, "next_cursor": next_cursor}
+
+
+@search_router.get("/suggest")
+def suggest_endpoint(
+    prefix: str, limit: int = Query(10, ge=1, le=MAX_SUGGESTIONS)
+):
+    """Type-ahead: title words and tags starting with prefix, most common first."""
+    suggestions = search_index.suggest(prefix, limit)
+    return {
+        "prefix": prefix,
+        "suggestions": [{"term": term, "count": count} for term, count in suggestions],
+    }
 
 
 app.include_router(search_router)
 
+# --- Admin Router ---
+admin_router = APIRouter(prefix="/admin")
+
+
+@admin_router.get("/index")
+def index_stats_endpoint():
+    """Reports index size, stored note and checkpoint position, and skipped manifests."""
+    return note_store.stats(search_index)
+
+
+app.include_router(admin_router)
+
 logger.info("Processor B FastAPI application configured with KOI and Search routers.")
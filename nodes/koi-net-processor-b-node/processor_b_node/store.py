@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from rid_lib import RID
+from rid_lib.ext import Cache
+from rid_types.hackmd import HackMDNote
+
+from .index import NoteIndex
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the pickled index layout changes; older checkpoints are then
+# ignored and every note is re-indexed from the RID cache instead
+CHECKPOINT_VERSION = 1
+
+
+class NoteStore:
+    """
+    Durable note metadata and manifest hashes, plus checkpoints of the
+    processor's NoteIndex.
+
+    Each indexed note's manifest hash, title, tags and lastChangedAt are
+    written to a SQLite table (WAL mode), a few hundred bytes per note: note
+    content is not stored again, the node's RID cache already holds every
+    bundle. The in-memory index is periodically checkpointed (pickled, then
+    atomically renamed) with the table sequence number it covers. On startup
+    the checkpoint is loaded and only notes written after it are re-indexed,
+    from their cached bundles; the rest is not tokenized again.
+
+    indexed_hashes and metadata (RID -> {"title", "tags", "lastChangedAt"})
+    are loaded into memory for the handlers.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        checkpoint_every: int = 1000,
+        checkpoint_seconds: float = 300.0,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.directory / "notes.db"
+        self.checkpoint_path = self.directory / "checkpoint.pkl"
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+
+        # Serializes index mutation + table writes + checkpointing
+        self.lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                rid TEXT NOT NULL UNIQUE,
+                manifest_hash TEXT,
+                title TEXT NOT NULL,
+                tags TEXT NOT NULL,
+                last_changed TEXT
+            )
+            """
+        )
+        self._conn.commit()
+
+        self.indexed_hashes: dict[str, str | None] = {}
+        self.metadata: dict[str, dict] = {}
+        self._checkpoint_seq = 0
+        self._checkpoint_time = 0.0
+        self._last_seq = 0
+        self._since_checkpoint = 0
+        # Note manifests dropped by skip_unchanged (bundle fetches avoided)
+        self.skipped_fetches = 0
+
+    def load(self, cache_dir: str) -> NoteIndex:
+        """
+        Loads the last checkpoint and the stored note metadata, re-indexing
+        the notes stored after the checkpoint from the RID cache in
+        cache_dir.
+        """
+        started = time.perf_counter()
+        index = None
+        if self.checkpoint_path.is_file():
+            try:
+                with open(self.checkpoint_path, "rb") as f:
+                    state = pickle.load(f)
+                if state.get("version") != CHECKPOINT_VERSION:
+                    logger.warning(
+                        f"Ignoring note index checkpoint with version {state.get('version')} (expected {CHECKPOINT_VERSION})."
+                    )
+                else:
+                    index = state["index"]
+                    self._checkpoint_seq = state["seq"]
+                    self._checkpoint_time = state["time"]
+            except Exception as e:
+                logger.error(f"Failed to load note index checkpoint {self.checkpoint_path}: {e}")
+        if index is None:
+            index = NoteIndex()
+            self._checkpoint_seq = 0
+            self._checkpoint_time = time.time()
+
+        stale = []
+        rows = self._conn.execute(
+            "SELECT seq, rid, manifest_hash, title, tags, last_changed FROM notes ORDER BY seq"
+        )
+        for seq, rid, manifest_hash, title, tags, last_changed in rows:
+            self.indexed_hashes[rid] = manifest_hash
+            self.metadata[rid] = {
+                "title": title,
+                "tags": json.loads(tags),
+                "lastChangedAt": json.loads(last_changed) if last_changed else None,
+            }
+            if seq > self._checkpoint_seq:
+                stale.append(rid)
+        self._last_seq = self._conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM notes"
+        ).fetchone()[0]
+
+        # Notes stored after the checkpoint are re-indexed from their cached
+        # bundle, if it is the version that was stored; otherwise their hash
+        # is forgotten, so the next announcement of the note fetches it again
+        cache = Cache(cache_dir)
+        replayed = 0
+        for rid in stale:
+            try:
+                bundle = cache.read(RID.from_string(rid))
+            except Exception as e:
+                logger.warning(f"Could not read cached bundle of {rid}: {e}")
+                bundle = None
+            if (
+                bundle is None
+                or not isinstance(bundle.rid, HackMDNote)
+                or bundle.manifest.sha256_hash != self.indexed_hashes[rid]
+            ):
+                self.indexed_hashes[rid] = None
+                continue
+            contents = bundle.contents
+            meta = self.metadata[rid]
+            index.add(
+                rid,
+                bundle.rid.note_id,
+                meta["title"],
+                meta["tags"],
+                contents.get("content") or "",
+                meta["lastChangedAt"],
+            )
+            replayed += 1
+        self._since_checkpoint = len(stale)
+
+        logger.info(
+            f"Loaded note index from {self.directory}: {len(index)} notes "
+            f"(checkpoint seq {self._checkpoint_seq}, re-indexed {replayed} of {len(stale)} "
+            f"notes stored after it) in {time.perf_counter() - started:.2f}s"
+        )
+        return index
+
+    def skip_unchanged(self, rid: str, manifest_hash: str | None) -> bool:
+        """
+        True if rid is already indexed from a bundle with this manifest hash,
+        so fetching the bundle again can be skipped; such skips are counted
+        in skipped_fetches.
+        """
+        with self.lock:
+            if not manifest_hash or self.indexed_hashes.get(rid) != manifest_hash:
+                return False
+            self.skipped_fetches += 1
+            return True
+
+    def record(
+        self,
+        index: NoteIndex,
+        rid: str,
+        note_id: str,
+        manifest_hash: str | None,
+        title: str,
+        tags: list[str],
+        content: str,
+        last_changed=None,
+    ) -> int:
+        """
+        Indexes a note and stores its manifest hash and metadata. Returns
+        the number of words tokenized (see NoteIndex.add).
+        """
+        with self.lock:
+            words = index.add(rid, note_id, title, tags, content, last_changed)
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO notes (rid, manifest_hash, title, tags, last_changed) VALUES (?, ?, ?, ?, ?)",
+                (rid, manifest_hash, title, json.dumps(tags), json.dumps(last_changed)),
+            )
+            self._conn.commit()
+            self._last_seq = cursor.lastrowid
+            self.indexed_hashes[rid] = manifest_hash
+            self.metadata[rid] = {"title": title, "tags": tags, "lastChangedAt": last_changed}
+            self._since_checkpoint += 1
+
+            if self._since_checkpoint >= self.checkpoint_every or (
+                time.time() - self._checkpoint_time >= self.checkpoint_seconds
+            ):
+                self.checkpoint(index)
+            return words
+
+    def stats(self, index: NoteIndex) -> dict:
+        """Size of the index and note table, checkpoint position and skipped fetches."""
+        with self.lock:
+            return {
+                "notes": len(index),
+                "terms": index.term_count,
+                "store_seq": self._last_seq,
+                "checkpoint_seq": self._checkpoint_seq,
+                "skipped_fetches": self.skipped_fetches,
+            }
+
+    def checkpoint(self, index: NoteIndex) -> None:
+        """Atomically writes the in-memory index to disk."""
+        with self.lock:
+            if self._since_checkpoint == 0 and self.checkpoint_path.is_file():
+                return
+            started = time.perf_counter()
+            now = time.time()
+            tmp_path = self.checkpoint_path.with_suffix(".tmp")
+            state = {
+                "version": CHECKPOINT_VERSION,
+                "seq": self._last_seq,
+                "time": now,
+                "index": index,
+            }
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_path)
+            self._checkpoint_seq = self._last_seq
+            self._checkpoint_time = now
+            self._since_checkpoint = 0
+            logger.info(
+                f"Checkpointed note index ({len(index)} notes, seq {self._last_seq}) "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+
+    def close(self, index: NoteIndex) -> None:
+        """Writes a final checkpoint and closes the note table."""
+        with self.lock:
+            self.checkpoint(index)
+            self._conn.close()
@@ -0,0 +1,106 @@
+import bisect
+import heapq
+
+# Most suggestions returned for one prefix
+MAX_SUGGESTIONS = 50
+
+# Prefixes matching more terms than this are cached, with their best
+# CACHE_DEPTH terms: the slack beyond MAX_SUGGESTIONS absorbs terms that drop
+# out of a cached list before it has to be recomputed
+CACHE_DEPTH = 2 * MAX_SUGGESTIONS
+
+
+class PrefixSuggester:
+    """
+    Type-ahead over note title words and tags, ranked by document frequency.
+
+    Terms are kept in one sorted list, so the terms starting with a prefix
+    are a contiguous range found by bisection; the best terms of a range are
+    picked with a heap. Results of broad prefixes (short ones,
+    mostly) are cached and kept up to date in place as document frequencies
+    change, so the prefixes that would be slow to scan cost a dict hit
+    after their first lookup, even while notes are being indexed.
+
+    Not thread-safe on its own: NoteIndex calls it under its lock. The
+    cache is not pickled; it refills on lookups.
+    """
+
+    def __init__(self):
+        self._terms: list[str] = []
+        self._df: dict[str, int] = {}
+        self._cache: dict[str, list[tuple[str, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        return state
+
+    def add(self, terms: list[str]) -> None:
+        """Counts one more document for each of terms (distinct)."""
+        for term in terms:
+            df = self._df.get(term, 0)
+            if not df:
+                bisect.insort(self._terms, term)
+            self._df[term] = df + 1
+            self._update_cache(term, df + 1)
+
+    def remove(self, terms: list[str]) -> None:
+        """Counts one document less for each of terms (as passed to add())."""
+        for term in terms:
+            df = self._df[term] - 1
+            if df:
+                self._df[term] = df
+            else:
+                del self._df[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+            self._update_cache(term, df)
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[tuple[str, int]]:
+        """
+        The (term, document frequency) pairs of the terms starting with
+        prefix, most frequent first (ties alphabetically), at most
+        min(limit, MAX_SUGGESTIONS) of them.
+        """
+        cached = self._cache.get(prefix)
+        if cached is None:
+            start = bisect.bisect_left(self._terms, prefix)
+            # Every term starting with prefix sorts below prefix + U+10FFFF
+            end = bisect.bisect_left(self._terms, prefix + "\U0010ffff", start)
+            df = self._df
+            best = heapq.nsmallest(
+                CACHE_DEPTH, ((-df[term], term) for term in self._terms[start:end])
+            )
+            cached = [(term, -negative_df) for negative_df, term in best]
+            if end - start > CACHE_DEPTH:
+                self._cache[prefix] = cached
+        return cached[: min(limit, MAX_SUGGESTIONS)]
+
+    def _update_cache(self, term: str, df: int) -> None:
+        """
+        Re-ranks term, now in df documents (0: gone), in the cached results
+        of its prefixes. A cached list always holds exactly the best
+        len(list) terms of its prefix, so a term may only be (re-)inserted
+        above its last entry; one that falls below it is dropped, and a list
+        shorter than MAX_SUGGESTIONS is recomputed on its next lookup.
+        """
+        if not self._cache:
+            return
+        key = (-df, term)
+        for length in range(len(term) + 1):
+            prefix = term[:length]
+            cached = self._cache.get(prefix)
+            if cached is None:
+                continue
+            ranked = [(-count, other) for other, count in cached if other != term]
+            if df and ranked and key < ranked[-1]:
+                bisect.insort(ranked, key)
+                del ranked[CACHE_DEPTH:]
+            elif len(ranked) == len(cached):
+                continue  # neither listed nor good enough to be
+            if len(ranked) < MAX_SUGGESTIONS:
+                del self._cache[prefix]
+            else:
+                self._cache[prefix] = [(other, -negative_df) for negative_df, other in ranked]
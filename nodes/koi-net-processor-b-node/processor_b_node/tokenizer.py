@@ -0,0 +1,64 @@
+import re
+from collections.abc import Iterator
+
+# --- Precompiled patterns ---
+
+# Words: runs of letters/digits, keeping apostrophes inside ("don't")
+_WORD_RE = re.compile(r"[^\W_]+(?:['’][^\W_]+)*")
+
+# YAML front matter at the very start of a note ("---\ntitle: ...\n---")
+_FRONT_MATTER_RE = re.compile(
+    r"---[ \t]*\r?\n.*?\r?\n(?:---|\.\.\.)[ \t]*(?:\r?\n|\Z)", re.S
+)
+
+# Markdown constructs handled while scanning note content, tried at each
+# position in this order; "word" matches the plain text in between
+_MARKDOWN_RE = re.compile(
+    r"""
+    (?P<fence>^[ ]{0,3}(?P<fchar>`{3,}|~{3,})[^\n]*\n      # code fence...
+        (?:.*?^[ ]{0,3}(?P=fchar)[`~]*[ \t]*$|.*))         # ...to its closing fence or the end
+    |(?P<link>!?\[(?P<text>[^\]\n]*)\]\([^)\n]*\))          # [text](url) / ![alt](src)
+    |(?P<ref>^[ ]{0,3}\[[^\]\n]+\]:[^\n]*$)                 # [label]: url definitions
+    |(?P<url><?[A-Za-z][A-Za-z0-9+.-]*://[^\s>)]*>?)        # autolinks and bare URLs
+    |(?P<html><!--.*?-->|</?[A-Za-z][^>\n]*>)               # HTML comments and tags
+    |(?P<word>[^\W_]+(?:['’][^\W_]+)*)
+    """,
+    re.M | re.S | re.X,
+)
+
+# Longer "words" are base64 blobs, hashes and the like
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """Yields the lowercased words of plain text (titles, queries), in order."""
+    for match in _WORD_RE.finditer(text):
+        word = match.group()
+        if len(word) <= MAX_TERM_LENGTH:
+            yield word.lower()
+
+
+def markdown_terms(content: str) -> Iterator[str]:
+    """
+    Yields the lowercased words of a markdown note body, in order.
+
+    Front matter, fenced code blocks, link and image targets, reference
+    definitions, bare URLs and HTML are skipped; link text and image alt
+    text are kept. Emphasis, headings, list and table markup are not words
+    and drop out on their own. The content is scanned in place with one
+    regex, so no stripped copy of a (possibly multi-hundred-KB) note is
+    built.
+    """
+    front_matter = _FRONT_MATTER_RE.match(content)
+    start = front_matter.end() if front_matter else 0
+    for match in _MARKDOWN_RE.finditer(content, start):
+        kind = match.lastgroup
+        if kind == "word":
+            word = match.group()
+            if len(word) <= MAX_TERM_LENGTH:
+                yield word.lower()
+        elif kind == "link":
+            for word_match in _WORD_RE.finditer(content, match.start("text"), match.end("text")):
+                word = word_match.group()
+                if len(word) <= MAX_TERM_LENGTH:
+                    yield word.lower()
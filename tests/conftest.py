@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The node packages are normally installed editable (make install); put them
+# on the path as well so pytest runs from a plain checkout
+for node_dir in ("koi-net-processor-a-node", "koi-net-processor-b-node"):
+    path = str(ROOT / "nodes" / node_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """Runs each test in its own directory, so relative data paths stay out of the checkout."""
+    monkeypatch.chdir(tmp_path)
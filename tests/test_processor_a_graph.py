@@ -0,0 +1,65 @@
+import pytest
+
+from processor_a_node.graph import CommitGraph
+
+
+def sha(n: int) -> str:
+    return f"{n:040x}"
+
+
+@pytest.fixture
+def graph():
+    #   1 - 2 - 3 ------- 6 (merge of 3 and 5)
+    #        \           /
+    #         4 ------- 5
+    graph = CommitGraph()
+    graph.add(sha(1), [])
+    graph.add(sha(2), [sha(1)])
+    graph.add(sha(3), [sha(2)])
+    graph.add(sha(4), [sha(2)])
+    graph.add(sha(5), [sha(4)])
+    graph.add(sha(6), [sha(3), sha(5)])
+    return graph
+
+
+def test_is_ancestor(graph):
+    assert graph.is_ancestor(sha(1), sha(6))
+    assert graph.is_ancestor(sha(4), sha(6))
+    assert graph.is_ancestor(sha(3), sha(3))
+    assert not graph.is_ancestor(sha(3), sha(5))
+    assert not graph.is_ancestor(sha(6), sha(1))
+
+
+def test_unknown_commit(graph):
+    with pytest.raises(KeyError):
+        graph.is_ancestor(sha(99), sha(1))
+
+
+def test_commits_between(graph):
+    commits, truncated = graph.commits_between(sha(3), sha(6), 10)
+    assert sorted(commits) == [sha(4), sha(5), sha(6)]
+    assert commits[0] == sha(6)
+    assert not truncated
+    commits, truncated = graph.commits_between(sha(3), sha(6), 2)
+    assert len(commits) == 2 and truncated
+    assert graph.commits_between(sha(6), sha(3), 10) == ([], False)
+
+
+def test_merge_bases(graph):
+    assert graph.merge_bases(sha(3), sha(5)) == [sha(2)]
+    assert graph.merge_bases(sha(6), sha(5)) == [sha(5)]
+
+
+def test_unrelated_histories(graph):
+    graph.add(sha(100), [])
+    assert graph.merge_bases(sha(100), sha(6)) == []
+
+
+def test_octopus_merge_with_many_parents():
+    graph = CommitGraph()
+    parents = [sha(i) for i in range(1, 301)]
+    for parent in parents:
+        graph.add(parent, [])
+    graph.add(sha(1000), parents)
+    assert graph.is_ancestor(sha(300), sha(1000))
+    assert len(graph.commits_between(sha(1), sha(1000), 1000)[0]) == 300
@@ -0,0 +1,25 @@
+import pytest
+
+from processor_a_node import index as index_module
+from processor_a_node.shards import ShardedCommitIndex
+
+
+def sha(n: int) -> str:
+    return f"{n:040x}"
+
+
+def test_regex_literals():
+    assert index_module.regex_literals(r"watch(er)? race\d+") == ["watch", " race"]
+    assert index_module.regex_literals(r"(fix|add) watcher") == [" watcher"]
+
+
+@pytest.mark.parametrize("parser", [True, False])
+def test_regex_search(monkeypatch, parser):
+    if not parser:
+        monkeypatch.setattr(index_module, "sre_parse", None)
+    index = ShardedCommitIndex()
+    index.add("o/r", sha(1), "Fix watcher race 12")
+    index.add("o/r", sha(2), "Fix watcher")
+    index.add("o/r", sha(3), "add WATCHER race 7")
+    snapshot = index.snapshot()
+    assert sorted(snapshot.regex_search(r"watcher race \d+")) == [("o/r", sha(1)), ("o/r", sha(3))]
@@ -0,0 +1,34 @@
+import pytest
+
+from processor_a_node.index import decode_cursor, encode_cursor
+from processor_a_node.shards import ShardedCommitIndex
+
+
+def sha(n: int) -> str:
+    return f"{n:040x}"
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1.25, 7, "o/r")) == (1.25, 7, "o/r")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_rank_pages_match_full_ranking():
+    index = ShardedCommitIndex()
+    for n in range(60):
+        repo = f"o/r{n % 3}"
+        index.add(repo, sha(n + 1), "fix watcher " + "race " * (n % 4) + f"in module {n}")
+    terms = index.tokenizer.tokenize("watcher race")
+    snapshot = index.snapshot()
+    full, cursor = snapshot.rank(terms, 100)
+    assert cursor is None and len(full) == 60
+    paged, cursor = [], None
+    while True:
+        page, cursor = snapshot.rank(terms, 7, cursor=cursor)
+        paged += page
+        if cursor is None:
+            break
+    assert [(repo, commit) for repo, commit, _ in paged] == [
+        (repo, commit) for repo, commit, _ in full
+    ]
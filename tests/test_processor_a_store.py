@@ -0,0 +1,78 @@
+from rid_lib import RID
+from rid_lib.ext import Bundle, Cache
+
+from processor_a_node.shards import ShardedCommitIndex
+from processor_a_node.store import IndexStore
+
+
+def sha(n: int) -> str:
+    return f"{n:040x}"
+
+
+def cache_commit(cache: Cache, repo: str, n: int, message: str) -> Bundle:
+    bundle = Bundle.generate(
+        rid=RID.from_string(f"orn:github.commit:{repo}/{sha(n)}"),
+        contents={"sha": sha(n), "message": message},
+    )
+    cache.write(bundle)
+    return bundle
+
+
+def test_copy_only_holds_the_snapshot():
+    index = ShardedCommitIndex()
+    index.add("o/r", sha(1), "fix watcher race")
+    index.add("o/r", sha(2), "add watcher")
+    snapshot = index.snapshot()
+    index.add("o/r", sha(1), "fix watcher race again")
+    index.add("o/r", sha(3), "watcher docs")
+    index.remove("o/r", sha(2))
+
+    copy = index.copy(snapshot).snapshot()
+    assert len(copy) == 2
+    assert copy.get_message("o/r", sha(1)) == "fix watcher race"
+    assert copy.get_message("o/r", sha(2)) == "add watcher"
+    assert copy.get_message("o/r", sha(3)) is None
+
+
+def test_checkpoint_and_replay(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = Cache(cache_dir)
+    store = IndexStore(str(tmp_path / "index"), checkpoint_every=4, checkpoint_seconds=1e9)
+    index = store.load(cache_dir)
+
+    bundle = cache_commit(cache, "o/r", 0, "initial commit")
+    store.record(index, str(bundle.rid), sha(0), "initial commit", bundle.manifest.sha256_hash, {"parents": []})
+    # A fresh store does not checkpoint on its first commit
+    assert not store.checkpoint_path.is_file()
+
+    bundles = [bundle]
+    for n in range(1, 7):
+        message = f"fix watcher race {n}"
+        bundle = cache_commit(cache, "o/r", n, message)
+        store.record(
+            index, str(bundle.rid), sha(n), message, bundle.manifest.sha256_hash, {"parents": [sha(n - 1)]}
+        )
+        bundles.append(bundle)
+    store.wait_for_checkpoint()
+    assert store.checkpoint_path.is_file()
+    # Commits 4-6 are only in the commit log; the cache holds another
+    # version of commit 6
+    cache_commit(cache, "o/r", 6, "rewritten")
+
+    # Reopen without close(), as after a crash
+    reopened = IndexStore(str(tmp_path / "index"))
+    restored = reopened.load(cache_dir)
+    snapshot = restored.snapshot()
+    assert snapshot.get_message("o/r", sha(5)) == "fix watcher race 5"
+    assert snapshot.get_message("o/r", sha(1)) == "fix watcher race 1"
+    assert snapshot.get_message("o/r", sha(6)) is None
+    assert reopened.skip_unchanged(str(bundles[5].rid), bundles[5].manifest.sha256_hash)
+    assert not reopened.skip_unchanged(str(bundles[6].rid), bundles[6].manifest.sha256_hash)
+    reopened.close(restored)
+
+    # A clean shutdown leaves nothing to replay
+    final = IndexStore(str(tmp_path / "index"))
+    index = final.load(cache_dir)
+    assert len(index) == 6
+    assert final.stats(index)["log_seq"] == final.stats(index)["checkpoint_seq"]
+    final.close(index)
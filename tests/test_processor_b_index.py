@@ -0,0 +1,81 @@
+import pytest
+
+from processor_b_node.index import SEARCH_ORDERS, NoteIndex, encode_cursor
+
+
+@pytest.fixture
+def index():
+    index = NoteIndex()
+    index.add("r1", "n1", "Design review", ["Team"], "We discussed the release notes in detail.", 1000)
+    index.add("r2", "n2", "Release plan", ["team", "draft"], "Notes about the release of version two.", 3000)
+    index.add("r3", "n3", "Notes", [], "Design notes, reviewed later.", 2000)
+    return index
+
+
+def rids(index, query, order="title"):
+    return index.search(query, order, limit=100)[0]
+
+
+def test_key_lookup(index):
+    assert index.lookup("n2") == ["r2"]
+    assert sorted(index.lookup("team")) == ["r1", "r2"]
+    assert rids(index, "draft") == ["r2"]
+
+
+def test_phrase_requires_adjacent_words(index):
+    assert rids(index, '"release notes"') == ["r1"]
+    assert sorted(rids(index, "release notes")) == ["r1", "r2"]
+
+
+def test_phrase_does_not_span_title_and_content(index):
+    # r1: title ends in "review", content starts with "we"
+    assert rids(index, '"review we"') == []
+
+
+def test_suggest(index):
+    assert index.suggest("te") == [("team", 2)]
+    index.remove("r2")
+    assert index.suggest("te") == [("team", 1)]
+
+
+@pytest.mark.parametrize("order", SEARCH_ORDERS)
+def test_cursor_pages_match_full_ordering(order):
+    index = NoteIndex()
+    for i in range(57):
+        index.add(f"r{i}", f"n{i}", f"Note {i % 7} {i}", [], "shared " * (1 + i % 5), i * 10)
+    full = index.search("shared", order, limit=100)[0]
+    paged, cursor = [], None
+    while True:
+        page, cursor = index.search("shared", order, limit=8, cursor=cursor)
+        paged += page
+        if cursor is None:
+            break
+    assert len(full) == 57
+    assert paged == full
+
+
+def test_orders(index):
+    assert rids(index, "notes", "title") == ["r1", "r3", "r2"]
+    assert rids(index, "notes", "lastChangedAt") == ["r2", "r3", "r1"]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        encode_cursor("lastChangedAt", -1.0, 0),
+        encode_cursor("title", 5, 0),
+        encode_cursor("title", None, 0),
+    ],
+)
+def test_bad_cursor(index, cursor):
+    with pytest.raises(ValueError):
+        index.search("notes", "title", limit=1, cursor=cursor)
+
+
+def test_metadata_only_update_skips_tokenization(index):
+    assert index.add("r3", "n3", "Notes", ["new"], "Design notes, reviewed later.", 5000) == 0
+    assert index.lookup("new") == ["r3"]
+    assert rids(index, "notes", "lastChangedAt")[0] == "r3"
+    assert index.add("r3", "n3", "Notes", ["new"], "Changed content", 5000) > 0
+    assert rids(index, "reviewed") == []
@@ -0,0 +1,76 @@
+import pytest
+
+from processor_b_node.index import NoteIndex
+from processor_b_node.query import MAX_QUERY_DEPTH, And, Not, Or, Phrase, parse_query
+
+
+def test_words_are_anded_and_or_binds_looser():
+    node = parse_query('design review -draft OR "release notes"')
+    assert isinstance(node, Or)
+    first, second = node.parts
+    assert isinstance(first, And)
+    assert [part.words for part in first.parts[:2]] == [["design"], ["review"]]
+    assert isinstance(first.parts[2], Not)
+    assert first.parts[2].part.words == ["draft"]
+    assert isinstance(second, Phrase)
+    assert second.words == ["release", "notes"]
+
+
+def test_lowercase_operators_are_words():
+    node = parse_query("cats and dogs")
+    assert isinstance(node, And)
+    assert [part.words for part in node.parts] == [["cats"], ["and"], ["dogs"]]
+
+
+def test_split_word_becomes_phrase():
+    node = parse_query("design-review")
+    assert isinstance(node, Phrase)
+    assert node.words == ["design", "review"]
+
+
+def test_groups_and_not():
+    node = parse_query("NOT (alpha OR beta) gamma")
+    assert isinstance(node, And)
+    negated, word = node.parts
+    assert isinstance(negated, Not)
+    assert isinstance(negated.part, Or)
+    assert word.words == ["gamma"]
+
+
+@pytest.mark.parametrize("query", ['"unclosed phrase', "(alpha beta", "alpha )) beta", "alpha OR", "NOT"])
+def test_lenient_parsing(query):
+    # Unbalanced quotes/parentheses and dangling operators never raise
+    parse_query(query)
+
+
+def test_stray_close_parens_stay_flat():
+    node = parse_query("a ) b ) c")
+    assert isinstance(node, And)
+    assert [part.words for part in node.parts] == [["a"], ["b"], ["c"]]
+
+
+def test_no_words():
+    assert parse_query("") is None
+    assert parse_query("-- ()") is None
+
+
+def test_nesting_depth_is_capped():
+    parse_query("(" * MAX_QUERY_DEPTH + "alpha")
+    with pytest.raises(ValueError):
+        parse_query("(" * 2000 + "alpha")
+    with pytest.raises(ValueError):
+        parse_query("NOT " * 2000 + "alpha")
+
+
+def test_search_not_and_or():
+    index = NoteIndex()
+    index.add("r1", "n1", "Design review", [], "We discussed the release notes in detail.", 1000)
+    index.add("r2", "n2", "Release plan", [], "Notes about the release of version two.", 3000)
+    index.add("r3", "n3", "Notes", [], "Design notes, reviewed later.", 2000)
+
+    def rids(query):
+        return sorted(index.search(query, "title", limit=100)[0])
+
+    assert rids("notes -release") == ["r3"]
+    assert rids("plan OR reviewed") == ["r2", "r3"]
+    assert rids("NOT notes") == []
@@ -0,0 +1,32 @@
+from rid_lib import RID
+from rid_lib.ext import Bundle, Cache
+
+from processor_b_node.store import NoteStore
+
+
+def test_checkpoint_and_replay(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = Cache(cache_dir)
+    store = NoteStore(str(tmp_path / "index"), checkpoint_every=3, checkpoint_seconds=1e9)
+    index = store.load(cache_dir)
+    bundles = []
+    for i in range(5):
+        contents = {"title": f"Note {i}", "tags": ["t"], "content": f"body word{i}", "lastChangedAt": i}
+        bundle = Bundle.generate(RID.from_string(f"orn:hackmd.note:n{i}"), contents)
+        cache.write(bundle)
+        bundles.append(bundle)
+        store.record(index, str(bundle.rid), f"n{i}", bundle.manifest.sha256_hash, f"Note {i}", ["t"], contents["content"], i)
+    # Notes 3 and 4 were stored after the checkpoint; the cache holds
+    # another version of note 4
+    changed = Bundle.generate(RID.from_string("orn:hackmd.note:n4"), {"title": "Note 4", "content": "other"})
+    cache.write(changed)
+
+    # Reopen without close(), as after a crash
+    reopened = NoteStore(str(tmp_path / "index"))
+    restored = reopened.load(cache_dir)
+    assert restored.search("word3")[0] == [str(bundles[3].rid)]
+    assert restored.search("word4")[0] == []
+    assert reopened.skip_unchanged(str(bundles[0].rid), bundles[0].manifest.sha256_hash)
+    assert not reopened.skip_unchanged(str(bundles[4].rid), bundles[4].manifest.sha256_hash)
+    assert reopened.metadata[str(bundles[1].rid)]["title"] == "Note 1"
+    reopened.close(restored)